@@ -0,0 +1,85 @@
+"""
+Synthetic fixtures for the benchmarks: MRC tomograms, `.mod` and `.ndjson`
+annotations, and directory trees laid out like the supercomputer archive.
+"""
+
+import json
+import os
+
+import mrcfile
+import numpy as np
+import pandas as pd
+import imodmodel
+
+from typing import List, Tuple
+
+def write_mrc(path: str, shape: Tuple[int, int, int], *, voxel_size: float = 10.0, seed: int = 0) -> str:
+    """Write a random int16 tomogram of the given shape to `path`."""
+    gen = np.random.default_rng(seed)
+    with mrcfile.new(path, overwrite=True) as mrc:
+        mrc.set_data(gen.integers(-1000, 1000, size=shape, dtype=np.int16))
+        mrc.voxel_size = voxel_size
+    return path
+
+def random_points(shape: Tuple[int, int, int], n_points: int, *, seed: int = 0) -> np.ndarray:
+    """Random (z, y, x) points inside a tomogram of the given shape."""
+    gen = np.random.default_rng(seed)
+    return gen.uniform(0, 1, size=(n_points, 3)) * (np.array(shape) - 1)
+
+def write_mod(path: str, points: np.ndarray) -> str:
+    """Write (z, y, x) points to an IMOD `.mod` file, one contour per point."""
+    df = pd.DataFrame({
+        'object_id': np.zeros(len(points), dtype=int),
+        'contour_id': np.arange(len(points)),
+        'x': points[:, 2],
+        'y': points[:, 1],
+        'z': points[:, 0],
+    })
+    imodmodel.write(df, path)
+    return path
+
+def write_ndjson(path: str, points: np.ndarray) -> str:
+    """Write (z, y, x) points to a CryoET Data Portal style `.ndjson` file."""
+    with open(path, 'w') as file:
+        for z, y, x in points:
+            # `AnnotationFile.ndjson_points` reads locations in z, x, y order.
+            location = {"x": float(y), "y": float(x), "z": float(z)}
+            file.write(json.dumps({"type": "orientedPoint", "location": location}) + "\n")
+    return path
+
+def write_tree(
+        root: str,
+        *,
+        depth: int,
+        fanout: int,
+        runs_per_leaf: int,
+        shape: Tuple[int, int, int],
+        annotated_fraction: float = 0.5,
+        points_per_annotation: int = 3
+    ) -> List[str]:
+    """
+    Build a directory tree `depth` levels deep with `fanout` subdirectories per
+    level. Each leaf holds `runs_per_leaf` run directories named like
+    `ab1234`, each with one `.rec` tomogram and, for a fraction of them, an
+    `FM.mod` annotation.
+
+    Returns:
+        The paths of the run directories.
+    """
+    leaves = [root]
+    for level in range(depth):
+        leaves = [os.path.join(leaf, f"level{level}_{i}") for leaf in leaves for i in range(fanout)]
+
+    runs = []
+    counter = 0
+    for leaf in leaves:
+        for _ in range(runs_per_leaf):
+            run = os.path.join(leaf, f"ab{counter:04d}")
+            os.makedirs(run, exist_ok=True)
+            write_mrc(os.path.join(run, f"tomo_{counter:04d}_SIRT_1k.rec"), shape, seed=counter)
+            if counter < annotated_fraction * len(leaves) * runs_per_leaf:
+                points = random_points(shape, points_per_annotation, seed=counter)
+                write_mod(os.path.join(run, "FM.mod"), points)
+            runs.append(run)
+            counter += 1
+    return runs
@@ -0,0 +1,248 @@
+"""
+Benchmarks for the hot paths of tomogram_datasets: tomogram loading and
+preprocessing, annotation parsing, directory discovery, and subtomogram
+sampling.
+
+Each benchmark reports its wall time, throughput, and peak traced memory as
+JSON, so that runs can be saved and compared:
+
+    python benchmarks/run_benchmarks.py --output before.json
+    python benchmarks/run_benchmarks.py --output after.json
+    python benchmarks/run_benchmarks.py --compare before.json after.json
+
+`--compare` exits with a nonzero status if any benchmark slowed down by more
+than `--threshold` times.
+"""
+
+import argparse
+import json
+import os
+import platform
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Benchmark the working tree rather than an installed copy
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+
+import tomogram_datasets
+from tomogram_datasets import AnnotationFile, TomogramFile
+from tomogram_datasets.subtomogram import SubtomogramGenerator
+
+import fixtures
+
+from typing import Callable, Dict, List, Optional
+
+def measure(
+        name: str,
+        func: Callable[[], object],
+        *,
+        work: float,
+        unit: str,
+        repeats: int,
+        setup: Optional[Callable[[], None]] = None
+    ) -> Dict[str, object]:
+    """
+    Time `func` over `repeats` runs and measure its peak traced memory on one
+    extra run. `work` is the amount of work done per call, in `unit`s, and is
+    used to compute throughput from the fastest run.
+    """
+    times = []
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        begin = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - begin)
+
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    best = min(times)
+    return {
+        'name': name,
+        'repeats': repeats,
+        'min_s': best,
+        'mean_s': float(np.mean(times)),
+        'throughput': work / best if best > 0 else float('inf'),
+        'throughput_unit': unit,
+        'peak_bytes': peak,
+    }
+
+def run(args: argparse.Namespace) -> Dict[str, object]:
+    """ Build fixtures in a temporary directory and run every benchmark. """
+    shape = tuple(args.shape)
+    results: List[Dict[str, object]] = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        mrc_path = fixtures.write_mrc(os.path.join(tmp, 'tomo.mrc'), shape)
+        mrc_bytes = os.path.getsize(mrc_path)
+        mb = mrc_bytes / 2**20
+
+        points = fixtures.random_points(shape, args.points)
+        mod_path = fixtures.write_mod(os.path.join(tmp, 'points.mod'), points)
+        ndjson_path = fixtures.write_ndjson(os.path.join(tmp, 'points.ndjson'), points)
+
+        # ~~~ LOADING ~~~ #
+        results.append(measure(
+            'TomogramFile.load_header',
+            lambda: TomogramFile(mrc_path, load=False),
+            work=1, unit='files/s', repeats=args.repeats
+        ))
+
+        tomo = TomogramFile(mrc_path, load=False)
+        def reset():
+            tomo.data = None
+        results.append(measure(
+            'TomogramFile.load',
+            lambda: tomo.load(preprocess=False),
+            work=mb, unit='MB/s', repeats=args.repeats, setup=reset
+        ))
+
+        def reload():
+            tomo.data = None
+            tomo.load(preprocess=False)
+        results.append(measure(
+            'TomogramFile.process',
+            tomo.process,
+            work=mb, unit='MB/s', repeats=args.repeats, setup=reload
+        ))
+
+        # ~~~ ANNOTATIONS ~~~ #
+        results.append(measure(
+            'AnnotationFile (.mod)',
+            lambda: AnnotationFile(mod_path),
+            work=args.points, unit='points/s', repeats=args.repeats
+        ))
+        results.append(measure(
+            'AnnotationFile (.ndjson)',
+            lambda: AnnotationFile(ndjson_path),
+            work=args.points, unit='points/s', repeats=args.repeats
+        ))
+
+        # ~~~ DISCOVERY ~~~ #
+        tree = os.path.join(tmp, 'tree')
+        runs = fixtures.write_tree(
+            tree,
+            depth=args.depth,
+            fanout=args.fanout,
+            runs_per_leaf=args.runs_per_leaf,
+            shape=(8, 16, 16)
+        )
+        dir_regex = re.compile(r"ab\d{4}.*")
+        tomogram_regex = re.compile(r".*SIRT_1k\.rec$")
+        flagellum_regex = re.compile(r"^FM\.mod$")
+        results.append(measure(
+            'seek_dirs',
+            lambda: tomogram_datasets.seek_dirs(tree, dir_regex),
+            work=len(runs), unit='dirs/s', repeats=args.repeats
+        ))
+        directories = tomogram_datasets.seek_dirs(tree, dir_regex)
+        results.append(measure(
+            'seek_annotated_tomos',
+            lambda: tomogram_datasets.seek_annotated_tomos(
+                directories, tomogram_regex, [flagellum_regex], ["Flagellar Motor"]
+            ),
+            work=len(directories), unit='dirs/s', repeats=args.repeats
+        ))
+        results.append(measure(
+            'seek_unannotated_tomos',
+            lambda: tomogram_datasets.seek_unannotated_tomos(
+                directories, tomogram_regex, [flagellum_regex]
+            ),
+            work=len(directories), unit='dirs/s', repeats=args.repeats
+        ))
+
+        # ~~~ SAMPLING ~~~ #
+        # A few sparse points, so that negative samples are easy to find
+        sample_points = fixtures.random_points(shape, 4, seed=1)
+        sample_path = fixtures.write_ndjson(os.path.join(tmp, 'sample.ndjson'), sample_points)
+        sample_tomo = TomogramFile(mrc_path, [AnnotationFile(sample_path, "points")], load=True)
+        stg = SubtomogramGenerator(sample_tomo)
+        stg.set_vol_shape(tuple(min(v, s // 2) for (v, s) in zip(args.vol_shape, shape)))
+        stg.pads = tuple(min(p, v // 4) for (p, v) in zip(stg.pads, stg.vol_shape))
+        results.append(measure(
+            'SubtomogramGenerator.positive_sample',
+            lambda: [stg.positive_sample().data for _ in range(args.samples)],
+            work=args.samples, unit='samples/s', repeats=args.repeats
+        ))
+        results.append(measure(
+            'SubtomogramGenerator.negative_sample',
+            lambda: [stg.negative_sample().data for _ in range(args.samples)],
+            work=args.samples, unit='samples/s', repeats=args.repeats
+        ))
+
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'shape': list(shape),
+            'points': args.points,
+            'depth': args.depth,
+            'fanout': args.fanout,
+            'runs_per_leaf': args.runs_per_leaf,
+            'samples': args.samples,
+        },
+        'results': results,
+    }
+
+def compare(before_path: str, after_path: str, threshold: float) -> int:
+    """
+    Print the slowdown of each benchmark between two saved runs. Returns the
+    number of benchmarks that slowed down by more than `threshold` times.
+    """
+    with open(before_path) as file:
+        before = {r['name']: r for r in json.load(file)['results']}
+    with open(after_path) as file:
+        after = {r['name']: r for r in json.load(file)['results']}
+
+    regressions = 0
+    for name, result in after.items():
+        if name not in before:
+            print(f"{name:<40} (new)")
+            continue
+        slowdown = result['min_s'] / before[name]['min_s']
+        memory = result['peak_bytes'] / max(before[name]['peak_bytes'], 1)
+        flag = ''
+        if slowdown > threshold:
+            flag = '  <-- REGRESSION'
+            regressions += 1
+        print(f"{name:<40} time x{slowdown:6.2f}   peak memory x{memory:6.2f}{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--shape', type=int, nargs=3, default=[64, 256, 256], help='Shape of the synthetic tomogram.')
+    parser.add_argument('--points', type=int, default=200, help='Points per synthetic annotation file.')
+    parser.add_argument('--depth', type=int, default=2, help='Depth of the synthetic directory tree.')
+    parser.add_argument('--fanout', type=int, default=3, help='Subdirectories per level of the directory tree.')
+    parser.add_argument('--runs-per-leaf', type=int, default=4, help='Run directories in each leaf of the directory tree.')
+    parser.add_argument('--vol-shape', type=int, nargs=3, default=[32, 64, 64], help='Shape of sampled subtomograms.')
+    parser.add_argument('--samples', type=int, default=100, help='Subtomograms drawn per sampling benchmark call.')
+    parser.add_argument('--repeats', type=int, default=3, help='Timed runs per benchmark.')
+    parser.add_argument('--output', help='Write results as JSON to this file instead of stdout.')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='Compare two saved runs instead of running benchmarks.')
+    parser.add_argument('--threshold', type=float, default=2.0, help='Slowdown factor reported as a regression by --compare.')
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.threshold) else 0)
+
+    report = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(report + "\n")
+    else:
+        print(report)
+
+if __name__ == '__main__':
+    main()
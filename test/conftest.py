@@ -3,6 +3,15 @@
 import sys
 import os
 
+import mrcfile
+
 # Add the tomogram_datasets parent directory to sys.path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
 
+def write_mrc(path, data, voxel_size=None):
+    """ Write `data` to an MRC file at `path`, returning the path as a string. """
+    with mrcfile.new(path) as mrc:
+        mrc.set_data(data)
+        if voxel_size is not None:
+            mrc.voxel_size = voxel_size
+    return str(path)
@@ -0,0 +1,74 @@
+import pickle
+
+import numpy as np
+import pytest
+
+import tomogram_datasets
+from tomogram_datasets.annotation import Annotation, AnnotationFile
+from tomogram_datasets.annotation_store import AnnotationStore
+from conftest import write_mrc
+
+def tomogram_set(directory):
+    directory.mkdir(exist_ok=True)
+    tomo_set = tomogram_datasets.SCTomogramSet()
+    motor = AnnotationFile.from_points("/data/tomo0/motor.mod", [np.array((1.0, 2, 3)), np.array((4.0, 5, 6))], "motor")
+    picked = Annotation([np.array((7.0, 8, 9))], "picked", scores=np.array([0.8]))
+    merged = Annotation([np.array((10.0, 11, 12))], "motor", sources=[("a.mod", "b.mod")])
+    annotations = [[motor, picked], None, [merged], []]
+    for index, tomo_annotations in enumerate(annotations):
+        path = write_mrc(directory / f"tomo{index}.mrc", np.full((4, 4, 4), index, dtype=np.float32))
+        tomo_set.append(tomogram_datasets.TomogramFile(path, tomo_annotations, load=False), private=False)
+    return tomo_set
+
+def test_columns_and_groups(tmp_path):
+    tomo_set = tomogram_set(tmp_path)
+    store = AnnotationStore.from_tomograms(list(tomo_set.tomograms.values()), labels=list(tomo_set.tomograms))
+    assert len(store) == 4 and store.labels == ["tomo0", "tomo1", "tomo2", "tomo3"]
+    np.testing.assert_array_equal(store.tomogram, [0, 0, 0, 2])
+    np.testing.assert_array_equal(store.z, [1, 4, 7, 10])
+    assert [store.names[n] for n in store.name] == ["motor", "motor", "picked", "motor"]
+    assert [store.sources[s] if s >= 0 else None for s in store.source] == [
+        ("/data/tomo0/motor.mod",), ("/data/tomo0/motor.mod",), None, ("a.mod", "b.mod")
+    ]
+    assert store.rows("tomo0") == slice(0, 3) and store.rows("tomo1") == slice(3, 3)
+    np.testing.assert_array_equal(store.tomogram_points("tomo0", name="picked"), [(7, 8, 9)])
+    assert len(store.tomogram_points("tomo2", name="missing")) == 0
+    with pytest.raises(KeyError):
+        store.rows("nonexistent")
+
+def test_save_load_and_attach(tmp_path):
+    tomo_set = tomogram_set(tmp_path)
+    path = str(tmp_path / "annotations.tdstore")
+    tomo_set.annotation_store(path)
+
+    fresh = tomogram_set(tmp_path / "fresh")
+    for tomo in fresh.tomograms.values():
+        tomo.annotations = None
+    store = fresh.load_annotations(path)
+    assert isinstance(store.points, np.memmap)
+
+    motor, picked = fresh.tomograms["tomo0"].annotations
+    assert isinstance(motor, AnnotationFile) and motor.filepath == "/data/tomo0/motor.mod"
+    assert motor.name == "motor" and motor.sources is None and motor.scores is None
+    np.testing.assert_array_equal(motor.points, [(1, 2, 3), (4, 5, 6)])
+    # Points are one (N, 3) view into the memory map per annotation
+    assert motor.points.shape == (2, 3) and np.shares_memory(motor.points, store.points)
+    np.testing.assert_allclose(picked.scores, [0.8])
+    assert fresh.tomograms["tomo1"].annotations is None
+    assert fresh.tomograms["tomo2"].annotations[0].sources == [("a.mod", "b.mod")]
+    assert fresh.tomograms["tomo3"].annotations == []
+
+    # Annotations backed by the store still pickle and combine
+    copied = pickle.loads(pickle.dumps(fresh.tomograms["tomo0"]))
+    np.testing.assert_array_equal(copied.annotation_points(), [(1, 2, 3), (4, 5, 6), (7, 8, 9)])
+    assert fresh.metadata().n_points.tolist() == [3, 0, 1, 0]
+
+def test_empty_store(tmp_path):
+    path = str(tmp_path / "empty.tdstore")
+    AnnotationStore.from_tomograms([], labels=[]).save(path)
+    store = AnnotationStore.load(path)
+    assert len(store) == 0 and store.points.shape == (0, 3)
+
+    (tmp_path / "not_a_store").write_bytes(b"0" * 64)
+    with pytest.raises(IOError):
+        AnnotationStore.load(str(tmp_path / "not_a_store"))
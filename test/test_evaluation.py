@@ -0,0 +1,71 @@
+import numpy as np
+
+import tomogram_datasets
+from tomogram_datasets.evaluation import DetectionScore, evaluate_detections, match_points
+from conftest import write_mrc
+
+def test_greedy_and_optimal_matching():
+    predicted = np.array([(0, 0, 0), (0, 0, 2.5), (50, 50, 50)])
+    truth = np.array([(0, 0, 1.2), (0, 0, -1.5), (80, 80, 80)])
+
+    # Greedily taking the closest pair first leaves the second prediction unmatched
+    p, t, distances = match_points(predicted, truth, 2.0)
+    np.testing.assert_array_equal(p, [0])
+    np.testing.assert_array_equal(t, [0])
+    np.testing.assert_allclose(distances, [1.2])
+
+    p, t, distances = match_points(predicted, truth, 2.0, method="optimal")
+    order = np.argsort(p)
+    np.testing.assert_array_equal(p[order], [0, 1])
+    np.testing.assert_array_equal(t[order], [1, 0])
+    np.testing.assert_allclose(distances[order], [1.5, 1.3])
+
+    score = evaluate_detections(predicted, truth, 2.0, method="optimal")
+    assert (score.true_positives, score.false_positives, score.false_negatives) == (2, 1, 1)
+    assert np.isclose(score.precision, 2 / 3) and np.isclose(score.recall, 2 / 3)
+
+def test_scores_order_greedy_matching():
+    truth = np.array([(0, 0, 0)])
+    # The farther prediction scores higher, so it is matched first
+    predicted = tomogram_datasets.Annotation(
+        [np.array((0, 0, 1.0)), np.array((0, 0, 0.5))], "motor", scores=np.array([0.9, 0.6])
+    )
+    p, _, _ = match_points(predicted, truth, 2.0)
+    np.testing.assert_array_equal(p, [0])
+
+def test_detection_score():
+    score = DetectionScore(3, 1, 2)
+    assert score.precision == 0.75 and score.recall == 0.6
+    assert np.isclose(score.f_beta(), 2 * 0.75 * 0.6 / 1.35)
+    assert np.isclose(score.f_beta(2), 5 * 0.75 * 0.6 / (4 * 0.75 + 0.6))
+
+    total = DetectionScore.total([score, DetectionScore(1, 0, 0, [0.5])])
+    assert (total.true_positives, total.false_positives, total.false_negatives) == (4, 1, 2)
+    # Nothing predicted and nothing to find is perfect
+    empty = evaluate_detections(np.zeros((0, 3)), [], 5.0)
+    assert empty.f_beta() == 1.0
+
+def test_evaluate_set(tmp_path):
+    tomo_set = tomogram_datasets.SCTomogramSet()
+    for index in range(3):
+        path = write_mrc(tmp_path / f"tomo{index}.mrc", np.full((4, 4, 4), index, dtype=np.float32))
+        annotations = [
+            tomogram_datasets.Annotation([np.array((10.0, 10, 10)), np.array((30.0, 30, 30))], "motor"),
+            tomogram_datasets.Annotation([np.array((50.0, 50, 50))], "other"),
+        ]
+        tomo_set.append(tomogram_datasets.TomogramFile(path, annotations, load=False), private=False)
+
+    predictions = {
+        "tomo0": np.array([(11.0, 10, 10), (30, 30, 30)]),
+        "tomo1": np.array([(10.0, 10, 10), (90, 90, 90)]),
+    }
+    per_tomogram, total = tomo_set.evaluate(predictions, 3.0, name="motor", workers=2, progress=False)
+    assert list(per_tomogram) == ["tomo0", "tomo1", "tomo2"]
+    assert per_tomogram["tomo0"].f_beta() == 1.0
+    assert (per_tomogram["tomo1"].true_positives, per_tomogram["tomo1"].false_positives) == (1, 1)
+    # Tomograms without predictions miss every annotation
+    assert per_tomogram["tomo2"].false_negatives == 2
+    assert (total.true_positives, total.false_positives, total.false_negatives) == (3, 1, 3)
+
+    _, total = tomo_set.evaluate(predictions, 3.0, workers=1, progress=False)
+    assert total.false_negatives == 6
@@ -0,0 +1,79 @@
+import numpy as np
+import mrcfile
+
+import tomogram_datasets
+from tomogram_datasets import filtering
+from tomogram_datasets.filtering import BandpassFilter
+from tomogram_datasets.subtomogram import Subtomogram
+
+gen = np.random.default_rng()
+
+def test_bandpass_removes_out_of_band_waves():
+    z = np.arange(64)[:, None, None]
+    x = np.arange(64)[None, None, :]
+    coarse = np.sin(2 * np.pi * z / 32) * np.ones((64, 8, 64))  # 32 voxel period
+    medium = np.sin(2 * np.pi * x / 8) * np.ones((64, 8, 64))   # 8 voxel period
+    fine = np.sin(2 * np.pi * x * 24 / 64) * np.ones((64, 8, 64))  # 2.67 voxel period
+    bandpass = BandpassFilter(low_resolution=16, high_resolution=4, spacing=1)
+    filtered = bandpass(coarse + medium + fine)
+    assert filtered.dtype == np.float32
+    np.testing.assert_allclose(filtered, medium, atol=1e-3)
+
+def test_kernels_are_cached():
+    bandpass = BandpassFilter(high_resolution=20, spacing=(5, 5, 10))
+    kernel = bandpass.kernel((8, 16, 16))
+    assert kernel.shape == (8, 16, 9)
+    assert BandpassFilter(high_resolution=20, spacing=(5, 5, 10)).kernel((8, 16, 16)) is kernel
+
+def test_kernel_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(filtering, "KERNEL_CACHE_BYTES", 64 * 64 * 33 * 4)
+    bandpass = BandpassFilter(high_resolution=20)
+    first = bandpass.kernel((64, 64, 64))
+    assert bandpass.kernel((64, 64, 64)) is first
+    # A second kernel of the same size pushes the first out
+    bandpass.kernel((64, 64, 65))
+    assert bandpass.kernel((64, 64, 64)) is not first
+    assert sum(k.nbytes for k in filtering._kernel_cache.values()) <= filtering.KERNEL_CACHE_BYTES
+    # The most recent kernel is kept even if it alone is too large
+    large = bandpass.kernel((64, 64, 128))
+    assert bandpass.kernel((64, 64, 128)) is large
+
+def test_blockwise_matches_whole_volume():
+    volume = gen.random((40, 16, 16)).astype(np.float32)
+    bandpass = BandpassFilter(low_resolution=6, high_resolution=2)
+    # Mirrored like the blocks, so that the whole-volume result has the same edges
+    mirrored = np.pad(volume, ((40, 40), (0, 0), (0, 0)), mode="reflect")
+    expected = bandpass(mirrored)[40:80]
+    blockwise = bandpass.apply_blockwise(volume, block_depth=8, halo=40)
+    np.testing.assert_allclose(blockwise, expected, atol=5e-3)
+    # The default halo is shorter but still close away from the block edges
+    approximate = bandpass.apply_blockwise(volume, block_depth=8)
+    assert np.abs(approximate - expected).mean() < 0.05 * np.abs(expected).mean()
+
+def test_filtered_loading_and_subtomograms(tmp_path):
+    data = gen.random((16, 32, 32)).astype(np.float32)
+    path = str(tmp_path / "tomo.mrc")
+    with mrcfile.new(path) as mrc:
+        mrc.set_data(data)
+        mrc.voxel_size = 10.0
+    bandpass = BandpassFilter(high_resolution=40)
+
+    tomo = tomogram_datasets.TomogramFile(path, bandpass=bandpass)
+    stretched = tomogram_datasets.TomogramFile.contrast_stretch(
+        bandpass.apply_blockwise(data, spacing=10.0), tomo.contrast_limits
+    )
+    np.testing.assert_allclose(tomo.get_data(), stretched, atol=1e-5)
+
+    raw = tomogram_datasets.TomogramFile(path)
+    subtomograms = [
+        Subtomogram(raw, lower_bounds, (8, 16, 16), bandpass=bandpass)
+        for lower_bounds in [(0, 0, 0), (8, 16, 16), (4, 8, 0)]
+    ]
+    # Filtered one by one on access, with the file's spacing...
+    expected = [bandpass(sub._unfiltered_data(), spacing=10.0) for sub in subtomograms]
+    assert all(np.allclose(sub.data, e, atol=1e-5) for sub, e in zip(subtomograms, expected))
+    # ...or together in one batch
+    for sub in subtomograms:
+        sub.data = None
+    bandpass.filter_subtomograms(subtomograms)
+    assert all(np.allclose(sub.data, e, atol=1e-5) for sub, e in zip(subtomograms, expected))
@@ -0,0 +1,40 @@
+import numpy as np
+import mrcfile
+import pytest
+
+import tomogram_datasets
+from tomogram_datasets.header import read_header, read_headers
+
+def write_mrc(path, data, voxel_size=(10.0, 11.0, 12.0)):
+    with mrcfile.new(path) as mrc:
+        mrc.set_data(data)
+        mrc.voxel_size = voxel_size
+    return str(path)
+
+@pytest.mark.parametrize("dtype", ['<f4', '>f4', '<i2'])
+def test_read_header_matches_mrcfile(tmp_path, dtype):
+    path = write_mrc(tmp_path / "tomo.mrc", np.arange(2 * 3 * 4).reshape(2, 3, 4).astype(dtype))
+    header = read_header(path)
+    with mrcfile.open(path, header_only=True) as mrc:
+        expected = mrc.header
+        assert header.dtype == expected.dtype
+        assert header.tobytes() == expected.tobytes()
+    assert (int(header.nz), int(header.ny), int(header.nx)) == (2, 3, 4)
+
+def test_read_headers_skips_unreadable(tmp_path):
+    good = write_mrc(tmp_path / "good.mrc", np.zeros((2, 2, 2), dtype=np.float32))
+    bad = tmp_path / "bad.mrc"
+    bad.write_bytes(b"\0" * 2048)
+    headers = read_headers([good, str(bad), str(tmp_path / "missing.mrc")], workers=2)
+    assert headers[0] is not None
+    assert headers[1] is None and headers[2] is None
+
+def test_from_files(tmp_path):
+    paths = [write_mrc(tmp_path / f"tomo_{i}.mrc", np.zeros((i + 1, 3, 4), dtype=np.float32)) for i in range(3)]
+    annotation = tomogram_datasets.Annotation([np.array([0, 1, 2])], "motor")
+    tomos = tomogram_datasets.TomogramFile.from_files(paths, [[annotation], None, []], workers=2)
+    assert [t.shape for t in tomos] == [(1, 3, 4), (2, 3, 4), (3, 3, 4)]
+    assert tomos[0].annotations == [annotation]
+    assert all(t.data is None for t in tomos)
+    assert np.allclose(tomos[2].voxel_spacing_array(), (10.0, 11.0, 12.0))
+    assert np.array_equal(tomos[1].memmap(), np.zeros((2, 3, 4)))
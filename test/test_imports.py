@@ -0,0 +1,39 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Modules that are slow to import and only needed by some features
+HEAVY_MODULES = ['pandas', 'imodmodel', 'skimage', 'tqdm', 'pdb', 'scipy']
+
+def imported_modules(code: str) -> set:
+    """ Run `code` in a fresh interpreter and return the heavy modules it imported. """
+    check = f"{code}\nimport sys\nprint(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    output = subprocess.run(
+        [sys.executable, '-c', check], cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    return set(output.split())
+
+@pytest.mark.parametrize("code", [
+    "import tomogram_datasets",
+    "from tomogram_datasets import TomogramFile, Tomogram, Annotation, AnnotationFile",
+])
+def test_import_is_light(code):
+    assert imported_modules(code) == set()
+
+def test_lazy_attributes():
+    code = "import tomogram_datasets\nassert callable(tomogram_datasets.seek_dirs)"
+    assert 'pandas' not in imported_modules(code)
+    # Each name resolves to its submodule's object, which is then imported
+    code = (
+        "import importlib, sys\n"
+        "from tomogram_datasets import *\n"
+        "from tomogram_datasets import _LAZY_ATTRIBUTES\n"
+        "for name, module in _LAZY_ATTRIBUTES.items():\n"
+        "    assert f'tomogram_datasets.{module}' in sys.modules, module\n"
+        "    assert globals()[name] is getattr(importlib.import_module(f'tomogram_datasets.{module}'), name), name"
+    )
+    imported_modules(code)
@@ -0,0 +1,48 @@
+import json
+
+import numpy as np
+import mrcfile
+
+import tomogram_datasets
+from tomogram_datasets import instrumentation
+
+FILE_2 = "test/data/test_2.mod"
+
+def test_disabled_records_nothing():
+    with instrumentation.recording() as rec:
+        pass
+    assert not instrumentation.is_enabled()
+    points = tomogram_datasets.AnnotationFile.mod_points(FILE_2)
+    with instrumentation.span("outside"):
+        pass
+    assert isinstance(points, list)
+    # Calls made after the recording ended are not added to it
+    assert rec.events == [] and rec.summary() == {}
+
+def test_recording(tmp_path):
+    path = str(tmp_path / "tomo.mrc")
+    with mrcfile.new(path) as mrc:
+        mrc.set_data(np.arange(4 * 5 * 6, dtype=np.float32).reshape(4, 5, 6))
+
+    with instrumentation.recording() as rec:
+        tomo = tomogram_datasets.TomogramFile(path)
+        tomogram_datasets.AnnotationFile(FILE_2)
+    assert not instrumentation.is_enabled()
+
+    summary = rec.summary()
+    # `process` fetches the already-loaded data through `load`
+    assert summary["TomogramFile.load"]['calls'] == 2
+    for name in ["TomogramFile.load_header", "TomogramFile.process",
+                 "TomogramFile.mrc_to_np", "np.percentile", "AnnotationFile.mod_points"]:
+        assert summary[name]['calls'] == 1
+    assert summary["TomogramFile.load_header"]['bytes_read'] == 1024
+    assert summary["TomogramFile.mrc_to_np"]['bytes_read'] > 0
+    assert summary["TomogramFile.mrc_to_np"]['bytes_allocated'] == tomo.data.nbytes
+    assert "TomogramFile.load" in rec.format_summary()
+
+    trace_path = tmp_path / "trace.json"
+    rec.export_chrome_trace(str(trace_path))
+    with open(trace_path) as file:
+        trace = json.load(file)
+    assert len(trace['traceEvents']) == len(rec.events)
+    assert all(event['ph'] == 'X' for event in trace['traceEvents'])
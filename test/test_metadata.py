@@ -0,0 +1,51 @@
+import numpy as np
+import mrcfile
+
+import tomogram_datasets
+
+def write_mrc(path, shape, voxel_size):
+    with mrcfile.new(path) as mrc:
+        mrc.set_data(np.zeros(shape, dtype=np.int16))
+        mrc.voxel_size = voxel_size
+    return str(path)
+
+def test_voxel_spacing_from_cached_header(tmp_path):
+    path = write_mrc(tmp_path / "a.mrc", (4, 5, 6), (13.48, 13.48, 20.1))
+    tomo = tomogram_datasets.TomogramFile(path, load=False)
+    with mrcfile.open(path, header_only=True) as mrc:
+        expected = [mrc.voxel_size.x.item(), mrc.voxel_size.y.item(), mrc.voxel_size.z.item()]
+    assert np.array_equal(tomo.voxel_spacing_array(), expected)
+    assert np.array_equal(tomo.get_voxel_spacing(), expected)
+    assert tomo.get_dtype() == np.int16
+
+def test_metadata_filters(tmp_path):
+    tomo_set = tomogram_datasets.SCTomogramSet()
+    specs = [("a", (300, 8, 8), 10.0, False), ("b", (100, 8, 8), 10.0, True), ("c", (400, 8, 8), 20.0, False)]
+    for name, shape, spacing, private in specs:
+        path = write_mrc(tmp_path / f"{name}.mrc", shape, spacing)
+        annotation = tomogram_datasets.Annotation([np.array([1, 2, 3])], "point")
+        tomo_set.append(tomogram_datasets.TomogramFile(path, [annotation], load=False), private=private)
+
+    meta = tomo_set.metadata()
+    assert len(meta) == 3
+    assert meta is tomo_set.metadata()  # Cached
+    assert list(meta['labels']) == ["a", "b", "c"]
+    assert np.array_equal(meta.n_points, [1, 1, 1])
+    assert np.array_equal(meta.private, [False, True, False])
+
+    subset = meta.select((meta.voxel_spacing.max(axis=1) < 15) & (meta.shape[:, 0] >= 300))
+    assert list(subset.labels) == ["a"]
+    assert subset.tomograms[0] is tomo_set.tomograms["a"]
+    assert len(meta.to_pandas()) == 3
+
+    # Appending invalidates the cache
+    path = write_mrc(tmp_path / "d.mrc", (8, 8, 8), 10.0)
+    tomo_set.append(tomogram_datasets.TomogramFile(path, load=False))
+    assert len(tomo_set.metadata()) == 4
+
+def test_unknown_voxel_spacing_is_nan(tmp_path):
+    tomo_set = tomogram_datasets.SCTomogramSet()
+    # A header with no cell size
+    tomo_set.append(tomogram_datasets.TomogramFile(write_mrc(tmp_path / "a.mrc", (4, 4, 4), 0), load=False))
+    assert np.array_equal(tomo_set.tomograms["a"].voxel_spacing_array(), [0, 0, 0])
+    assert np.isnan(tomo_set.metadata().voxel_spacing).all()
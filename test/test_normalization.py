@@ -0,0 +1,64 @@
+import numpy as np
+import mrcfile
+import pytest
+
+import tomogram_datasets
+from tomogram_datasets.normalization import IntensityStats, volume_stats
+
+gen = np.random.default_rng()
+
+def test_stats_merge_and_percentiles():
+    a = gen.normal(size=(20, 50, 50))
+    b = gen.normal(2, 3, size=(10, 50, 50))
+    stats = volume_stats(a, 2048, (-20, 20), block_depth=3).merge(volume_stats(b, 2048, (-20, 20)))
+    values = np.concatenate([a.ravel(), b.ravel()])
+    assert stats.count == values.size
+    assert np.isclose(stats.mean, values.mean())
+    assert np.isclose(stats.std, values.std())
+    assert stats.minimum == values.min() and stats.maximum == values.max()
+    assert np.allclose(stats.percentile((2, 50, 98)), np.percentile(values, (2, 50, 98)), atol=0.05)
+
+    with pytest.raises(ValueError):
+        stats.merge(IntensityStats(16, (-20, 20)))
+
+def test_stats_save_load(tmp_path):
+    stats = volume_stats(gen.random((4, 5, 6)), 64, (0, 1))
+    path = str(tmp_path / "stats.npz")
+    stats.save(path)
+    loaded = IntensityStats.load(path)
+    assert np.array_equal(loaded.histogram, stats.histogram)
+    assert loaded.value_range == stats.value_range
+    assert (loaded.count, loaded.mean, loaded.m2) == (stats.count, stats.mean, stats.m2)
+
+def test_normalize_set(tmp_path):
+    volumes = [gen.normal(i, 1, size=(16, 32, 32)).astype(np.float32) for i in range(3)]
+    tomograms = []
+    for i, volume in enumerate(volumes[:2]):
+        path = str(tmp_path / f"tomo_{i}.mrc")
+        with mrcfile.new(path) as mrc:
+            mrc.set_data(volume)
+        tomograms.append(tomogram_datasets.TomogramFile(path, load=False))
+    # No intensity range in the header of a .npy file
+    path = str(tmp_path / "tomo_2.npy")
+    np.save(path, volumes[2])
+    tomograms.append(tomogram_datasets.TomogramFile(path, load=False))
+
+    tomo_set = tomogram_datasets.SCTomogramSet()
+    tomo_set.extend(tomograms, private=False)
+    low, high = tomo_set.normalize(workers=2, progress=False)
+
+    values = np.concatenate([v.ravel() for v in volumes])
+    assert np.allclose((low, high), np.percentile(values, (2, 98)), atol=0.02)
+    assert tomo_set.intensity_stats.count == values.size
+
+    tomo = tomo_set.tomograms["tomo_0"]
+    assert tomo.intensity_limits == (low, high)
+    data = tomo.get_data()
+    assert tomo.contrast_limits == (low, high)
+    expected = tomogram_datasets.TomogramFile.contrast_stretch(volumes[0], (low, high))
+    assert np.allclose(data, expected)
+    assert np.allclose(tomo.get_slice(0, 2), expected[2])
+
+def test_normalize_empty_set():
+    with pytest.raises(ValueError):
+        tomogram_datasets.SCTomogramSet().normalize(progress=False)
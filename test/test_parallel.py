@@ -0,0 +1,42 @@
+import os
+import time
+
+from concurrent.futures.process import BrokenProcessPool
+
+from tomogram_datasets.parallel import Failure, iter_process_map
+
+def double_or_crash(item):
+    """ Module-level, so that it can be sent to worker processes. """
+    if item == 3:
+        os._exit(1)
+    time.sleep(0.05)
+    return item * 2
+
+def test_crash_is_charged_to_its_item():
+    results = dict(iter_process_map(double_or_crash, range(8), workers=4))
+    # Items running alongside the crash are rerun, not failed
+    assert {index: result for index, result in results.items() if index != 3} == {
+        index: index * 2 for index in range(8) if index != 3
+    }
+    failure = results[3]
+    assert isinstance(failure, Failure) and isinstance(failure.error, BrokenProcessPool)
+    assert failure.attempts == 1
+
+    results = dict(iter_process_map(double_or_crash, range(8), workers=4, retries=2))
+    assert results[3].attempts == 3
+
+def sleep_or_crash(item):
+    if item == 3:
+        os._exit(1)
+    time.sleep(0.1)
+    return item
+
+def test_crash_does_not_serialize_the_rest():
+    start = time.perf_counter()
+    results = dict(iter_process_map(sleep_or_crash, range(40), workers=4))
+    elapsed = time.perf_counter() - start
+    assert sorted(index for index, result in results.items() if not isinstance(result, Failure)) == [
+        index for index in range(40) if index != 3
+    ]
+    # Running the 39 other items one at a time would take at least 3.9 seconds
+    assert elapsed < 3.0
@@ -0,0 +1,45 @@
+import numpy as np
+
+import tomogram_datasets
+from tomogram_datasets.peaks import find_peaks
+from tomogram_datasets.points import non_maximum_suppression
+
+def gaussian_heatmap(shape, centers, sigma=2.0):
+    grid = np.indices(shape).reshape(3, -1).T
+    heatmap = np.zeros(len(grid))
+    for center, height in centers:
+        heatmap = np.maximum(heatmap, height * np.exp(-np.sum((grid - center) ** 2, axis=1) / (2 * sigma ** 2)))
+    return heatmap.reshape(shape).astype(np.float32)
+
+def test_find_peaks_across_blocks():
+    centers = [((5, 10, 10), 0.9), ((16, 20, 12), 0.8), ((31, 5, 25), 0.7), ((16, 22, 14), 0.3)]
+    heatmap = gaussian_heatmap((40, 32, 32), centers)
+
+    annotation = find_peaks(heatmap, threshold=0.5, min_distance=4, block_depth=7, workers=4, name="motor")
+    assert annotation.name == "motor"
+    # The low peak is below the threshold; the others are found across block boundaries
+    np.testing.assert_array_equal(annotation.points, [(5, 10, 10), (16, 20, 12), (31, 5, 25)])
+    np.testing.assert_allclose(annotation.scores, [0.9, 0.8, 0.7], atol=1e-6)
+
+    # The result does not depend on blocking or threads
+    single = find_peaks(heatmap, threshold=0.5, min_distance=4, block_depth=40, workers=1)
+    np.testing.assert_array_equal(single.points, annotation.points)
+    assert len(find_peaks(heatmap, threshold=0.5, max_peaks=2).points) == 2
+
+def test_plateaus_and_tomograms():
+    scores = np.zeros((10, 10, 10), dtype=np.float32)
+    scores[4:6, 4:6, 4:6] = 1.0
+    tomo = tomogram_datasets.Tomogram(scores)
+    annotation = find_peaks(tomo, min_distance=3)
+    assert len(annotation.points) == 1
+
+    # A saturated plateau across several blocks gives one peak, at its first voxel
+    scores = np.zeros((40, 48, 48), dtype=np.float32)
+    scores[10:26, 8:40, 8:40] = 1.0
+    annotation = find_peaks(scores, min_distance=8, block_depth=7)
+    np.testing.assert_array_equal(annotation.points, [(10, 8, 8)])
+
+def test_non_maximum_suppression():
+    points = np.array([[0, 0, 0], [0, 0, 2], [0, 0, 5], [0, 0, 6]])
+    scores = np.array([0.5, 0.9, 0.4, 0.8])
+    np.testing.assert_array_equal(non_maximum_suppression(points, scores, 2.5), [1, 3])
@@ -0,0 +1,41 @@
+import numpy as np
+
+from tomogram_datasets.points import cluster_points, merge_points, neighbor_pairs
+
+def brute_force_pairs(points, radius):
+    distances = np.linalg.norm(points[:, None] - points[None], axis=2)
+    i, j = np.nonzero(np.triu(distances <= radius, k=1))
+    return set(zip(i.tolist(), j.tolist()))
+
+def test_neighbor_pairs_match_brute_force():
+    gen = np.random.default_rng(0)
+    points = gen.uniform(-20, 60, (400, 3))
+    i, j = neighbor_pairs(points, 4.0)
+    assert np.all(i < j)
+    assert set(zip(i.tolist(), j.tolist())) == brute_force_pairs(points, 4.0)
+    assert len(neighbor_pairs(points[:1], 4.0)[0]) == 0
+
+def test_cluster_points_follows_chains():
+    points = np.array([[0, 0, 0], [50, 50, 50], [0, 0, 2], [0, 0, 4], [50, 50, 51]])
+    labels = cluster_points(points, 2.5)
+    np.testing.assert_array_equal(labels, [0, 1, 0, 0, 1])
+
+def test_merge_points_records_sources():
+    points = np.array([[10, 10, 10], [10, 11, 10], [30, 30, 30], [10, 10, 11], [30, 30, 32]])
+    merged, sources = merge_points(points, 3.0, sources=[0, 1, 1, 1, 2])
+    # Points from one source are never merged, so only one of source 1's points joins source 0's
+    np.testing.assert_allclose(merged, [[10, 10.5, 10], [30, 30, 31], [10, 10, 11]])
+    assert [s.tolist() for s in sources] == [[0, 1], [1, 2], [1]]
+
+    # Merged groups don't chain beyond the tolerance
+    merged, _ = merge_points(np.array([[0, 0, x] for x in range(5)]), 1.5)
+    assert len(merged) == 3
+
+    merged, sources = merge_points(np.zeros((0, 3)), 3.0)
+    assert merged.shape == (0, 3) and sources == []
+
+def test_merge_points_with_merged_sources():
+    # Points already merged from sources {0, 1} and {0} share source 0
+    merged, sources = merge_points(np.array([[10, 10, 10], [11, 10, 10], [10, 10, 11]]), 3.0, sources=[(0, 1), (0,), 2])
+    np.testing.assert_allclose(merged, [[10, 10, 10.5], [11, 10, 10]])
+    assert [s.tolist() for s in sources] == [[0, 1, 2], [0]]
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+import tomogram_datasets
+from tomogram_datasets.quantize import QuantizedVolume
+from tomogram_datasets.subtomogram import Subtomogram
+
+gen = np.random.default_rng()
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.uint16])
+def test_quantize_round_trip(dtype):
+    data = gen.random((10, 20, 30))
+    volume = QuantizedVolume.from_array(data, dtype, block_depth=3)
+    assert volume.shape == data.shape
+    assert volume.nbytes == data.nbytes // (8 // np.dtype(dtype).itemsize)
+    assert np.max(np.abs(np.asarray(volume) - data)) <= volume.scale / 2 + 1e-6
+    # Patches are dequantized on their own
+    patch = volume[2:5, 3:9, 4:12]
+    assert patch.dtype == np.float32
+    assert np.array_equal(patch, np.asarray(volume)[2:5, 3:9, 4:12])
+
+def test_quantize_rejects_other_types():
+    with pytest.raises(ValueError):
+        QuantizedVolume.from_array(gen.random((2, 2, 2)), np.int32)
+
+def test_process_quantize(tmp_path):
+    path = str(tmp_path / "tomo.npy")
+    np.save(path, gen.normal(size=(12, 16, 20)))
+    full = tomogram_datasets.TomogramFile(path).get_data()
+    tomo = tomogram_datasets.TomogramFile(path, quantize="uint8")
+    assert isinstance(tomo.data, QuantizedVolume)
+    assert np.allclose(np.asarray(tomo.data), full, atol=tomo.data.scale)
+
+    sub = Subtomogram(tomo, np.array([2, 3, 4]), (4, 5, 6))
+    assert np.allclose(sub.data, full[2:6, 3:8, 4:10], atol=tomo.data.scale)
@@ -0,0 +1,74 @@
+import os
+
+import numpy as np
+import mrcfile
+import pytest
+
+import tomogram_datasets
+from tomogram_datasets.resample import resample_volume, scale_points
+from conftest import write_mrc
+
+def test_resample_volume_identity():
+    data = np.random.default_rng().random((7, 8, 9)).astype(np.float32)
+    assert np.allclose(resample_volume(data, data.shape, block_depth=3), data, atol=1e-6)
+
+def test_resample_volume_linear():
+    # Linear functions are reproduced exactly away from the clipped borders
+    z, y, x = np.meshgrid(np.arange(20), np.arange(24), np.arange(28), indexing='ij')
+    data = (z + 2 * y + 3 * x).astype(np.float32)
+    out = resample_volume(data, (10, 12, 14), block_depth=4)
+    zo, yo, xo = np.meshgrid(np.arange(10), np.arange(12), np.arange(14), indexing='ij')
+    expected = ((zo + 0.5) * 2 - 0.5) + 2 * ((yo + 0.5) * 2 - 0.5) + 3 * ((xo + 0.5) * 2 - 0.5)
+    assert np.allclose(out, expected, atol=1e-4)
+
+def test_scale_points():
+    points = np.array([[-0.5, 9.5, 4.5]])
+    assert np.allclose(scale_points(points, (10, 10, 10), (20, 5, 10)), [[-0.5, 4.5, 4.5]])
+
+def test_tomogram_file_resample(tmp_path):
+    data = np.random.default_rng().integers(0, 100, size=(10, 12, 14)).astype(np.int16)
+    path = write_mrc(tmp_path / "tomo.mrc", data, 10.0)
+    annotation = tomogram_datasets.Annotation([np.array([4.5, 5.5, 6.5])], "motor")
+    tomo = tomogram_datasets.TomogramFile(path, [annotation], load=False)
+
+    cache_dir = str(tmp_path / "cache")
+    resampled = tomo.resample(20.0, cache_dir)
+    assert resampled.shape == (5, 6, 7)
+    assert np.allclose(resampled.voxel_spacing_array(), 20.0)
+    assert resampled.annotations[0].name == "motor"
+    assert np.allclose(resampled.annotation_points()[0], [2.0, 2.5, 3.0])
+    assert resampled.data is None
+
+    # The cached file is reused
+    mtime = os.path.getmtime(resampled.filepath)
+    again = tomo.resample(20.0, cache_dir)
+    assert again.filepath == resampled.filepath
+    assert os.path.getmtime(again.filepath) == mtime
+
+def test_set_resample(tmp_path):
+    tomo_set = tomogram_datasets.SCTomogramSet(dedupe="label", full_hash=True, merge_tolerance=None)
+    for name, spacing in [("a", 10.0), ("b", 5.0)]:
+        path = write_mrc(tmp_path / f"{name}.mrc", np.zeros((8, 8, 8), dtype=np.float32), spacing)
+        tomo_set.append(tomogram_datasets.TomogramFile(path, load=False), private=(name == "b"))
+    # A copy of "a" found elsewhere
+    os.mkdir(tmp_path / "copy")
+    copy = write_mrc(tmp_path / "copy" / "a.mrc", np.zeros((8, 8, 8), dtype=np.float32), 10.0)
+    tomo_set.append(tomogram_datasets.TomogramFile(copy, load=False))
+
+    resampled = tomo_set.resample(10.0, str(tmp_path / "cache"), workers=2, progress=False)
+    assert resampled.tomograms["a"].shape == (8, 8, 8)
+    assert resampled.tomograms["b"].shape == (4, 4, 4)
+    assert resampled.private == tomo_set.private
+    assert resampled.aliases == tomo_set.aliases
+    assert resampled.aliases["a"] == [str(tmp_path / "a.mrc"), copy]
+    assert resampled.aliases["a"] is not tomo_set.aliases["a"]
+    assert (resampled.dedupe, resampled.full_hash, resampled.merge_tolerance) == ("label", True, None)
+
+def test_resample_unknown_spacing(tmp_path):
+    path = str(tmp_path / "tomo.mrc")
+    with mrcfile.new(path) as mrc:
+        mrc.set_data(np.zeros((8, 8, 8), dtype=np.float32))
+    tomo = tomogram_datasets.TomogramFile(path, load=False)
+    with pytest.raises(ValueError):
+        tomo.resample(10.0, str(tmp_path / "cache"))
+    assert not os.path.exists(tmp_path / "cache")
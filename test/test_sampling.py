@@ -0,0 +1,66 @@
+import numpy as np
+import mrcfile
+
+import tomogram_datasets
+from tomogram_datasets.sampling import EpochSampler
+
+gen = np.random.default_rng()
+
+def make_tomograms():
+    annotation = tomogram_datasets.Annotation([np.array([20, 40, 40]), np.array([45, 90, 90])], "motor")
+    annotated = tomogram_datasets.Tomogram(gen.random((60, 120, 120)), [annotation])
+    unannotated = tomogram_datasets.Tomogram(gen.random((40, 80, 80)), [])
+    return [annotated, unannotated]
+
+def test_plan_labels_and_bounds():
+    tomograms = make_tomograms()
+    sampler = EpochSampler(tomograms, (16, 32, 32), pads=(2, 4, 4), seed=0)
+    plan = sampler.plan(100, positive_fraction=0.3)
+    assert len(plan) == 100
+    assert plan['label'].sum() == 30
+    assert np.all(plan['tomogram'][plan['label'] == 1] == 0)
+    for row in plan:
+        shape = np.array(tomograms[row['tomogram']].shape)
+        assert np.all(row['lower_bounds'] >= 0)
+        assert np.all(row['lower_bounds'] + (16, 32, 32) <= shape)
+
+def test_execution_order_groups_reads():
+    sampler = EpochSampler(make_tomograms(), (16, 32, 32), pads=(2, 4, 4), seed=1)
+    plan = sampler.plan(50)
+    ordered = plan[sampler.execution_order(plan)]
+    # Each tomogram is read in one contiguous run, top to bottom
+    assert np.all(np.diff(ordered['tomogram']) >= 0)
+    for index in np.unique(ordered['tomogram']):
+        z = ordered['lower_bounds'][ordered['tomogram'] == index, 0]
+        assert np.all(np.diff(z // sampler.slab_depth) >= 0)
+
+def test_execute_yields_every_sample_once():
+    sampler = EpochSampler(make_tomograms(), (16, 32, 32), pads=(2, 4, 4), seed=2)
+    plan = sampler.plan(40)
+    seen = []
+    for index, sub in sampler.execute(plan, buffer_size=8):
+        seen.append(index)
+        assert sub.shape == (16, 32, 32)
+        assert sub.is_annotated() == bool(plan['label'][index])
+    assert sorted(seen) == list(range(40))
+    # The reorder buffer hides the execution order
+    assert seen != list(sampler.execution_order(plan))
+
+def test_execute_reads_unloaded_files(tmp_path):
+    data = gen.random((20, 40, 40)).astype(np.float32)
+    path = str(tmp_path / "tomo.mrc")
+    with mrcfile.new(path) as mrc:
+        mrc.set_data(data)
+    tomo = tomogram_datasets.TomogramFile(path, [], load=False)
+    loaded = tomogram_datasets.TomogramFile(path, [], load=False)
+    for t in (tomo, loaded):
+        t.intensity_limits = (0.2, 0.8)
+    loaded.load()
+    sampler = EpochSampler([tomo, loaded], (8, 16, 16), seed=3)
+    plan = sampler.plan(10, positive_fraction=0)
+    for index, sub in sampler.execute(plan):
+        z, y, x = plan['lower_bounds'][index]
+        # Memory-mapped reads are stretched like loaded data
+        expected = loaded.data[z : z + 8, y : y + 16, x : x + 16]
+        np.testing.assert_allclose(sub.data, expected)
+    assert tomo.data is None
@@ -0,0 +1,134 @@
+import multiprocessing
+import socket
+import threading
+
+import numpy as np
+import mrcfile
+import pytest
+
+import tomogram_datasets
+from tomogram_datasets.server import PatchClient, PatchServer
+from tomogram_datasets.shared import SharedVolume
+
+def write_tomogram(path):
+    data = np.random.default_rng(0).random((32, 48, 48)).astype(np.float32)
+    with mrcfile.new(path) as mrc:
+        mrc.set_data(data)
+    annotation = tomogram_datasets.Annotation([np.array([16, 24, 24])], "motor")
+    return tomogram_datasets.TomogramFile(str(path), [annotation], load=False)
+
+def sample_in_process(address, tomogram, queue):
+    """ A separate training job sampling from the server. """
+    with PatchClient(address) as client:
+        generator = client.generator(tomogram)
+        generator.set_vol_shape((8, 16, 16))
+        generator.pads = (2, 2, 2)
+        sample = generator.positive_sample()
+        queue.put((sample.lower_bounds.tolist(), float(sample.data.sum()), generator.tomogram.volume.refcount))
+
+def test_server_samples_and_batches(tmp_path):
+    tomo = write_tomogram(tmp_path / "tomo.mrc")
+    expected = tomogram_datasets.TomogramFile(tomo.filepath).get_data()
+    with PatchServer(str(tmp_path / "patches.sock")).start() as server:
+        with PatchClient(server.address, seed=0) as client:
+            generator = client.generator(tomo)
+            generator.set_vol_shape((8, 16, 16))
+            generator.pads = (2, 2, 2)
+
+            positive = generator.positive_sample()
+            z, y, x = positive.lower_bounds
+            assert np.array_equal(positive.data, expected[z : z + 8, y : y + 16, x : x + 16])
+            assert len(positive.annotation_points()) == 1
+            for negative in generator.negative_samples(5):
+                assert negative.shape == (8, 16, 16)
+                assert len(negative.annotation_points()) == 0
+
+            bounds = np.array([[0, 0, 0], [24, 32, 32]])
+            with client.batch(tomo, bounds, (8, 16, 16)) as batch:
+                assert batch.array.shape == (2, 8, 16, 16)
+                assert np.array_equal(batch.array[1], expected[24:, 32:, 32:])
+            with pytest.raises(ValueError):
+                client.batch(tomo, [[30, 0, 0]], (8, 16, 16))
+
+            # Another process attaches to the same resident copy
+            queue = multiprocessing.get_context("spawn").Queue()
+            process = multiprocessing.get_context("spawn").Process(
+                target=sample_in_process, args=(server.address, tomo, queue)
+            )
+            process.start()
+            (z, y, x), total, refcount = queue.get(timeout=60)
+            process.join()
+            assert np.isclose(total, expected[z : z + 8, y : y + 16, x : x + 16].sum(), rtol=1e-5)
+            # The server and both clients
+            assert refcount == 3
+
+def test_tcp_requires_authkey(tmp_path, monkeypatch):
+    monkeypatch.delenv("TOMOGRAM_PATCHES_AUTHKEY", raising=False)
+    with pytest.raises(ValueError):
+        PatchServer(("localhost", 0))
+
+    tomo = write_tomogram(tmp_path / "tomo.mrc")
+    monkeypatch.setenv("TOMOGRAM_PATCHES_AUTHKEY", "secret")
+    with PatchServer(("localhost", 0)).start() as server:
+        with PatchClient(server.address) as client:
+            assert client.tomogram(tomo).shape == (32, 48, 48)
+        with pytest.raises(multiprocessing.AuthenticationError):
+            PatchClient(server.address, authkey=b"wrong")
+
+def test_socket_path_is_checked(tmp_path):
+    path = tmp_path / "patches.sock"
+    path.write_text("not a socket")
+    with pytest.raises(FileExistsError):
+        PatchServer(str(path))
+    assert path.read_text() == "not a socket"
+    path.unlink()
+
+    # A socket left behind by a server that died is replaced
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(str(path))
+    stale.close()
+    with PatchServer(str(path)).start() as server:
+        # A live server's socket is not
+        with pytest.raises(OSError):
+            PatchServer(str(path))
+        with PatchClient(server.address):
+            pass
+
+def test_entries_by_preprocessing_and_loading(tmp_path, monkeypatch):
+    first = write_tomogram(tmp_path / "first.mrc")
+    second = write_tomogram(tmp_path / "second.mrc")
+    limited = tomogram_datasets.TomogramFile(first.filepath, load=False)
+    limited.intensity_limits = (0.2, 0.8)
+    server = PatchServer(str(tmp_path / "patches.sock"), max_volumes=1)
+
+    # One file preprocessed two ways is held twice
+    plain = server._open(first)["handle"]
+    stretched = server._open(limited)["handle"]
+    assert plain.name != stretched.name
+    with SharedVolume.attach(stretched) as volume:
+        expected = tomogram_datasets.TomogramFile.contrast_stretch(first.memmap(), (0.2, 0.8))
+        assert np.allclose(volume.array, expected)
+
+    loading, release = threading.Event(), threading.Event()
+    share = tomogram_datasets.TomogramFile.share
+    def slow_share(tomogram):
+        if tomogram.filepath == second.filepath:
+            loading.set()
+            release.wait(10)
+        return share(tomogram)
+    monkeypatch.setattr(tomogram_datasets.TomogramFile, "share", slow_share)
+    opened = []
+    thread = threading.Thread(target=lambda: opened.append(server._open(second)))
+    thread.start()
+    assert loading.wait(10)
+    # Would evict the second tomogram while it loads, if anything could
+    server._open(first)
+    release.set()
+    thread.join()
+    handle = opened[0]["handle"]
+    assert handle.name in [entry.volume.handle.name for entry in server._entries.values()]
+    server.close()
+    # Every volume the server loaded was released
+    for released in (plain, stretched, handle):
+        with pytest.raises(FileNotFoundError):
+            SharedVolume.attach(released)
@@ -0,0 +1,88 @@
+import multiprocessing
+import os
+
+import numpy as np
+import pytest
+
+import tomogram_datasets
+from tomogram_datasets.shared import SharedTomogram, SharedVolume, sweep_shared_volumes
+
+def shared_sum(handle, annotations, queue):
+    """ Attach to a shared tomogram in another process and sum it. """
+    with SharedTomogram.attach(handle, annotations) as tomo:
+        queue.put((float(tomo.data.sum()), tomo.volume.refcount, len(tomo.annotation_points())))
+
+def test_share_across_processes():
+    data = np.random.default_rng().random((10, 20, 30)).astype(np.float32)
+    annotations = [tomogram_datasets.Annotation([np.array([1, 2, 3])], "motor")]
+    tomo = tomogram_datasets.Tomogram(data, annotations)
+
+    volume = tomo.share()
+    assert volume.refcount == 1
+    assert np.array_equal(volume.array, data)
+
+    queue = multiprocessing.get_context("spawn").Queue()
+    process = multiprocessing.get_context("spawn").Process(
+        target=shared_sum, args=(volume.handle, annotations, queue)
+    )
+    process.start()
+    total, refcount, n_points = queue.get(timeout=60)
+    process.join()
+
+    assert np.isclose(total, data.sum(dtype=np.float64), rtol=1e-5)
+    assert refcount == 2
+    assert n_points == 1
+    # The worker released its reference
+    assert volume.refcount == 1
+
+    handle = volume.handle
+    volume.close()
+    with pytest.raises(FileNotFoundError):
+        SharedVolume.attach(handle)
+
+def test_attached_volume_is_read_only():
+    with SharedVolume.publish(np.zeros((2, 3, 4))) as volume:
+        with SharedVolume.attach(volume.handle) as attached:
+            assert attached.refcount == 2
+            with pytest.raises(ValueError):
+                attached.array[0, 0, 0] = 1
+        assert volume.refcount == 1
+
+def attach_and_crash(handle):
+    """ Attach to a shared volume, then exit without closing it. """
+    volume = SharedVolume.attach(handle)
+    os._exit(0)
+
+def publish_and_crash(queue):
+    """ Publish a shared volume, then exit without closing it. """
+    volume = SharedVolume.publish(np.ones((2, 3, 4)))
+    queue.put(volume.handle)
+    queue.close()
+    queue.join_thread()
+    os._exit(0)
+
+def test_crashed_holders_do_not_leak():
+    context = multiprocessing.get_context("spawn")
+    volume = SharedVolume.publish(np.zeros((2, 3, 4)))
+    process = context.Process(target=attach_and_crash, args=(volume.handle,))
+    process.start()
+    process.join()
+    # The crashed worker's reference is never released...
+    assert volume.refcount == 2
+    handle = volume.handle
+    volume.close()
+    # ...but it no longer holds the block, so the last live holder frees it
+    with pytest.raises(FileNotFoundError):
+        SharedVolume.attach(handle)
+
+    queue = context.Queue()
+    process = context.Process(target=publish_and_crash, args=(queue,))
+    process.start()
+    handle = queue.get(timeout=60)
+    process.join()
+    with SharedVolume.publish(np.zeros(1)) as live:
+        freed = sweep_shared_volumes()
+        assert handle.name in freed and live.handle.name not in freed
+        assert live.refcount == 1
+    with pytest.raises(FileNotFoundError):
+        SharedVolume.attach(handle)
@@ -0,0 +1,44 @@
+import numpy as np
+import mrcfile
+import pytest
+
+import tomogram_datasets
+
+gen = np.random.default_rng()
+
+@pytest.fixture
+def tomo_path(tmp_path):
+    data = gen.normal(size=(10, 12, 14)).astype(np.float32)
+    path = str(tmp_path / "tomo.mrc")
+    with mrcfile.new(path) as mrc:
+        mrc.set_data(data)
+    return path, data
+
+@pytest.mark.parametrize("axis", [0, 1, 2])
+def test_get_slice_raw(tomo_path, axis):
+    path, data = tomo_path
+    tomo = tomogram_datasets.TomogramFile(path, load=False)
+    plane = tomo.get_slice(axis, 3, preprocess=False)
+    assert np.array_equal(plane, np.take(data, 3, axis=axis))
+    assert tomo.data is None
+
+@pytest.mark.parametrize("axis", [0, 1, 2])
+def test_get_slice_matches_process(tomo_path, axis):
+    path, _ = tomo_path
+    processed = tomogram_datasets.TomogramFile(path)
+    tomo = tomogram_datasets.TomogramFile(path, load=False)
+    tomo.contrast_limits = processed.contrast_limits
+    expected = np.take(processed.get_data(), 5, axis=axis)
+    assert np.allclose(tomo.get_slice(axis, 5), expected)
+    assert np.allclose(processed.get_slice(axis, 5), expected)
+
+def test_get_slice_estimates_limits(tomo_path):
+    path, data = tomo_path
+    tomo = tomogram_datasets.TomogramFile(path, load=False)
+    plane = tomo.get_slice(0, 0)
+    assert tomo.contrast_limits is not None
+    assert plane.min() >= -1 and plane.max() <= 1
+    with pytest.raises(IndexError):
+        tomo.get_slice(0, 10)
+    with pytest.raises(IndexError):
+        tomo.get_slice(3, 0)
@@ -0,0 +1,73 @@
+import pytest
+
+import numpy as np
+import mrcfile
+
+import tomogram_datasets
+from tomogram_datasets.subtomogram import Subtomogram, SubtomogramGenerator
+
+# Random number generator
+gen = np.random.default_rng()
+
+@pytest.fixture
+def parent_tomo():
+    """ 
+    A 50 x 100 x 200 random tomogram with one annotation containing two
+    points.
+    """
+    data = gen.random(size=(50, 100, 200))
+    annotation = tomogram_datasets.Annotation(
+        [np.array([10, 20, 30]), np.array([40, 90, 190])],
+        "motor"
+    )
+    return tomogram_datasets.Tomogram(data, [annotation])
+
+def test_subtomogram_is_view(parent_tomo):
+    sub = Subtomogram(parent_tomo, np.array([5, 10, 20]), (20, 30, 40))
+    assert sub.shape == (20, 30, 40)
+    assert np.shares_memory(sub.data, parent_tomo.data)
+    assert np.array_equal(sub.data, parent_tomo.data[5:25, 10:40, 20:60])
+    # Cached after first access
+    assert sub.data is sub.data
+    # All of its state is kept in slots
+    assert not vars(sub)
+
+def test_subtomogram_annotations(parent_tomo):
+    sub = Subtomogram(parent_tomo, np.array([5, 10, 20]), (20, 30, 40))
+    assert len(sub.annotations) == 1
+    assert sub.annotations[0].name == "motor"
+    points = sub.annotation_points()
+    assert len(points) == 1
+    assert np.array_equal(points[0], [5, 10, 10])
+
+    empty = Subtomogram(parent_tomo, np.array([20, 30, 50]), (10, 10, 10))
+    assert empty.annotations == []
+
+def test_negative_sample_excludes_points(parent_tomo):
+    stg = SubtomogramGenerator(parent_tomo)
+    stg.set_vol_shape((16, 32, 32))
+    stg.pads = (2, 4, 4)
+    for _ in range(10):
+        assert not stg.negative_sample().is_annotated()
+        assert stg.positive_sample().is_annotated()
+
+def test_unloaded_parent_matches_loaded(tmp_path):
+    path = str(tmp_path / "tomo.mrc")
+    with mrcfile.new(path) as mrc:
+        mrc.set_data(gen.normal(size=(20, 30, 40)).astype(np.float32))
+    unloaded = tomogram_datasets.TomogramFile(path, load=False)
+    loaded = tomogram_datasets.TomogramFile(path)
+    # Share the limits that loading computed from the whole volume
+    unloaded.contrast_limits = loaded.contrast_limits
+    for lower_bounds in ([0, 0, 0], [5, 7, 9]):
+        expected = Subtomogram(loaded, lower_bounds, (8, 10, 12)).data
+        np.testing.assert_allclose(Subtomogram(unloaded, lower_bounds, (8, 10, 12)).data, expected)
+    assert unloaded.data is None
+
+    # Filtered subtomograms are filtered after stretching either way
+    bandpass = tomogram_datasets.BandpassFilter(high_resolution=4)
+    np.testing.assert_allclose(
+        Subtomogram(unloaded, [2, 3, 4], (8, 8, 8), bandpass=bandpass).data,
+        Subtomogram(loaded, [2, 3, 4], (8, 8, 8), bandpass=bandpass).data,
+        rtol=1e-5, atol=1e-6
+    )
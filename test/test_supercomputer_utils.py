@@ -0,0 +1,222 @@
+import pickle
+import pytest
+import shutil
+
+import numpy as np
+
+import tomogram_datasets
+from conftest import write_mrc
+
+def annotated(path, point):
+    annotation = tomogram_datasets.Annotation([np.array(point)], "motor")
+    return tomogram_datasets.TomogramFile(path, [annotation], load=False)
+
+def test_fingerprint_dedupe(tmp_path):
+    gen = np.random.default_rng(0)
+    (tmp_path / "d1").mkdir()
+    (tmp_path / "d2").mkdir()
+    original = write_mrc(tmp_path / "d1" / "tomo.mrc", gen.random((8, 8, 8)).astype(np.float32))
+    copy = str(tmp_path / "d2" / "renamed.mrc")
+    shutil.copy(original, copy)
+    different = write_mrc(tmp_path / "d2" / "tomo.mrc", gen.random((8, 8, 8)).astype(np.float32))
+
+    tomo_set = tomogram_datasets.SCTomogramSet()
+    tomo_set.extend([annotated(original, [1, 2, 3]), annotated(copy, [4, 5, 6])], private=False)
+    tomo_set.append(annotated(different, [7, 7, 7]), private=False)
+
+    # The renamed copy was combined; the tomogram with the same name was not
+    assert sorted(tomo_set.tomograms) == ["tomo", "tomo~1"]
+    assert sorted(tomo_set.aliases["tomo"]) == sorted([original, copy])
+    assert len(tomo_set.tomograms["tomo"].annotation_points()) == 2
+    assert tomo_set.tomograms["tomo~1"].filepath == different
+
+def test_label_dedupe(tmp_path):
+    (tmp_path / "d1").mkdir()
+    (tmp_path / "d2").mkdir()
+    a = write_mrc(tmp_path / "d1" / "tomo.mrc", np.zeros((4, 4, 4), dtype=np.float32))
+    b = write_mrc(tmp_path / "d2" / "tomo.mrc", np.ones((4, 4, 4), dtype=np.float32))
+
+    tomo_set = tomogram_datasets.SCTomogramSet(dedupe="label")
+    tomo_set.append(annotated(a, [1, 1, 1]), private=True)
+    tomo_set.append(annotated(b, [2, 2, 2]), private=False)
+    assert list(tomo_set.tomograms) == ["tomo"]
+    assert tomo_set.private["tomo"] is False
+
+def test_duplicate_annotations_merge(tmp_path):
+    (tmp_path / "d1").mkdir()
+    (tmp_path / "d2").mkdir()
+    original = write_mrc(tmp_path / "d1" / "tomo.mrc", np.zeros((8, 8, 8), dtype=np.float32))
+    copy = str(tmp_path / "d2" / "tomo.mrc")
+    shutil.copy(original, copy)
+    first = tomogram_datasets.TomogramFile(original, [
+        tomogram_datasets.Annotation([
+            np.array([10, 10, 10]), np.array([11, 10, 10]), np.array([40, 40, 40]), np.array([41, 40, 40])
+        ], "motor")
+    ], load=False)
+    second = tomogram_datasets.TomogramFile(copy, [
+        tomogram_datasets.Annotation([np.array([10, 11, 10])], "motor"),
+        tomogram_datasets.Annotation([np.array([10, 10, 10])], "other"),
+    ], load=False)
+
+    tomo_set = tomogram_datasets.SCTomogramSet()
+    tomo_set.extend([first, second], private=False)
+    motor, other = tomo_set.tomograms["tomo"].annotations
+    # Close points from the same file are distinct particles and stay apart
+    np.testing.assert_allclose(motor.points, [[10, 10.5, 10], [11, 10, 10], [40, 40, 40], [41, 40, 40]])
+    assert motor.sources == [tuple(sorted([original, copy])), (original,), (original,), (original,)]
+    # Annotations with different names are never merged
+    assert other.name == "other" and len(other.points) == 1
+
+    # A third copy doesn't merge points that the first file marked apart
+    (tmp_path / "d3").mkdir()
+    third_copy = str(tmp_path / "d3" / "tomo.mrc")
+    shutil.copy(original, third_copy)
+    third = tomogram_datasets.TomogramFile(third_copy, [
+        tomogram_datasets.Annotation([np.array([90, 90, 90])], "motor"),
+    ], load=False)
+    tomo_set.extend([third], private=False)
+    motor = tomo_set.tomograms["tomo"].annotations[0]
+    np.testing.assert_allclose(motor.points, [[10, 10.5, 10], [11, 10, 10], [40, 40, 40], [41, 40, 40], [90, 90, 90]])
+    assert motor.sources[-1] == (third_copy,)
+
+def test_compact_pickling(tmp_path):
+    path = write_mrc(tmp_path / "tomo.mrc", np.ones((64, 64, 64), dtype=np.float32))
+    tomo = annotated(path, [1, 2, 3])
+    tomo.load(preprocess=False)
+    tomo_set = tomogram_datasets.SCTomogramSet()
+    tomo_set.append(tomo, private=False)
+    tomo_set.metadata()
+
+    pickled = pickle.dumps(tomo_set)
+    # Only the path, header and annotations are sent, not the data
+    assert len(pickled) < 8192
+    copy = pickle.loads(pickled)
+    copied = copy.tomograms["tomo"]
+    assert copied.data is None and copied.shape == (64, 64, 64)
+    assert copied.header.nx == 64 and copied._fingerprints == tomo._fingerprints
+    np.testing.assert_array_equal(copied.annotation_points(), [[1, 2, 3]])
+    np.testing.assert_array_equal(copied.get_data(preprocess=False), tomo.data)
+
+def test_full_fingerprint(tmp_path):
+    path = write_mrc(tmp_path / "tomo.mrc", np.zeros((4, 4, 4), dtype=np.float32))
+    tomo = tomogram_datasets.TomogramFile(path, load=False)
+    assert tomo.fingerprint() != tomo.fingerprint(full=True)
+    assert tomo.fingerprint(full=True) == tomogram_datasets.TomogramFile(path, load=False).fingerprint(full=True)
+
+def tomogram_max(tomo):
+    """ Module-level, so that it can be sent to worker processes. """
+    if tomo.shape[0] == 3:
+        raise ValueError("Refusing to process this tomogram")
+    return float(tomo.get_data(preprocess=False).max())
+
+def test_map_and_reduce(tmp_path):
+    tomo_set = tomogram_datasets.SCTomogramSet()
+    for i, depth in enumerate([4, 5, 3]):
+        path = write_mrc(tmp_path / f"t{i}.mrc", np.full((depth, 4, 4), i, dtype=np.float32))
+        tomo_set.append(tomogram_datasets.TomogramFile(path, load=False), private=False)
+
+    mapped = tomo_set.map(tomogram_max, workers=2, retries=1, progress=False)
+    assert list(mapped.failures) == ["t2"]
+    assert mapped.failures["t2"].attempts == 2
+    assert mapped.results == {"t0": 0.0, "t1": 1.0}
+
+    total = tomo_set.reduce(
+        tomogram_max, lambda a, b: a + b, 0.0, labels=["t0", "t1"], workers=1, progress=False
+    )
+    assert total == 1.0
+
+def make_archive(root):
+    """ 
+    Two sources: annotated and unannotated tomograms in `ab####` directories,
+    with a copy of one annotated tomogram among another source's files.
+    """
+    gen = np.random.default_rng(1)
+    for i in range(6):
+        directory = root / "drive" / f"ab{i:04d}"
+        directory.mkdir(parents=True)
+        write_mrc(directory / f"tomo_{i}.mrc", gen.random((4, 4, 4)).astype(np.float32))
+        if i % 2 == 0:
+            (directory / "motor.ndjson").write_text(
+                f'{{"type": "orientedPoint", "location": {{"x": {i}, "y": 1, "z": 2}}}}\n'
+            )
+    (root / "flat").mkdir()
+    shutil.copy(root / "drive" / "ab0000" / "tomo_0.mrc", root / "flat" / "copy.mrc")
+    write_mrc(root / "flat" / "other.mrc", gen.random((4, 4, 4)).astype(np.float32))
+
+def archive_sources(root):
+    import re
+    from tomogram_datasets.supercomputer_utils import DiscoverySource
+    dir_regex = re.compile(r"ab\d{4}")
+    tomogram_regex = re.compile(r".*\.mrc$")
+    motor = [re.compile(r"^motor\.ndjson$")]
+    return [
+        DiscoverySource(str(root / "drive"), tomogram_regex, motor, ["motor"], dir_regex=dir_regex),
+        DiscoverySource(str(root / "drive"), tomogram_regex, motor, dir_regex=dir_regex, annotated=False, private=True),
+        DiscoverySource(str(root / "flat"), tomogram_regex, annotated=False, private=True),
+    ]
+
+def test_sharded_discovery(tmp_path):
+    import multiprocessing
+    from tomogram_datasets.supercomputer_utils import discover_shard, merge_manifests
+
+    make_archive(tmp_path)
+    sources = archive_sources(tmp_path)
+    serial = merge_manifests([discover_shard(str(tmp_path / "serial"), sources, task_id=0, count=1)])
+
+    count = 3
+    processes = [
+        multiprocessing.Process(target=discover_shard, args=(str(tmp_path / "sharded"), sources), kwargs={"task_id": i, "count": count})
+        for i in range(count)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+    manifests = sorted(str(path) for path in (tmp_path / "sharded").iterdir())
+    assert len(manifests) == count
+    sharded = merge_manifests(manifests)
+
+    assert sorted(sharded.tomograms) == sorted(serial.tomograms)
+    assert sharded.private == serial.private
+    assert sharded.aliases == serial.aliases
+    # The copy was combined with the annotated public original
+    assert sorted(sharded.tomograms) == ["other", "tomo_0", "tomo_1", "tomo_2", "tomo_3", "tomo_4", "tomo_5"]
+    assert len(sharded.aliases["tomo_0"]) == 2 and not sharded.private["tomo_0"]
+    assert len(sharded.get_annotated_public_tomograms()) == 3
+    assert np.array_equal(sharded.tomograms["tomo_2"].annotation_points()[0], [2, 2, 1])
+
+    with pytest.raises(ValueError):
+        merge_manifests(manifests[:2])
+
+def test_discovery_with_annotation_store(tmp_path, monkeypatch):
+    from tomogram_datasets.supercomputer_utils import discover_shard, merge_manifests
+
+    make_archive(tmp_path)
+    sources = archive_sources(tmp_path)
+    parsed = merge_manifests([discover_shard(str(tmp_path / "parsed"), sources, task_id=0, count=1)])
+    store_path = str(tmp_path / "annotations.tdstore")
+    parsed.annotation_store(store_path)
+    # A tomogram added after the store was saved
+    directory = tmp_path / "drive" / "ab0006"
+    directory.mkdir()
+    write_mrc(directory / "tomo_6.mrc", np.full((4, 4, 4), 6, dtype=np.float32))
+    (directory / "motor.ndjson").write_text('{"type": "orientedPoint", "location": {"x": 6, "y": 1, "z": 2}}\n')
+
+    read = []
+    original_init = tomogram_datasets.AnnotationFile.__init__
+    def recording_init(self, filepath, name=None):
+        read.append(filepath)
+        original_init(self, filepath, name)
+    monkeypatch.setattr(tomogram_datasets.AnnotationFile, "__init__", recording_init)
+    manifest = discover_shard(str(tmp_path / "deferred"), sources, task_id=0, count=1, parse_annotations=False)
+    assert read == []
+    tomo_set = merge_manifests([manifest], annotation_store=store_path)
+    # Only the new tomogram's annotation file is read
+    assert read == [str(directory / "motor.ndjson")]
+    for label in parsed.tomograms:
+        np.testing.assert_array_equal(
+            np.reshape(tomo_set.tomograms[label].annotation_points(), (-1, 3)),
+            np.reshape(parsed.tomograms[label].annotation_points(), (-1, 3))
+        )
+    np.testing.assert_array_equal(tomo_set.tomograms["tomo_6"].annotation_points(), [[2, 6, 1]])
@@ -0,0 +1,62 @@
+import os
+
+import numpy as np
+
+import tomogram_datasets
+from tomogram_datasets.thumbnails import Thumbnails, compute_thumbnails, tomogram_thumbnails
+from conftest import write_mrc
+
+gen = np.random.default_rng()
+
+def test_projections_match_full_volume():
+    volume = gen.random((21, 30, 40)).astype(np.float32)
+    thumbnails = compute_thumbnails(volume, size=20, slab_depth=6, block_depth=4)
+    assert thumbnails.binning == 2
+    assert thumbnails.slab_bounds == (7, 13)
+    assert thumbnails.images["max_z"].shape == (15, 20)
+    assert thumbnails.images["mean_x"].shape == (11, 15)
+
+    # Undo the 8-bit stretch and compare with projections of the whole volume
+    def restored(name):
+        low, high = thumbnails.limits[name]
+        return thumbnails.images[name] / 255 * (high - low) + low
+    step = 1.01 * np.array([np.subtract(*thumbnails.limits[n][::-1]) / 255 for n in ("max_y", "slab")])
+    max_y = volume.max(axis=1)[:, :40].reshape(21, 20, 2).max(axis=2)
+    expected = np.stack([max_y[i : i + 2].max(axis=0) for i in range(0, 21, 2)])
+    inside = (expected > thumbnails.limits["max_y"][0]) & (expected < thumbnails.limits["max_y"][1])
+    assert np.all(np.abs(restored("max_y") - expected)[inside] <= step[0])
+    slab = volume[7:13].mean(axis=0).reshape(15, 2, 20, 2).mean(axis=(1, 3))
+    inside = (slab > thumbnails.limits["slab"][0]) & (slab < thumbnails.limits["slab"][1])
+    assert np.all(np.abs(restored("slab") - slab)[inside] <= step[1])
+
+def test_overlay_and_cache(tmp_path):
+    path = write_mrc(tmp_path / "tomo.mrc", gen.random((16, 32, 32)).astype(np.float32))
+    annotation = tomogram_datasets.Annotation([np.array([8, 4.5, 10.5]), np.array([0, 1, 1])], "motor")
+    tomo = tomogram_datasets.TomogramFile(path, [annotation], load=False)
+
+    cache = str(tmp_path / "cache")
+    thumbnails = tomogram_thumbnails(tomo, cache, size=16, slab_depth=4)
+    assert thumbnails.binning == 2
+    np.testing.assert_allclose(thumbnails.overlay("max_z"), [[2, 5], [0.25, 0.25]])
+    np.testing.assert_allclose(thumbnails.overlay("mean_y"), [[3.75, 5], [-0.25, 0.25]])
+    # Only the first point is within the central slab
+    np.testing.assert_allclose(thumbnails.overlay("slab"), [[2, 5]])
+
+    # The images, not the points, are cached under the fingerprint
+    assert len(os.listdir(cache)) == 1
+    cached = Thumbnails.load(os.path.join(cache, os.listdir(cache)[0]))
+    assert cached.limits == thumbnails.limits
+    for name, image in thumbnails.images.items():
+        np.testing.assert_array_equal(cached.images[name], image)
+
+def test_set_thumbnails(tmp_path):
+    tomo_set = tomogram_datasets.SCTomogramSet()
+    for i in range(3):
+        path = write_mrc(tmp_path / f"t{i}.mrc", gen.random((8, 16, 16)).astype(np.float32))
+        tomo_set.append(tomogram_datasets.TomogramFile(path, load=False), private=False)
+    cache = str(tmp_path / "cache")
+    thumbnails = tomo_set.thumbnails(cache, size=8, workers=2, progress=False)
+    assert list(thumbnails) == ["t0", "t1", "t2"]
+    assert all(t.images["mean_z"].shape == (8, 8) for t in thumbnails.values())
+    again = tomo_set.thumbnails(cache, size=8, workers=2, progress=False)
+    np.testing.assert_array_equal(again["t1"].images["slab"], thumbnails["t1"].images["slab"])
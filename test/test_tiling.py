@@ -0,0 +1,61 @@
+import pytest
+
+import numpy as np
+import mrcfile
+
+import tomogram_datasets
+from tomogram_datasets.tiling import tile_lower_bounds
+
+# Random number generator
+gen = np.random.default_rng()
+
+def test_tile_lower_bounds_cover():
+    shape = (50, 100, 200)
+    vol_shape = (16, 32, 64)
+    overlap = (4, 8, 16)
+    bounds = tile_lower_bounds(shape, vol_shape, overlap)
+
+    covered = np.zeros(shape, dtype=bool)
+    for z, y, x in bounds:
+        covered[z : z + 16, y : y + 32, x : x + 64] = True
+    assert covered.all()
+    # Last tiles are flush against the far edges
+    assert np.allclose(bounds.max(axis=0), np.array(shape) - np.array(vol_shape))
+
+def test_tile_lower_bounds_too_large():
+    with pytest.raises(ValueError):
+        tile_lower_bounds((10, 10, 10), (11, 4, 4))
+
+@pytest.mark.parametrize("blend", ["linear", "constant"])
+def test_tiles_roundtrip(blend):
+    data = gen.random(size=(30, 40, 50)).astype(np.float32)
+    tomo = tomogram_datasets.Tomogram(data)
+    vol_shape = (16, 16, 16)
+    overlap = (6, 4, 2)
+
+    accumulator = tomogram_datasets.TileAccumulator(tomo.shape, vol_shape, overlap, blend=blend)
+    n_tiles = 0
+    for bounds, tiles in tomo.tiles(vol_shape, overlap, batch_size=5):
+        assert len(bounds) <= 5
+        assert tiles.shape[1:] == vol_shape
+        accumulator.add_batch(bounds, tiles)
+        n_tiles += len(bounds)
+    assert n_tiles == len(tomo.tile_bounds(vol_shape, overlap))
+    # Blending identical overlapping tiles gives back the original volume
+    assert np.allclose(accumulator.result(), data, atol=1e-5)
+
+def test_tiles_from_unloaded_file(tmp_path):
+    path = str(tmp_path / "tomo.mrc")
+    data = gen.integers(-100, 100, size=(20, 24, 28)).astype(np.int16)
+    with mrcfile.new(path) as mrc:
+        mrc.set_data(data)
+
+    tomo = tomogram_datasets.TomogramFile(path, load=False)
+    tomo.intensity_limits = (-50, 50)
+    stretched = tomogram_datasets.TomogramFile.contrast_stretch(data, (-50, 50))
+    for bounds, tiles in tomo.tiles((10, 12, 14), batch_size=3):
+        for (z, y, x), tile in zip(bounds, tiles):
+            # Tiles are stretched like the loaded data would be
+            np.testing.assert_allclose(tile, stretched[z : z + 10, y : y + 12, x : x + 14])
+    # Tiling should not have loaded the tomogram
+    assert tomo.data is None
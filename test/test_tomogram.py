@@ -36,6 +36,11 @@ def test_add_annotation(sample_tomo):
     sample_tomo.add_annotation(tomogram_datasets.Annotation(np.array([0, 1, 2]), "addition"))
     assert n_anns + 1 == len(sample_tomo.annotations)
 
+def test_extra_attributes(sample_tomo):
+    # Tomograms accept attributes beyond their slots
+    sample_tomo.name = "sample"
+    assert sample_tomo.name == "sample"
+
 def test_annotation_points(sample_tomo):
     n_anns = len(sample_tomo.annotations)
     if n_anns == 0:
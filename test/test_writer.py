@@ -0,0 +1,74 @@
+import os
+
+import numpy as np
+import mrcfile
+import pytest
+
+import tomogram_datasets
+from tomogram_datasets.subtomogram import Subtomogram
+from tomogram_datasets.writer import MrcWriter, write_subtomograms
+from conftest import write_mrc
+
+gen = np.random.default_rng()
+
+def test_writer_blocks_and_stats(tmp_path):
+    data = gen.random((6, 7, 8)).astype(np.float32)
+    path = str(tmp_path / "out.mrc")
+    with MrcWriter(path, data.shape, voxel_size=(2.0, 3.0, 4.0)) as writer:
+        writer.write(data[:4], 0)
+        writer.write_block((4, 0, 0), data[4:, :3])
+        writer.write_block((4, 3, 0), data[4:, 3:])
+        assert not os.path.exists(path)
+    with mrcfile.open(path, permissive=False) as mrc:
+        assert np.array_equal(mrc.data, data)
+        assert np.allclose(mrc.voxel_size.tolist(), (2.0, 3.0, 4.0))
+        assert np.isclose(mrc.header.dmin, data.min())
+        assert np.isclose(mrc.header.dmax, data.max())
+        assert np.isclose(mrc.header.dmean, data.mean())
+        assert np.isclose(mrc.header.rms, data.std(), rtol=1e-4)
+
+def test_writer_abort(tmp_path):
+    path = str(tmp_path / "out.mrc")
+    with pytest.raises(RuntimeError):
+        with MrcWriter(path, (2, 2, 2)):
+            raise RuntimeError()
+    assert os.listdir(tmp_path) == []
+
+def test_write_tomogram_file(tmp_path):
+    data = gen.integers(0, 100, size=(20, 12, 14)).astype(np.int16)
+    tomo = tomogram_datasets.TomogramFile(write_mrc(tmp_path / "in.mrc", data, 7.5), load=False)
+    path = tomo.write_mrc(str(tmp_path / "out.mrc"), np.int16, block_depth=3)
+    with mrcfile.open(path) as mrc:
+        assert mrc.data.dtype == np.int16
+        assert np.array_equal(mrc.data, data)
+        assert np.allclose(mrc.voxel_size.tolist(), 7.5)
+
+def test_write_subtomograms(tmp_path):
+    data = gen.random((20, 30, 40))
+    tomo = tomogram_datasets.TomogramFile(write_mrc(tmp_path / "in.mrc", data.astype(np.float32), 10.0), load=False)
+    tomo.data = data
+    bounds = [np.array([1, 2, 3]), np.array([5, 6, 7])]
+    subs = (Subtomogram(tomo, b, (4, 5, 6)) for b in bounds)
+    paths = write_subtomograms(subs, [str(tmp_path / f"sub_{i}.mrc") for i in range(2)])
+    for b, path in zip(bounds, paths):
+        with mrcfile.open(path) as mrc:
+            z, y, x = b
+            assert np.allclose(mrc.data, data[z : z + 4, y : y + 5, x : x + 6])
+            assert (mrc.header.nzstart, mrc.header.nystart, mrc.header.nxstart) == tuple(b)
+            assert np.allclose(mrc.header.origin.tolist(), (x * 10.0, y * 10.0, z * 10.0))
+
+def test_write_subtomogram_of_unloaded_file(tmp_path):
+    data = gen.random((20, 30, 40)).astype(np.float32)
+    tomo = tomogram_datasets.TomogramFile(write_mrc(tmp_path / "in.mrc", data, 10.0), load=False)
+    inner = Subtomogram(Subtomogram(tomo, (2, 3, 4), (12, 20, 30)), (1, 1, 1), (4, 5, 6))
+    path = inner.write_mrc(str(tmp_path / "sub.mrc"))
+    with mrcfile.open(path) as mrc:
+        # Regions of unloaded files are stretched, like loaded data
+        expected = tomogram_datasets.TomogramFile.contrast_stretch(data[3:7, 4:9, 5:11], tomo.contrast_limits)
+        assert np.allclose(mrc.data, expected)
+        assert (mrc.header.nzstart, mrc.header.nystart, mrc.header.nxstart) == (3, 4, 5)
+    assert tomo.data is None
+
+    bandpass = tomogram_datasets.BandpassFilter(high_resolution=40)
+    filtered = Subtomogram(tomo, (0, 0, 0), (8, 8, 8), bandpass=bandpass)
+    assert filtered.data.shape == (8, 8, 8)
@@ -2,5 +2,59 @@ from .annotation import AnnotationFile
 from .annotation import Annotation
 from .tomogram import TomogramFile
 from .tomogram import Tomogram
+from .tiling import TileAccumulator
 
-from .supercomputer_utils import *
+import importlib
+
+# Names imported from submodules only when they are first accessed, so that
+# `import tomogram_datasets` stays fast in workers that only read tomograms.
+_LAZY_ATTRIBUTES = {
+    'TomogramMetadata': 'metadata',
+    'IntensityStats': 'normalization',
+    'EpochSampler': 'sampling',
+    'QuantizedVolume': 'quantize',
+    'MrcWriter': 'writer',
+    'find_peaks': 'peaks',
+    'evaluate_detections': 'evaluation',
+    'DetectionScore': 'evaluation',
+    'AnnotationStore': 'annotation_store',
+    'BandpassFilter': 'filtering',
+    'Thumbnails': 'thumbnails',
+    'merge_points': 'points',
+    'SharedVolume': 'shared',
+    'SharedTomogram': 'shared',
+    'sweep_shared_volumes': 'shared',
+    'PatchServer': 'server',
+    'PatchClient': 'server',
+    'SCTomogramSet': 'supercomputer_utils',
+    'get_fm_tomogram_set': 'supercomputer_utils',
+    'DiscoverySource': 'supercomputer_utils',
+    'fm_sources': 'supercomputer_utils',
+    'discover_shard': 'supercomputer_utils',
+    'merge_manifests': 'supercomputer_utils',
+    'seek_file': 'supercomputer_utils',
+    'seek_files': 'supercomputer_utils',
+    'seek_dirs': 'supercomputer_utils',
+    'seek_set': 'supercomputer_utils',
+    'seek_annotated_tomos': 'supercomputer_utils',
+    'seek_unannotated_tomos': 'supercomputer_utils',
+}
+
+__all__ = [
+    'AnnotationFile',
+    'Annotation',
+    'TomogramFile',
+    'Tomogram',
+    'TileAccumulator',
+] + list(_LAZY_ATTRIBUTES)
+
+def __getattr__(name: str):
+    if name in _LAZY_ATTRIBUTES:
+        module = importlib.import_module(f'.{_LAZY_ATTRIBUTES[name]}', __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
@@ -2,28 +2,59 @@
 This module provides classes to work with tomogram annotations.
 """
 
-import imodmodel
-import pandas as pd
 import numpy as np
 
 import json
 
 import os 
 
-from imodmodel import ImodModel
+from .instrumentation import file_size, instrument
 
-from typing import List, Optional
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+# pandas and imodmodel are slow to import, so they are imported only when a
+# .mod file is read.
+if TYPE_CHECKING:
+    import pandas as pd
 
 class Annotation:
     """This class represents a tomogram annotation.
 
     Attributes:
-        points (list of numpy.ndarray): Annnotation points
+        points (list of numpy.ndarray): Annnotation points, or an (N, 3) array of them (e.g., from an `AnnotationStore`)
         name (str): Name of this annotation
+        sources (list of tuple of str): For each point, the annotation files (or tomograms) that contributed it, when it was merged from several; otherwise None
+        scores (numpy.ndarray): For each point, a confidence score, e.g., for points picked from a prediction (see `find_peaks`); otherwise None
     """
-    def __init__(self, points: List[np.ndarray], name: Optional[str] = None):
+    def __init__(
+            self,
+            points: List[np.ndarray],
+            name: Optional[str] = None,
+            sources: Optional[List[Tuple[str, ...]]] = None,
+            scores: Optional[np.ndarray] = None
+        ):
         self.points = points
         self.name = "" if name is None else name
+        self.sources = sources
+        self.scores = scores
+
+    def __getstate__(self) -> dict:
+        """ Pickle the points as one packed (N, 3) array instead of a list of small arrays. """
+        state = self.__dict__.copy()
+        try:
+            packed = np.asarray(self.points)
+        except ValueError:
+            # Points of different lengths can't be packed
+            packed = None
+        if packed is not None and packed.ndim == 2:
+            state['points'] = packed
+        return state
+
+    def __setstate__(self, state: dict):
+        if isinstance(state['points'], np.ndarray):
+            # Rows of the packed array, as views rather than copies
+            state['points'] = list(state['points'])
+        self.__dict__.update(state)
 
 class AnnotationFile(Annotation):
     """This class represents an annotation file.
@@ -47,6 +78,7 @@ class AnnotationFile(Annotation):
             IOError: If the file extension is not .mod or .ndjson.
         """
         self.filepath = filepath
+        self._mod_shape = None
         _, extension = os.path.splitext(filepath)
         self.extension = extension
 
@@ -57,6 +89,25 @@ class AnnotationFile(Annotation):
 
         super().__init__(points, name)
 
+    @classmethod
+    def from_points(cls, filepath: str, points: List[np.ndarray], name: Optional[str] = None) -> 'AnnotationFile':
+        """Create an AnnotationFile from points already read, without reading the file again.
+
+        Args:
+            filepath (str): The filepath the points came from.
+            points (list of numpy.ndarray): The annotation points.
+            name (str, optional): The name of this annotation.
+
+        Returns:
+            The annotation.
+        """
+        annotation = cls.__new__(cls)
+        annotation.filepath = filepath
+        annotation.extension = os.path.splitext(filepath)[1]
+        annotation._mod_shape = None
+        Annotation.__init__(annotation, points, name)
+        return annotation
+
     @staticmethod
     def check_ext(filepath: str, ext: str):
         """Ensures that filepath is of a given type.
@@ -73,7 +124,8 @@ class AnnotationFile(Annotation):
             raise IOError(f"Annotation must be a {ext} file.")
 
     @staticmethod
-    def mod_to_pd(filepath: str) -> pd.DataFrame:
+    @instrument(bytes_read=file_size)
+    def mod_to_pd(filepath: str) -> 'pd.DataFrame':
         """Converts a .mod file to a pandas DataFrame.
 
         Args:
@@ -86,6 +138,7 @@ class AnnotationFile(Annotation):
             IOError: If the file extension is not .mod.
         """
         AnnotationFile.check_ext(filepath, ".mod")
+        import imodmodel
         try:
             # First attempt with the 'annotation' parameter
             df = imodmodel.read(filepath, annotation='slicer_angles')
@@ -98,6 +151,7 @@ class AnnotationFile(Annotation):
             return imodmodel.read(filepath)
     
     @staticmethod
+    @instrument(bytes_read=file_size)
     def mod_points(filepath: str) -> List[np.ndarray]:
         """Reads a .mod file and extracts the points it contains.
 
@@ -119,6 +173,7 @@ class AnnotationFile(Annotation):
         return points
     
     @staticmethod
+    @instrument(bytes_read=file_size)
     def ndjson_points(filepath: str) -> List[np.ndarray]:
         """Reads a .ndjson annotation file as stored on the CryoET Data Portal
         and extracts the points it contains.
@@ -141,10 +196,12 @@ class AnnotationFile(Annotation):
                         points.append(point)       
         return points
     
+    @instrument()
     def tomogram_shape_from_mod(self):
         """
         Finds the shape of the parent tomogram of this annotation, if this
-        annotation is a `.mod` file.
+        annotation is a `.mod` file. The `.mod` header is parsed only once;
+        later calls return the cached shape.
         
         Returns:
             Shape of the parent tomogram.
@@ -152,6 +209,9 @@ class AnnotationFile(Annotation):
         Raises:
             IOError: If this annotation is not a .mod file.
         """
-        AnnotationFile.check_ext(self.filepath, ".mod")
-        header = ImodModel.from_file(self.filepath).header
-        return np.array([header.zmax, header.xmax, header.ymax])
+        if self._mod_shape is None:
+            AnnotationFile.check_ext(self.filepath, ".mod")
+            from imodmodel import ImodModel
+            header = ImodModel.from_file(self.filepath).header
+            self._mod_shape = np.array([header.zmax, header.xmax, header.ymax])
+        return self._mod_shape.copy()
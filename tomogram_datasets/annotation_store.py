@@ -0,0 +1,313 @@
+"""
+This module provides a columnar store of every annotation point in a
+collection of tomograms, saved to a single file that is memory-mapped to load.
+
+Each point is one row, and each column is a numpy array: the tomogram and
+annotation it belongs to, its annotation's name, its source file, its (z, y, x)
+coordinates and its score. Rows are sorted by tomogram, then annotation, so the
+points of one tomogram (or one annotation) are a contiguous slice, and the
+annotations attached to tomograms can be views into the store rather than
+lists parsed from `.mod` or `.ndjson` files.
+
+```python
+store = tomogram_set.annotation_store("/path/to/annotations.tdstore")
+# Later, in another process, without reading any annotation files
+store = tomogram_set.load_annotations("/path/to/annotations.tdstore")
+store.tomogram_points("tomo", name="motor")
+```
+"""
+
+import json
+import os
+
+import numpy as np
+
+from .annotation import Annotation, AnnotationFile
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+_MAGIC = b"TDSTORE1"
+# Columns start on multiples of this many bytes
+_ALIGNMENT = 64
+
+def _aligned(offset: int) -> int:
+    return -(-offset // _ALIGNMENT) * _ALIGNMENT
+
+class AnnotationStore:
+    """Every annotation point of a collection of tomograms, one row per point.
+
+    Attributes:
+        labels (list of str): The label of each tomogram.
+        names (list of str): The annotation names, indexed by the `name` column.
+        sources (list of tuple of str): The source files of points, indexed by the `source` column. A merged point may have several.
+        annotations (list of dict): For each annotation, the index of its tomogram, its name index, its file path (or None), and whether it has per-point sources and scores.
+        annotated (numpy.ndarray): Whether each tomogram has annotations at all, as opposed to an empty list.
+        tomogram (numpy.ndarray): The tomogram index of each point.
+        annotation (numpy.ndarray): The annotation index of each point.
+        name (numpy.ndarray): The index into `names` of each point's annotation name.
+        source (numpy.ndarray): The index into `sources` of each point's source, or -1 if it has none.
+        points (numpy.ndarray): An (N, 3) array of points in (z, y, x) voxel coordinates.
+        score (numpy.ndarray): The score of each point, or NaN if it has none.
+    """
+    columns = ('tomogram', 'annotation', 'name', 'source', 'points', 'score')
+
+    def __init__(
+            self,
+            labels: Sequence[str],
+            names: Sequence[str],
+            sources: Sequence[Tuple[str, ...]],
+            annotations: Sequence[Dict[str, Any]],
+            annotated: Sequence[bool],
+            **columns: np.ndarray
+        ):
+        """Initialize an AnnotationStore from precomputed columns.
+
+        Use `AnnotationStore.from_tomograms` to build a store from tomograms,
+        or `AnnotationStore.load` to open a saved one.
+
+        Args:
+            labels (sequence of str): The label of each tomogram.
+            names (sequence of str): The annotation names.
+            sources (sequence of tuple of str): The point sources.
+            annotations (sequence of dict): The description of each annotation.
+            annotated (sequence of bool): Whether each tomogram has annotations.
+            **columns (numpy.ndarray): One array per name in `AnnotationStore.columns`, sorted by tomogram then annotation.
+        """
+        self.labels = list(labels)
+        self.names = list(names)
+        self.sources = [tuple(source) for source in sources]
+        self.annotations = list(annotations)
+        self.annotated = np.asarray(annotated, dtype=bool)
+        for name in self.columns:
+            setattr(self, name, columns[name])
+        self._indices = {label: i for i, label in enumerate(self.labels)}
+        # Rows, and annotations, of each group are contiguous
+        self._tomogram_offsets = np.searchsorted(self.tomogram, np.arange(len(self.labels) + 1))
+        self._annotation_offsets = np.searchsorted(self.annotation, np.arange(len(self.annotations) + 1))
+        annotation_tomograms = np.array([a['tomogram'] for a in self.annotations], dtype=np.int64)
+        self._tomogram_annotations = np.searchsorted(annotation_tomograms, np.arange(len(self.labels) + 1))
+
+    def __repr__(self):
+        return f'<AnnotationStore of {len(self)} points in {len(self.labels)} tomograms>'
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    @property
+    def z(self) -> np.ndarray:
+        """ The z coordinate of each point. """
+        return self.points[:, 0]
+
+    @property
+    def y(self) -> np.ndarray:
+        """ The y coordinate of each point. """
+        return self.points[:, 1]
+
+    @property
+    def x(self) -> np.ndarray:
+        """ The x coordinate of each point. """
+        return self.points[:, 2]
+
+    @classmethod
+    def from_tomograms(cls, tomograms: Sequence, labels: Optional[Sequence[str]] = None) -> 'AnnotationStore':
+        """Collect the annotations of tomograms into a store.
+
+        Args:
+            tomograms (sequence of Tomogram): The tomograms.
+            labels (sequence of str, optional): A label for each tomogram. Defaults to each file's basename.
+
+        Returns:
+            The store, held in memory.
+        """
+        tomograms = list(tomograms)
+        if labels is None:
+            labels = [os.path.splitext(os.path.basename(t.filepath))[0] for t in tomograms]
+        name_ids, source_ids = dict(), dict()
+        annotations = []
+        rows = {name: [] for name in cls.columns}
+        for t, tomo in enumerate(tomograms):
+            for annotation in tomo.annotations or []:
+                a = len(annotations)
+                n = name_ids.setdefault(annotation.name, len(name_ids))
+                filepath = getattr(annotation, 'filepath', None)
+                points = np.asarray(annotation.points, dtype=np.float64).reshape(-1, 3)
+                if annotation.sources is not None:
+                    point_sources = [tuple(source) for source in annotation.sources]
+                else:
+                    point_sources = [None if filepath is None else (filepath,)] * len(points)
+                annotations.append({
+                    'tomogram': t,
+                    'name': n,
+                    'filepath': filepath,
+                    'sources': annotation.sources is not None,
+                    'scores': annotation.scores is not None,
+                })
+                rows['tomogram'].append(np.full(len(points), t, dtype=np.int32))
+                rows['annotation'].append(np.full(len(points), a, dtype=np.int32))
+                rows['name'].append(np.full(len(points), n, dtype=np.int32))
+                rows['source'].append(np.array(
+                    [-1 if s is None else source_ids.setdefault(s, len(source_ids)) for s in point_sources],
+                    dtype=np.int32
+                ))
+                rows['points'].append(points)
+                if annotation.scores is None:
+                    rows['score'].append(np.full(len(points), np.nan, dtype=np.float32))
+                else:
+                    rows['score'].append(np.asarray(annotation.scores, dtype=np.float32).reshape(-1))
+
+        empty = {
+            'tomogram': np.zeros(0, dtype=np.int32), 'annotation': np.zeros(0, dtype=np.int32),
+            'name': np.zeros(0, dtype=np.int32), 'source': np.zeros(0, dtype=np.int32),
+            'points': np.zeros((0, 3)), 'score': np.zeros(0, dtype=np.float32),
+        }
+        columns = {name: np.concatenate(rows[name] + [empty[name]]) for name in cls.columns}
+        return cls(
+            labels, list(name_ids), list(source_ids), annotations,
+            [tomo.annotations is not None for tomo in tomograms], **columns
+        )
+
+    def save(self, filepath: str):
+        """Save the store to a single file, to be memory-mapped by `AnnotationStore.load`.
+
+        The file is a JSON header followed by each column's raw data. It is
+        written under a temporary name and moved into place, so concurrent
+        readers never see a partial file.
+
+        Args:
+            filepath (str): Where to save the store.
+        """
+        arrays = {name: np.ascontiguousarray(getattr(self, name)) for name in self.columns}
+        layout, offset = dict(), 0
+        for name, array in arrays.items():
+            layout[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+            offset = _aligned(offset + array.nbytes)
+        header = json.dumps({
+            'labels': self.labels,
+            'names': self.names,
+            'sources': [list(source) for source in self.sources],
+            'annotations': self.annotations,
+            'annotated': self.annotated.tolist(),
+            'columns': layout,
+        }).encode()
+        data_start = _aligned(len(_MAGIC) + 8 + len(header))
+
+        temp_path = f"{filepath}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as file:
+            file.write(_MAGIC)
+            file.write(np.uint64(len(header)).tobytes())
+            file.write(header)
+            for name, array in arrays.items():
+                file.seek(data_start + layout[name]['offset'])
+                file.write(array.tobytes())
+            # Pad the file to the end of the last column's alignment
+            file.truncate(data_start + offset)
+        os.replace(temp_path, filepath)
+
+    @classmethod
+    def load(cls, filepath: str) -> 'AnnotationStore':
+        """Open a store saved with `AnnotationStore.save`.
+
+        The whole file is memory-mapped once, read-only, and every column is a
+        view into that map, so no points are read until they are used.
+
+        Args:
+            filepath (str): The saved store.
+
+        Returns:
+            The store.
+
+        Raises:
+            IOError: If the file is not an annotation store.
+        """
+        with open(filepath, "rb") as file:
+            if file.read(len(_MAGIC)) != _MAGIC:
+                raise IOError(f"{filepath} is not an annotation store.")
+            length = int(np.frombuffer(file.read(8), dtype=np.uint64)[0])
+            header = json.loads(file.read(length))
+        data_start = _aligned(len(_MAGIC) + 8 + length)
+        mapped = np.memmap(filepath, dtype=np.uint8, mode='r')
+        columns = dict()
+        for name, layout in header['columns'].items():
+            dtype = np.dtype(layout['dtype'])
+            start = data_start + layout['offset']
+            count = int(np.prod(layout['shape']))
+            columns[name] = mapped[start : start + count * dtype.itemsize].view(dtype).reshape(layout['shape'])
+        return cls(
+            header['labels'], header['names'], header['sources'],
+            header['annotations'], header['annotated'], **columns
+        )
+
+    def rows(self, label: str) -> slice:
+        """The rows of a tomogram's points.
+
+        Args:
+            label (str): The tomogram's label.
+
+        Returns:
+            A slice of every column.
+
+        Raises:
+            KeyError: If no tomogram has the label.
+        """
+        i = self._indices[label]
+        return slice(int(self._tomogram_offsets[i]), int(self._tomogram_offsets[i + 1]))
+
+    def tomogram_points(self, label: str, name: Optional[str] = None) -> np.ndarray:
+        """Get the annotation points of a tomogram.
+
+        Args:
+            label (str): The tomogram's label.
+            name (str, optional): Only get points of annotations with this name. Defaults to None, for every point.
+
+        Returns:
+            An (N, 3) array of points, a view into the store if `name` is None.
+        """
+        rows = self.rows(label)
+        points = self.points[rows]
+        if name is None:
+            return points
+        if name not in self.names:
+            return points[:0]
+        return points[self.name[rows] == self.names.index(name)]
+
+    def tomogram_annotations(self, label: str) -> Optional[List[Annotation]]:
+        """Get the annotations of a tomogram, with points that are (N, 3) views into the store.
+
+        Annotations that came from files are AnnotationFiles, but their files
+        are not read.
+
+        Args:
+            label (str): The tomogram's label.
+
+        Returns:
+            The tomogram's annotations, or None if it had none.
+        """
+        i = self._indices[label]
+        if not self.annotated[i]:
+            return None
+        annotations = []
+        for a in range(self._tomogram_annotations[i], self._tomogram_annotations[i + 1]):
+            description = self.annotations[a]
+            rows = slice(int(self._annotation_offsets[a]), int(self._annotation_offsets[a + 1]))
+            points = self.points[rows]
+            name = self.names[description['name']]
+            if description['filepath'] is None:
+                annotation = Annotation(points, name)
+            else:
+                annotation = AnnotationFile.from_points(description['filepath'], points, name)
+            if description['sources']:
+                annotation.sources = [self.sources[s] for s in self.source[rows]]
+            if description['scores']:
+                annotation.scores = self.score[rows]
+            annotations.append(annotation)
+        return annotations
+
+    def attach(self, tomograms: Dict[str, Any]):
+        """Replace the annotations of tomograms with views into the store.
+
+        Args:
+            tomograms (dict): Tomograms by label. Those not in the store are left alone.
+        """
+        for label, tomo in tomograms.items():
+            if label in self._indices:
+                tomo.annotations = self.tomogram_annotations(label)
@@ -0,0 +1,228 @@
+"""
+This module scores point detections, such as those from `find_peaks`, against
+the annotations of tomograms.
+
+A predicted point matches a ground-truth point if they are within a distance
+of each other, and each point is matched at most once. Candidate pairs are
+found with the same grid hashing as `merge_points`, so no distance matrix
+over all points is formed. Matches are then assigned either greedily (highest
+scoring predictions first, or closest pairs first) or optimally (the most
+matches, then the smallest total distance).
+
+```python
+score = evaluate_detections(predicted, tomogram.annotation_points(), max_distance=10)
+score.precision, score.recall, score.f_beta(2)
+
+per_tomogram, total = tomogram_set.evaluate(predictions, max_distance=10, workers=16)
+```
+"""
+
+import numpy as np
+
+from .annotation import Annotation
+from .points import connected_components, neighbor_pairs
+
+from typing import Iterable, Optional, Tuple, Union
+
+class DetectionScore:
+    """Counts of matched and unmatched detections, and the scores derived from them.
+
+    Scores of different tomograms merge by adding their counts, which gives
+    micro-averaged scores over all of them.
+
+    Attributes:
+        true_positives (int): The number of predictions matched to ground truth.
+        false_positives (int): The number of unmatched predictions.
+        false_negatives (int): The number of unmatched ground-truth points.
+        distances (numpy.ndarray): The distance of each match.
+    """
+    def __init__(
+            self,
+            true_positives: int = 0,
+            false_positives: int = 0,
+            false_negatives: int = 0,
+            distances: Optional[np.ndarray] = None
+        ):
+        self.true_positives = int(true_positives)
+        self.false_positives = int(false_positives)
+        self.false_negatives = int(false_negatives)
+        self.distances = np.zeros(0) if distances is None else np.asarray(distances, dtype=np.float64)
+
+    def __repr__(self):
+        return (
+            f'<DetectionScore TP={self.true_positives} FP={self.false_positives} '
+            f'FN={self.false_negatives} F1={self.f_beta():.3f}>'
+        )
+
+    @property
+    def precision(self) -> float:
+        """ The fraction of predictions that were matched. 1 if there were no predictions. """
+        predicted = self.true_positives + self.false_positives
+        return self.true_positives / predicted if predicted else 1.0
+
+    @property
+    def recall(self) -> float:
+        """ The fraction of ground-truth points that were matched. 1 if there were none. """
+        actual = self.true_positives + self.false_negatives
+        return self.true_positives / actual if actual else 1.0
+
+    def f_beta(self, beta: float = 1.0) -> float:
+        """The F-beta score, which weights recall `beta` times as much as precision.
+
+        Args:
+            beta (float, optional): The weight of recall. Defaults to 1, the F1 score.
+
+        Returns:
+            The score, from 0 to 1.
+        """
+        precision, recall = self.precision, self.recall
+        denominator = beta ** 2 * precision + recall
+        return (1 + beta ** 2) * precision * recall / denominator if denominator else 0.0
+
+    def merge(self, other: 'DetectionScore') -> 'DetectionScore':
+        """Add the counts of another score to these.
+
+        Args:
+            other (DetectionScore): The score to add.
+
+        Returns:
+            This score, updated.
+        """
+        self.true_positives += other.true_positives
+        self.false_positives += other.false_positives
+        self.false_negatives += other.false_negatives
+        self.distances = np.concatenate([self.distances, other.distances])
+        return self
+
+    @classmethod
+    def total(cls, scores: Iterable['DetectionScore']) -> 'DetectionScore':
+        """ The sum of many scores. """
+        result = cls()
+        for score in scores:
+            result.merge(score)
+        return result
+
+def _as_points(points) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """ Points and their scores, if any, from an Annotation or an array-like. """
+    if isinstance(points, Annotation):
+        return np.asarray(points.points, dtype=np.float64).reshape(-1, 3), points.scores
+    return np.asarray(points, dtype=np.float64).reshape(-1, 3), None
+
+def _assign_greedy(pairs_p: np.ndarray, pairs_t: np.ndarray, distances: np.ndarray, scores: Optional[np.ndarray]) -> np.ndarray:
+    """ Accept candidate pairs in order of prediction score (or distance), skipping points already matched. """
+    if scores is None:
+        order = np.argsort(distances, kind='stable')
+    else:
+        order = np.lexsort((distances, -np.asarray(scores, dtype=np.float64)[pairs_p]))
+    used_p, used_t = set(), set()
+    accepted = []
+    for index in order:
+        p, t = pairs_p[index], pairs_t[index]
+        if p in used_p or t in used_t:
+            continue
+        used_p.add(p)
+        used_t.add(t)
+        accepted.append(index)
+    return np.array(accepted, dtype=np.intp)
+
+def _assign_optimal(pairs_p: np.ndarray, pairs_t: np.ndarray, distances: np.ndarray, max_distance: float) -> np.ndarray:
+    """
+    Accept the most candidate pairs, then the smallest total distance, solving
+    each connected group of candidates separately.
+    """
+    try:
+        from scipy.optimize import linear_sum_assignment
+    except ImportError as error:
+        raise ImportError('Optimal matching requires scipy. Install it or use method="greedy".') from error
+
+    # Number predictions and truths together so groups can be found
+    offset = int(pairs_p.max()) + 1
+    labels = connected_components(offset + int(pairs_t.max()) + 1, pairs_p, pairs_t + offset)[pairs_p]
+    accepted = []
+    for label in np.unique(labels):
+        members = np.flatnonzero(labels == label)
+        rows, row_index = np.unique(pairs_p[members], return_inverse=True)
+        cols, col_index = np.unique(pairs_t[members], return_inverse=True)
+        # Pairs that aren't candidates cost more than any set of candidates
+        penalty = max_distance * (min(len(rows), len(cols)) + 1) + 1
+        cost = np.full((len(rows), len(cols)), float(penalty))
+        cost[row_index, col_index] = distances[members]
+        pair_of = np.full((len(rows), len(cols)), -1)
+        pair_of[row_index, col_index] = members
+        r, c = linear_sum_assignment(cost)
+        chosen = pair_of[r, c]
+        accepted.append(chosen[chosen >= 0])
+    return np.concatenate(accepted) if accepted else np.zeros(0, dtype=np.intp)
+
+def match_points(
+        predicted: Union[np.ndarray, Annotation],
+        truth: Union[np.ndarray, Annotation],
+        max_distance: float,
+        *,
+        method: str = "greedy"
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Match predicted points to ground-truth points.
+
+    Args:
+        predicted (numpy.ndarray or Annotation): An (N, 3) array of predicted points, or an Annotation. If the Annotation has `scores`, greedy matching takes higher-scoring predictions first.
+
+        truth (numpy.ndarray or Annotation): An (M, 3) array of ground-truth points, or an Annotation.
+
+        max_distance (float): The largest distance between matched points, in voxels.
+
+        method (str, optional): "greedy" or "optimal" (which requires scipy). Defaults to "greedy".
+
+    Returns:
+        The indices of the matched predictions, the indices of the ground-truth points they match, and the distance of each match.
+
+    Raises:
+        ValueError: If `method` is unknown.
+    """
+    if method not in ("greedy", "optimal"):
+        raise ValueError(f'Unknown matching method "{method}". Use "greedy" or "optimal".')
+    predicted, scores = _as_points(predicted)
+    truth, _ = _as_points(truth)
+    n = len(predicted)
+
+    i, j = neighbor_pairs(np.concatenate([predicted, truth]), max_distance)
+    # Only pairs of one prediction and one ground-truth point are candidates
+    cross = (i < n) & (j >= n)
+    pairs_p, pairs_t = i[cross], j[cross] - n
+    distances = np.linalg.norm(predicted[pairs_p] - truth[pairs_t], axis=1)
+    if len(pairs_p) == 0:
+        empty = np.zeros(0, dtype=np.intp)
+        return empty, empty, np.zeros(0)
+
+    if method == "greedy":
+        accepted = _assign_greedy(pairs_p, pairs_t, distances, scores)
+    else:
+        accepted = _assign_optimal(pairs_p, pairs_t, distances, max_distance)
+    return pairs_p[accepted], pairs_t[accepted], distances[accepted]
+
+def evaluate_detections(
+        predicted: Union[np.ndarray, Annotation],
+        truth: Union[np.ndarray, Annotation],
+        max_distance: float,
+        *,
+        method: str = "greedy"
+    ) -> DetectionScore:
+    """Score predicted points against ground-truth points. See `match_points`.
+
+    Args:
+        predicted (numpy.ndarray or Annotation): The predicted points.
+
+        truth (numpy.ndarray or Annotation): The ground-truth points.
+
+        max_distance (float): The largest distance between matched points, in voxels.
+
+        method (str, optional): "greedy" or "optimal". Defaults to "greedy".
+
+    Returns:
+        The counts of matched and unmatched points.
+    """
+    n_predicted = len(_as_points(predicted)[0])
+    n_truth = len(_as_points(truth)[0])
+    matched, _, distances = match_points(predicted, truth, max_distance, method=method)
+    return DetectionScore(
+        len(matched), n_predicted - len(matched), n_truth - len(matched), distances
+    )
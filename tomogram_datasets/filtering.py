@@ -0,0 +1,267 @@
+"""
+This module provides Fourier bandpass filtering of tomograms and subtomograms.
+
+Filters are specified by resolution in Ångstroms and applied with real FFTs in
+single precision. The filter's transfer function depends only on the shape and
+voxel spacing of what is filtered, so it is computed once per shape and
+spacing and cached, within a memory budget. Large volumes are filtered in blocks of sections with
+overlapping margins (overlap-save), so the full volume is never transformed at
+once, and batches of equally shaped subtomograms are filtered together in one
+transform.
+
+```python
+bandpass = BandpassFilter(low_resolution=300, high_resolution=40)
+tomogram = TomogramFile(filepath, bandpass=bandpass)  # Filtered, then stretched
+generator.bandpass = bandpass  # Subtomograms are filtered when their data is read
+```
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from typing import Iterable, Optional, Sequence, Tuple, Union
+
+def _fft():
+    """ `scipy.fft`, which can use several threads, if it is installed; otherwise `numpy.fft`. """
+    try:
+        import scipy.fft
+        return scipy.fft, {'workers': -1}
+    except ImportError:
+        return np.fft, {}
+
+def _spacing_zyx(spacing: Optional[Union[float, Sequence[float]]]) -> Optional[Tuple[float, float, float]]:
+    """ A voxel spacing in (x, y, z) order, or a scalar, as a (z, y, x) tuple. """
+    if spacing is None:
+        return None
+    if np.ndim(spacing) == 0:
+        spacing = (spacing,) * 3
+    spacing = tuple(float(s) for s in reversed(tuple(spacing)))
+    if not all(s > 0 for s in spacing):
+        # Unknown spacing (e.g., a header without a cell size)
+        return None
+    return spacing
+
+def _cosine_edge(radius: np.ndarray, cutoff: float, falloff: float) -> np.ndarray:
+    """ 1 below `cutoff` and 0 above it, with a raised-cosine edge `falloff * cutoff` wide. """
+    if falloff <= 0:
+        return (radius <= cutoff).astype(np.float32)
+    t = np.clip((radius - cutoff * (1 - falloff / 2)) / (cutoff * falloff), 0, 1)
+    return (0.5 * (1 + np.cos(np.pi * t))).astype(np.float32)
+
+# Kernels are cached up to this many bytes in total. The most recent kernel is
+# always kept, however large, so blocks of one volume share it.
+KERNEL_CACHE_BYTES = 256 * 2 ** 20
+_kernel_cache: 'OrderedDict[tuple, np.ndarray]' = OrderedDict()
+_kernel_lock = threading.Lock()
+
+def _compute_kernel(
+        shape: Tuple[int, int, int],
+        spacing: Tuple[float, float, float],
+        low_frequency: Optional[float],
+        high_frequency: Optional[float],
+        falloff: float
+    ) -> np.ndarray:
+    """ The transfer function of a bandpass filter, in the layout of `rfftn`'s output. """
+    fz, fy = (np.fft.fftfreq(n, d).astype(np.float32) for n, d in zip(shape[:2], spacing[:2]))
+    fx = np.fft.rfftfreq(shape[2], spacing[2]).astype(np.float32)
+    # Sum the squared frequencies of each axis, then take the root in place
+    radius = np.square(fy)[:, None] + np.square(fx)[None, :]
+    radius = np.square(fz)[:, None, None] + radius[None, :, :]
+    np.sqrt(radius, out=radius)
+    kernel = np.ones(radius.shape, dtype=np.float32)
+    if high_frequency is not None:
+        kernel *= _cosine_edge(radius, high_frequency, falloff)
+    if low_frequency is not None:
+        kernel *= 1 - _cosine_edge(radius, low_frequency, falloff)
+    kernel.flags.writeable = False
+    return kernel
+
+def _kernel(
+        shape: Tuple[int, int, int],
+        spacing: Tuple[float, float, float],
+        low_frequency: Optional[float],
+        high_frequency: Optional[float],
+        falloff: float
+    ) -> np.ndarray:
+    """ The cached transfer function of a bandpass filter. See `KERNEL_CACHE_BYTES`. """
+    key = (shape, spacing, low_frequency, high_frequency, falloff)
+    with _kernel_lock:
+        kernel = _kernel_cache.get(key)
+        if kernel is not None:
+            _kernel_cache.move_to_end(key)
+            return kernel
+    kernel = _compute_kernel(shape, spacing, low_frequency, high_frequency, falloff)
+    with _kernel_lock:
+        _kernel_cache[key] = kernel
+        _kernel_cache.move_to_end(key)
+        total = sum(cached.nbytes for cached in _kernel_cache.values())
+        # Evict the least recently used kernels
+        while total > KERNEL_CACHE_BYTES and len(_kernel_cache) > 1:
+            _, evicted = _kernel_cache.popitem(last=False)
+            total -= evicted.nbytes
+    return kernel
+
+def _reflect(indices: np.ndarray, n: int) -> np.ndarray:
+    """ Reflect indices outside [0, n) back inside, as `numpy.pad(mode="reflect")` does. """
+    if n == 1:
+        return np.zeros_like(indices)
+    period = 2 * (n - 1)
+    indices = np.mod(indices, period)
+    return np.where(indices >= n, period - indices, indices)
+
+class BandpassFilter:
+    """A Fourier bandpass filter, specified by resolution.
+
+    Features larger than `low_resolution` and smaller than `high_resolution`
+    are removed; either limit may be None to make a low-pass or high-pass
+    filter. The edges of the pass band are smoothed with a raised cosine to
+    limit ringing.
+
+    Attributes:
+        low_resolution (float): The largest feature size kept, in Ångstroms, or None.
+        high_resolution (float): The smallest feature size kept, in Ångstroms, or None.
+        spacing (float or tuple of float): The voxel spacing in Ångstroms, in (x, y, z) order, or None to use the spacing of the tomogram being filtered.
+        falloff (float): The width of the pass band's edges, as a fraction of each cutoff frequency.
+    """
+    def __init__(
+            self,
+            low_resolution: Optional[float] = None,
+            high_resolution: Optional[float] = None,
+            *,
+            spacing: Optional[Union[float, Sequence[float]]] = None,
+            falloff: float = 0.2
+        ):
+        """Initialize a BandpassFilter instance.
+
+        Args:
+            low_resolution (float, optional): The largest feature size kept, in Ångstroms. Defaults to None, which keeps all large features.
+
+            high_resolution (float, optional): The smallest feature size kept, in Ångstroms. Defaults to None, which keeps all small features.
+
+            spacing (float or sequence of float, optional): The voxel spacing in Ångstroms, in (x, y, z) order. Defaults to None, which uses the voxel spacing of the tomogram file being filtered, or 1 (i.e., resolutions in voxels) if it is unknown.
+
+            falloff (float, optional): The width of the pass band's edges, as a fraction of each cutoff frequency. Use 0 for sharp edges. Defaults to 0.2.
+        """
+        self.low_resolution = low_resolution
+        self.high_resolution = high_resolution
+        self.spacing = spacing
+        self.falloff = float(falloff)
+
+    def __repr__(self):
+        return f'<BandpassFilter {self.low_resolution}-{self.high_resolution} Å>'
+
+    def _spacing(self, spacing: Optional[Union[float, Sequence[float]]]) -> Tuple[float, float, float]:
+        """ This filter's spacing, else `spacing`, else 1, in (z, y, x) order. """
+        return _spacing_zyx(self.spacing) or _spacing_zyx(spacing) or (1.0, 1.0, 1.0)
+
+    def kernel(self, shape: Sequence[int], spacing: Optional[Union[float, Sequence[float]]] = None) -> np.ndarray:
+        """Get the filter's transfer function for volumes of a shape.
+
+        Kernels are cached by shape and spacing, so filtering many volumes of
+        the same shape computes the kernel once.
+
+        Args:
+            shape (sequence of int): The (z, y, x) shape of the volumes.
+            spacing (float or sequence of float, optional): The voxel spacing in (x, y, z) order, used if the filter has none of its own. Defaults to None.
+
+        Returns:
+            A read-only float32 array in the layout of `rfftn`'s output.
+        """
+        low = 1 / self.low_resolution if self.low_resolution else None
+        high = 1 / self.high_resolution if self.high_resolution else None
+        return _kernel(tuple(int(s) for s in shape), self._spacing(spacing), low, high, self.falloff)
+
+    def __call__(self, volume: np.ndarray, *, spacing: Optional[Union[float, Sequence[float]]] = None) -> np.ndarray:
+        """Filter a volume, or a batch of volumes, in one transform.
+
+        Args:
+            volume (numpy.ndarray): A (z, y, x) volume, or a (B, z, y, x) batch of volumes filtered together.
+            spacing (float or sequence of float, optional): The voxel spacing in (x, y, z) order, used if the filter has none of its own. Defaults to None.
+
+        Returns:
+            The filtered float32 volume or batch.
+        """
+        volume = np.asarray(volume, dtype=np.float32)
+        shape = volume.shape[-3:]
+        fft, options = _fft()
+        spectrum = fft.rfftn(volume, axes=(-3, -2, -1), **options)
+        spectrum *= self.kernel(shape, spacing)
+        return fft.irfftn(spectrum, s=shape, axes=(-3, -2, -1), **options).astype(np.float32, copy=False)
+
+    def default_halo(self, spacing: Optional[Union[float, Sequence[float]]] = None) -> int:
+        """ The number of sections around each block in `apply_blockwise`: the largest resolution limit, in sections. """
+        resolutions = [r for r in (self.low_resolution, self.high_resolution) if r]
+        if not resolutions:
+            return 0
+        return int(np.ceil(max(resolutions) / self._spacing(spacing)[0]))
+
+    def apply_blockwise(
+            self,
+            source: np.ndarray,
+            *,
+            spacing: Optional[Union[float, Sequence[float]]] = None,
+            block_depth: int = 64,
+            halo: Optional[int] = None,
+            out: Optional[np.ndarray] = None
+        ) -> np.ndarray:
+        """Filter a large volume in blocks of sections, by overlap-save.
+
+        Each block is read with `halo` extra sections on either side, filtered,
+        and only its central sections are kept, so block boundaries do not
+        show. Sections beyond the ends of the volume are mirrored. Every block
+        has the same shape, so the kernel is computed once.
+
+        Args:
+            source (numpy.ndarray): The volume, possibly memory-mapped.
+
+            spacing (float or sequence of float, optional): The voxel spacing in (x, y, z) order, used if the filter has none of its own. Defaults to None.
+
+            block_depth (int, optional): The number of sections kept from each block. Defaults to 64.
+
+            halo (int, optional): The number of extra sections read on either side of each block. Defaults to `default_halo()`.
+
+            out (numpy.ndarray, optional): Where to write the result, which must not be `source`. Defaults to None, which allocates a float32 array.
+
+        Returns:
+            The filtered volume.
+        """
+        nz = source.shape[0]
+        if halo is None:
+            halo = self.default_halo(spacing)
+        if out is None:
+            out = np.empty(source.shape, dtype=np.float32)
+        depth = max(1, min(block_depth, nz))
+        for z0 in range(0, nz, depth):
+            indices = _reflect(np.arange(z0 - halo, z0 + depth + halo), nz)
+            filtered = self(np.asarray(source[indices]), spacing=spacing)
+            kept = min(depth, nz - z0)
+            out[z0 : z0 + kept] = filtered[halo : halo + kept]
+        return out
+
+    def filter_subtomograms(self, subtomograms: Iterable) -> list:
+        """Filter the data of many subtomograms, batching those of the same shape and spacing into one transform.
+
+        Each subtomogram's data is replaced by its filtered data.
+
+        Args:
+            subtomograms (iterable of Subtomogram): The subtomograms to filter.
+
+        Returns:
+            The subtomograms, in order.
+        """
+        from .writer import _voxel_size
+
+        subtomograms = list(subtomograms)
+        groups = dict()
+        for index, subtomogram in enumerate(subtomograms):
+            spacing = _voxel_size(subtomogram)
+            key = (tuple(subtomogram.shape), None if spacing is None else tuple(spacing))
+            groups.setdefault(key, []).append(index)
+        for (shape, spacing), indices in groups.items():
+            batch = np.stack([subtomograms[i]._unfiltered_data() for i in indices])
+            filtered = self(batch, spacing=spacing)
+            for i, data in zip(indices, filtered):
+                subtomograms[i].data = data
+        return subtomograms
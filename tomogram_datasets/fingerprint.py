@@ -0,0 +1,88 @@
+"""
+This module provides content fingerprints for tomogram files, used to find
+identical tomograms stored under different names or on different drives.
+
+A fast fingerprint hashes the file size, the 1024-byte MRC header, and a fixed
+number of blocks sampled evenly through the rest of the file, so it costs a few
+small reads no matter how large the file is. A full fingerprint hashes every
+byte.
+"""
+
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from typing import List, Optional, Sequence
+
+# Size of the MRC header, which is always hashed.
+HEADER_SIZE = 1024
+# Number and size of the blocks sampled by fast fingerprints.
+SAMPLE_BLOCKS = 16
+BLOCK_SIZE = 64 * 1024
+# Read size for full fingerprints.
+CHUNK_SIZE = 8 * 1024 * 1024
+
+def fingerprint(filepath: str, *, full: bool = False) -> str:
+    """Compute a content fingerprint of a file.
+
+    Args:
+        filepath (str): The file to fingerprint.
+        full (bool, optional): Whether to hash the whole file rather than sampled blocks. Defaults to False.
+
+    Returns:
+        The fingerprint as a hexadecimal string. Fast and full fingerprints of
+        the same file differ.
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    fd = os.open(filepath, os.O_RDONLY)
+    try:
+        size = os.fstat(fd).st_size
+        hasher.update(f"{'full' if full else 'fast'}:{size}:".encode())
+        if full:
+            offset = 0
+            while offset < size:
+                chunk = os.pread(fd, CHUNK_SIZE, offset)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                offset += len(chunk)
+        else:
+            hasher.update(os.pread(fd, HEADER_SIZE, 0))
+            if size > HEADER_SIZE:
+                last = max(size - BLOCK_SIZE, HEADER_SIZE)
+                offsets = np.unique(np.linspace(HEADER_SIZE, last, SAMPLE_BLOCKS).astype(np.int64))
+                for offset in offsets:
+                    hasher.update(os.pread(fd, BLOCK_SIZE, int(offset)))
+    finally:
+        os.close(fd)
+    return hasher.hexdigest()
+
+def _try_fingerprint(args: tuple) -> Optional[str]:
+    """ Fingerprint a file, or return None if it cannot be read. """
+    filepath, full = args
+    try:
+        return fingerprint(filepath, full=full)
+    except OSError:
+        return None
+
+def fingerprint_files(filepaths: Sequence[str], *, full: bool = False, workers: int = 8) -> List[Optional[str]]:
+    """Fingerprint many files concurrently.
+
+    Reading and hashing release the GIL, so a thread pool keeps several reads
+    in flight at once.
+
+    Args:
+        filepaths (sequence of str): The files to fingerprint.
+        full (bool, optional): Whether to hash whole files rather than sampled blocks. Defaults to False.
+        workers (int, optional): The number of threads. Defaults to 8.
+
+    Returns:
+        The fingerprint of each file, or None for files that cannot be read.
+    """
+    args = [(filepath, full) for filepath in filepaths]
+    if workers <= 1:
+        return [_try_fingerprint(a) for a in args]
+    with ThreadPoolExecutor(workers) as pool:
+        return list(pool.map(_try_fingerprint, args))
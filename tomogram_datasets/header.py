@@ -0,0 +1,86 @@
+"""
+This module reads `.mrc` headers directly, for scanning the metadata of many
+files quickly.
+
+Each header is fetched with a single 1024-byte `pread` and parsed as a numpy
+structured array with `mrcfile`'s header layout, skipping the file object and
+validation that `mrcfile.open` sets up. The result can be used anywhere a header
+from `mrcfile` can, and can be passed to `TomogramFile` so the file is not
+opened again.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from mrcfile.dtypes import HEADER_DTYPE
+from mrcfile.utils import byte_order_from_machine_stamp
+
+from typing import List, Optional, Sequence
+
+def read_header(filepath: str) -> np.recarray:
+    """Read the header of an `.mrc` file.
+
+    Args:
+        filepath (str): The `.mrc` or `.rec` file.
+
+    Returns:
+        The header as a read-only record array, in the file's byte order.
+
+    Raises:
+        ValueError: If the file is too short or is not an MRC file.
+    """
+    fd = os.open(filepath, os.O_RDONLY)
+    try:
+        buffer = os.pread(fd, HEADER_DTYPE.itemsize, 0)
+    finally:
+        os.close(fd)
+    if len(buffer) < HEADER_DTYPE.itemsize:
+        raise ValueError(f"Couldn't read enough bytes for MRC header from {filepath}")
+
+    return parse_header(buffer, filepath)
+
+def parse_header(buffer: bytes, filepath: str = "buffer") -> np.recarray:
+    """Parse the 1024 bytes of an `.mrc` header.
+
+    Args:
+        buffer (bytes): The header's bytes, as stored in the file.
+        filepath (str, optional): Where the bytes came from, for error messages.
+
+    Returns:
+        The header as a read-only record array, in the file's byte order.
+
+    Raises:
+        ValueError: If the bytes are not an MRC header.
+    """
+    header = np.frombuffer(buffer, dtype=HEADER_DTYPE).reshape(()).view(np.recarray)
+    # As in `mrcfile`, only the first three bytes of the map ID are checked
+    if bytes(header.map)[:3] != b'MAP':
+        raise ValueError(f"Map ID string not found in {filepath} - not an MRC file, or file is corrupt")
+    header.dtype = header.dtype.newbyteorder(byte_order_from_machine_stamp(header.machst))
+    return header
+
+def _try_read_header(filepath: str) -> Optional[np.recarray]:
+    """ Read a header, or return None if it cannot be read. """
+    try:
+        return read_header(filepath)
+    except (OSError, ValueError):
+        return None
+
+def read_headers(filepaths: Sequence[str], *, workers: int = 8) -> List[Optional[np.recarray]]:
+    """Read the headers of many `.mrc` files concurrently.
+
+    Reads release the GIL, so a thread pool keeps several in flight at once,
+    which matters most on network file systems.
+
+    Args:
+        filepaths (sequence of str): The `.mrc` or `.rec` files.
+        workers (int, optional): The number of threads. Defaults to 8.
+
+    Returns:
+        The header of each file, or None for files that cannot be read as MRC files.
+    """
+    if workers <= 1:
+        return [_try_read_header(filepath) for filepath in filepaths]
+    with ThreadPoolExecutor(workers) as pool:
+        return list(pool.map(_try_read_header, filepaths))
@@ -0,0 +1,236 @@
+"""
+This module provides opt-in timing and memory instrumentation for the library.
+
+Instrumented functions (tomogram loading and preprocessing, annotation parsing,
+directory discovery, and subtomogram sampling) record their call counts, wall
+time, bytes read from disk, and the sizes of the arrays they return, but only
+while a recording is active. When no recording is active, the only cost is one
+global lookup per call.
+
+```python
+from tomogram_datasets import instrumentation
+
+with instrumentation.recording() as rec:
+    tomo.load()
+print(rec.format_summary())
+rec.export_chrome_trace("trace.json")  # Open in chrome://tracing or Perfetto
+```
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from typing import Any, Callable, Dict, List, Optional
+
+class Event:
+    """A single recorded call.
+
+    Attributes:
+        name (str): Name of the instrumented function or region.
+        start (float): Start time, in seconds since the recording began.
+        duration (float): Wall time of the call in seconds.
+        bytes_read (int): Bytes read from disk during the call, if known.
+        bytes_allocated (int): Size in bytes of the arrays returned by the call.
+        thread (int): Identifier of the thread that made the call.
+    """
+    __slots__ = ('name', 'start', 'duration', 'bytes_read', 'bytes_allocated', 'thread')
+
+    def __init__(self, name: str, start: float, duration: float, bytes_read: int, bytes_allocated: int, thread: int):
+        self.name = name
+        self.start = start
+        self.duration = duration
+        self.bytes_read = bytes_read
+        self.bytes_allocated = bytes_allocated
+        self.thread = thread
+
+class Recording:
+    """A collection of events recorded while instrumentation was enabled.
+
+    Attributes:
+        events (list of Event): The recorded events, in order of completion.
+    """
+    def __init__(self):
+        self.events: List[Event] = []
+        self._origin = time.perf_counter()
+
+    def __repr__(self):
+        return f'<Recording containing {len(self.events)} events>'
+
+    def add(self, name: str, begin: float, end: float, bytes_read: int = 0, bytes_allocated: int = 0):
+        """ Record one call that ran from `begin` to `end` (`time.perf_counter()` values). """
+        self.events.append(Event(
+            name, begin - self._origin, end - begin, bytes_read, bytes_allocated, threading.get_ident()
+        ))
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Aggregate the recorded events by name.
+
+        Returns:
+            A dictionary mapping each name to its call count, total, mean and
+            maximum wall time in seconds, total bytes read, and total bytes
+            allocated.
+        """
+        summary: Dict[str, Dict[str, float]] = {}
+        for event in self.events:
+            entry = summary.setdefault(event.name, {
+                'calls': 0, 'total_s': 0.0, 'max_s': 0.0, 'bytes_read': 0, 'bytes_allocated': 0
+            })
+            entry['calls'] += 1
+            entry['total_s'] += event.duration
+            entry['max_s'] = max(entry['max_s'], event.duration)
+            entry['bytes_read'] += event.bytes_read
+            entry['bytes_allocated'] += event.bytes_allocated
+        for entry in summary.values():
+            entry['mean_s'] = entry['total_s'] / entry['calls']
+        return summary
+
+    def format_summary(self) -> str:
+        """ The summary as a human-readable table, slowest total time first. """
+        lines = [f"{'name':<48}{'calls':>8}{'total s':>12}{'mean s':>12}{'read MB':>10}{'alloc MB':>10}"]
+        summary = self.summary()
+        for name in sorted(summary, key=lambda n: summary[n]['total_s'], reverse=True):
+            entry = summary[name]
+            lines.append(
+                f"{name:<48}{entry['calls']:>8}{entry['total_s']:>12.4f}{entry['mean_s']:>12.6f}"
+                f"{entry['bytes_read'] / 2**20:>10.1f}{entry['bytes_allocated'] / 2**20:>10.1f}"
+            )
+        return "\n".join(lines)
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        """ The events in Chrome's trace event format. """
+        pid = os.getpid()
+        trace_events = [{
+            'name': event.name,
+            'ph': 'X',
+            'ts': event.start * 1e6,
+            'dur': event.duration * 1e6,
+            'pid': pid,
+            'tid': event.thread,
+            'args': {'bytes_read': event.bytes_read, 'bytes_allocated': event.bytes_allocated},
+        } for event in self.events]
+        return {'traceEvents': trace_events, 'displayTimeUnit': 'ms'}
+
+    def export_chrome_trace(self, filepath: str):
+        """Write the events as a Chrome trace JSON file.
+
+        Args:
+            filepath (str): Where to write the trace.
+        """
+        with open(filepath, 'w') as file:
+            json.dump(self.chrome_trace(), file)
+
+# The active recording, or None if instrumentation is disabled.
+_active: Optional[Recording] = None
+
+def enable() -> Recording:
+    """Start recording instrumented calls.
+
+    Returns:
+        The new active recording.
+    """
+    global _active
+    _active = Recording()
+    return _active
+
+def disable() -> Optional[Recording]:
+    """Stop recording instrumented calls.
+
+    Returns:
+        The recording that was active, if any.
+    """
+    global _active
+    recording, _active = _active, None
+    return recording
+
+def is_enabled() -> bool:
+    """ Check if instrumented calls are being recorded. """
+    return _active is not None
+
+class recording:
+    """
+    A context manager that records instrumented calls made inside it. It yields
+    the `Recording`.
+    """
+    def __enter__(self) -> Recording:
+        self._previous = _active
+        return enable()
+
+    def __exit__(self, *exc_info):
+        global _active
+        _active = self._previous
+
+class span:
+    """
+    A context manager that records the code inside it as one event, for
+    instrumenting regions within a function. Does nothing if instrumentation is
+    disabled.
+    """
+    __slots__ = ('name', '_begin')
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        if _active is not None:
+            self._begin = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if _active is not None and hasattr(self, '_begin'):
+            _active.add(self.name, self._begin, time.perf_counter())
+
+def _nbytes(result: Any) -> int:
+    """ Size of the array(s) returned by an instrumented call. """
+    if isinstance(result, np.ndarray):
+        return result.nbytes
+    if isinstance(result, (list, tuple)):
+        return sum(item.nbytes for item in result if isinstance(item, np.ndarray))
+    return 0
+
+def file_size(filepath: str) -> int:
+    """ Size of a file in bytes, or 0 if it cannot be found. """
+    try:
+        return os.path.getsize(filepath)
+    except OSError:
+        return 0
+
+def instrument(
+        name: Optional[str] = None,
+        *,
+        bytes_read: Optional[Callable[..., int]] = None
+    ) -> Callable[[Callable], Callable]:
+    """
+    Decorate a function so that its calls are recorded while instrumentation is
+    enabled.
+
+    Args:
+        name (str, optional): The name to record calls under. Defaults to the function's qualified name.
+
+        bytes_read (callable, optional): Called with the function's arguments to find how many bytes a call reads from disk. Defaults to None, in which case no bytes are recorded as read.
+
+    Returns:
+        The decorator.
+    """
+    def decorator(func: Callable) -> Callable:
+        event_name = func.__qualname__ if name is None else name
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _active is None:
+                return func(*args, **kwargs)
+            begin = time.perf_counter()
+            result = func(*args, **kwargs)
+            end = time.perf_counter()
+            # The recording may have stopped during the call
+            recording = _active
+            if recording is not None:
+                n_read = bytes_read(*args, **kwargs) if bytes_read is not None else 0
+                recording.add(event_name, begin, end, n_read, _nbytes(result))
+            return result
+        return wrapper
+    return decorator
@@ -0,0 +1,173 @@
+"""
+This module provides a columnar table of tomogram metadata that can be filtered
+with vectorized numpy expressions.
+"""
+
+import os
+
+import numpy as np
+
+from .tomogram import TomogramFile
+
+from typing import Callable, List, Optional, Sequence, Union
+
+class TomogramMetadata:
+    """A columnar table of tomogram metadata, one row per tomogram.
+
+    Every column is a numpy array, so subsets can be selected with vectorized
+    boolean expressions:
+
+    ```python
+    meta = tomogram_set.metadata()
+    subset = meta.select((meta.voxel_spacing.max(axis=1) < 15) & (meta.shape[:, 0] >= 300))
+    training_tomograms = subset.tomograms
+    ```
+
+    Attributes:
+        tomograms (list of TomogramFile): The tomogram described by each row.
+        labels (numpy.ndarray): Label of each tomogram.
+        filepath (numpy.ndarray): File path of each tomogram.
+        shape (numpy.ndarray): An (N, 3) array of tomogram shapes.
+        voxel_spacing (numpy.ndarray): An (N, 3) array of voxel spacings in Ångstroms, in (x, y, z) order. NaN where unknown.
+        dtype (numpy.ndarray): Name of the data type stored in each file.
+        file_size (numpy.ndarray): Size of each file in bytes.
+        n_annotations (numpy.ndarray): Number of annotations attached to each tomogram.
+        n_points (numpy.ndarray): Number of annotation points attached to each tomogram.
+        source (numpy.ndarray): Where each tomogram came from, e.g., its drive.
+        private (numpy.ndarray): Whether each tomogram is private.
+    """
+    columns = (
+        'labels', 'filepath', 'shape', 'voxel_spacing', 'dtype', 'file_size',
+        'n_annotations', 'n_points', 'source', 'private'
+    )
+
+    def __init__(self, tomograms: List[TomogramFile], **columns: np.ndarray):
+        """Initialize a TomogramMetadata instance from precomputed columns.
+
+        Use `TomogramMetadata.from_tomograms` to build a table from tomogram
+        files.
+
+        Args:
+            tomograms (list of TomogramFile): The tomogram described by each row.
+            **columns (numpy.ndarray): One array per name in `TomogramMetadata.columns`.
+        """
+        self.tomograms = list(tomograms)
+        for name in self.columns:
+            setattr(self, name, columns[name])
+
+    def __repr__(self):
+        return f'<TomogramMetadata describing {len(self)} tomograms>'
+
+    def __len__(self) -> int:
+        return len(self.tomograms)
+
+    def __getitem__(self, key: Union[str, np.ndarray]) -> Union[np.ndarray, 'TomogramMetadata']:
+        """ Get a column by name, or select rows with a mask or index array. """
+        if isinstance(key, str):
+            if key not in self.columns:
+                raise KeyError(key)
+            return getattr(self, key)
+        return self.select(key)
+
+    @classmethod
+    def from_tomograms(
+            cls,
+            tomograms: Sequence[TomogramFile],
+            *,
+            labels: Optional[Sequence[str]] = None,
+            private: Optional[Sequence[bool]] = None,
+            source: Optional[Callable[[str], str]] = None
+        ) -> 'TomogramMetadata':
+        """Build a metadata table from tomogram files.
+
+        Shapes, spacings and data types come from the headers that
+        `TomogramFile` already read; no tomogram file is opened again.
+
+        Args:
+            tomograms (sequence of TomogramFile): The tomograms to describe.
+            labels (sequence of str, optional): A label for each tomogram. Defaults to each file's basename.
+            private (sequence of bool, optional): Whether each tomogram is private. Defaults to all False.
+            source (callable, optional): Maps a file path to its source, e.g., its drive. Defaults to the file's directory.
+
+        Returns:
+            The metadata table.
+        """
+        tomograms = list(tomograms)
+        n = len(tomograms)
+        if labels is None:
+            labels = [os.path.splitext(os.path.basename(t.filepath))[0] for t in tomograms]
+        if private is None:
+            private = [False] * n
+        if source is None:
+            source = os.path.dirname
+
+        shape = np.zeros((n, 3), dtype=np.int64)
+        voxel_spacing = np.full((n, 3), np.nan)
+        dtype = []
+        file_size = np.zeros(n, dtype=np.int64)
+        n_annotations = np.zeros(n, dtype=np.int64)
+        n_points = np.zeros(n, dtype=np.int64)
+        for i, tomo in enumerate(tomograms):
+            shape[i] = tomo.get_shape()
+            try:
+                spacing = tomo.voxel_spacing_array()
+                # A header without a cell size gives a spacing of 0
+                voxel_spacing[i] = np.where(spacing > 0, spacing, np.nan)
+            except IOError:
+                pass
+            dtype.append(tomo.get_dtype().name)
+            file_size[i] = os.path.getsize(tomo.filepath)
+            annotations = tomo.annotations or []
+            n_annotations[i] = len(annotations)
+            n_points[i] = sum(len(annotation.points) for annotation in annotations)
+
+        return cls(
+            tomograms,
+            labels=np.array(labels, dtype=object),
+            filepath=np.array([t.filepath for t in tomograms], dtype=object),
+            shape=shape,
+            voxel_spacing=voxel_spacing,
+            dtype=np.array(dtype, dtype=object),
+            file_size=file_size,
+            n_annotations=n_annotations,
+            n_points=n_points,
+            source=np.array([source(t.filepath) for t in tomograms], dtype=object),
+            private=np.array(private, dtype=bool),
+        )
+
+    def select(self, rows: np.ndarray) -> 'TomogramMetadata':
+        """Select a subset of rows.
+
+        Args:
+            rows (numpy.ndarray): A boolean mask with one entry per row, or an array of row indices.
+
+        Returns:
+            A new table containing only the selected rows.
+        """
+        rows = np.asarray(rows)
+        if rows.dtype == bool:
+            if len(rows) != len(self):
+                raise ValueError(f"Mask has {len(rows)} entries, expected {len(self)}.")
+            rows = np.flatnonzero(rows)
+        return TomogramMetadata(
+            [self.tomograms[i] for i in rows],
+            **{name: getattr(self, name)[rows] for name in self.columns}
+        )
+
+    def to_pandas(self):
+        """Convert the table to a pandas DataFrame.
+
+        Returns:
+            A DataFrame with one row per tomogram. Shapes and spacings are split into one column per axis.
+        """
+        import pandas as pd
+        frame = {}
+        for name in self.columns:
+            column = getattr(self, name)
+            if name == 'shape':
+                frame.update({'depth': column[:, 0], 'height': column[:, 1], 'width': column[:, 2]})
+            elif name == 'voxel_spacing':
+                frame.update({'spacing_x': column[:, 0], 'spacing_y': column[:, 1], 'spacing_z': column[:, 2]})
+            else:
+                frame[name] = column
+        return pd.DataFrame(frame)
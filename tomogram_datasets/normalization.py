@@ -0,0 +1,203 @@
+"""
+This module computes intensity statistics over whole datasets, for normalizing
+every tomogram with the same contrast limits rather than each with its own.
+
+Statistics are gathered by streaming each tomogram once, one slab at a time,
+into an `IntensityStats`: a histogram over a fixed range together with exact
+counts, moments and extremes. Statistics of different tomograms merge exactly,
+so they can be computed in parallel and combined as they arrive.
+
+```python
+limits = tomogram_set.normalize(workers=16)  # Global 2nd and 98th percentiles
+tomogram = tomogram_set.get_public_tomograms()[0]
+tomogram.get_data()  # Stretched with the global limits
+```
+"""
+
+import numpy as np
+
+from typing import Optional, Sequence, Tuple, Union
+
+class IntensityStats:
+    """Mergeable intensity statistics of one or more volumes.
+
+    Attributes:
+        histogram (numpy.ndarray): Voxel counts in each bin. Values outside `value_range` are counted in the first or last bin.
+        value_range (tuple of float): The (low, high) range covered by the histogram.
+        count (int): The number of voxels.
+        mean (float): The mean intensity.
+        m2 (float): The sum of squared deviations from the mean.
+        minimum (float): The smallest intensity.
+        maximum (float): The largest intensity.
+    """
+    def __init__(self, bins: int, value_range: Tuple[float, float]):
+        """Initialize empty statistics.
+
+        Args:
+            bins (int): The number of histogram bins.
+            value_range (tuple of float): The (low, high) range covered by the histogram.
+        """
+        low, high = (float(v) for v in value_range)
+        if not high > low:
+            high = low + 1.0
+        self.histogram = np.zeros(bins, dtype=np.int64)
+        self.value_range = (low, high)
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = np.inf
+        self.maximum = -np.inf
+
+    def __repr__(self):
+        return f'<IntensityStats of {self.count} voxels in {self.value_range}>'
+
+    @property
+    def variance(self) -> float:
+        return self.m2 / self.count if self.count else np.nan
+
+    @property
+    def std(self) -> float:
+        return float(np.sqrt(self.variance))
+
+    def _merge_moments(self, count: int, mean: float, m2: float):
+        """ Combine moments with Chan et al.'s parallel update. """
+        total = self.count + count
+        if total == 0:
+            return
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta ** 2 * self.count * count / total
+        self.count = total
+
+    def add(self, values: np.ndarray):
+        """Add the voxels of an array, e.g., one slab of a volume.
+
+        Args:
+            values (numpy.ndarray): The intensities to add.
+        """
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if values.size == 0:
+            return
+        low, high = self.value_range
+        bins = len(self.histogram)
+        indices = ((values - low) * (bins / (high - low))).astype(np.int64)
+        np.clip(indices, 0, bins - 1, out=indices)
+        self.histogram += np.bincount(indices, minlength=bins)
+        mean = float(values.mean())
+        self._merge_moments(values.size, mean, float(np.square(values - mean).sum()))
+        self.minimum = min(self.minimum, float(values.min()))
+        self.maximum = max(self.maximum, float(values.max()))
+
+    def merge(self, other: 'IntensityStats') -> 'IntensityStats':
+        """Add the statistics of other volumes to these.
+
+        Args:
+            other (IntensityStats): Statistics with the same bins and range.
+
+        Returns:
+            These statistics, updated.
+
+        Raises:
+            ValueError: If the histograms have different bins or ranges.
+        """
+        if len(other.histogram) != len(self.histogram) or other.value_range != self.value_range:
+            raise ValueError("Only statistics with the same histogram bins and range can be merged.")
+        self.histogram += other.histogram
+        self._merge_moments(other.count, other.mean, other.m2)
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        return self
+
+    def percentile(self, q: Union[float, Sequence[float]]) -> Union[float, np.ndarray]:
+        """Estimate percentiles from the histogram.
+
+        Values are assumed to be spread evenly within each bin, so estimates
+        are accurate to about one bin width.
+
+        Args:
+            q (float or sequence of float): Percentiles between 0 and 100.
+
+        Returns:
+            The estimated intensity at each percentile.
+        """
+        low, high = self.value_range
+        edges = np.linspace(low, high, len(self.histogram) + 1)
+        # Tighten the outer edges to the extremes actually seen
+        edges[0] = min(max(edges[0], self.minimum), edges[1])
+        edges[-1] = max(min(edges[-1], self.maximum), edges[-2])
+        cumulative = np.concatenate([[0], np.cumsum(self.histogram)]) / max(self.count, 1)
+        return np.interp(np.asarray(q, dtype=np.float64) / 100, cumulative, edges)
+
+    def save(self, filepath: str):
+        """Save the statistics to a `.npz` file.
+
+        Args:
+            filepath (str): Where to save the statistics.
+        """
+        np.savez(
+            filepath, histogram=self.histogram, value_range=np.array(self.value_range),
+            moments=np.array([self.count, self.mean, self.m2, self.minimum, self.maximum])
+        )
+
+    @classmethod
+    def load(cls, filepath: str) -> 'IntensityStats':
+        """Load statistics saved with `IntensityStats.save`.
+
+        Args:
+            filepath (str): The `.npz` file.
+
+        Returns:
+            The statistics.
+        """
+        with np.load(filepath) as saved:
+            stats = cls(len(saved['histogram']), tuple(saved['value_range']))
+            stats.histogram = saved['histogram'].astype(np.int64)
+            count, stats.mean, stats.m2, stats.minimum, stats.maximum = (float(v) for v in saved['moments'])
+            stats.count = int(count)
+        return stats
+
+def header_value_range(tomogram) -> Optional[Tuple[float, float]]:
+    """
+    The (minimum, maximum) intensity recorded in a tomogram's `.mrc` header,
+    or None if the header does not record them.
+    """
+    header = getattr(tomogram, 'header', None)
+    if not isinstance(header, np.ndarray):
+        return None
+    low, high = float(header['dmin']), float(header['dmax'])
+    # Writers mark unknown statistics with dmax < dmin, or leave both zero
+    if not np.isfinite([low, high]).all() or high < low or (low == 0 and high == 0):
+        return None
+    return (low, high)
+
+def volume_value_range(source: np.ndarray, *, block_depth: int = 16) -> Tuple[float, float]:
+    """ The minimum and maximum of a volume, read one slab at a time. """
+    low, high = np.inf, -np.inf
+    for z0 in range(0, source.shape[0], block_depth):
+        slab = np.asarray(source[z0 : z0 + block_depth])
+        low = min(low, float(slab.min()))
+        high = max(high, float(slab.max()))
+    return (low, high)
+
+def volume_stats(
+        source: np.ndarray,
+        bins: int,
+        value_range: Tuple[float, float],
+        *,
+        block_depth: int = 16
+    ) -> IntensityStats:
+    """Compute the intensity statistics of a volume, one slab at a time.
+
+    Args:
+        source (numpy.ndarray): The volume, possibly memory-mapped.
+        bins (int): The number of histogram bins.
+        value_range (tuple of float): The range covered by the histogram.
+        block_depth (int, optional): The number of sections read at once. Defaults to 16.
+
+    Returns:
+        The statistics.
+    """
+    stats = IntensityStats(bins, value_range)
+    for z0 in range(0, source.shape[0], block_depth):
+        stats.add(source[z0 : z0 + block_depth])
+    return stats
@@ -0,0 +1,193 @@
+"""
+This module provides helpers to run per-tomogram work across a process pool.
+"""
+
+import os
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Optional, Sequence, Tuple
+
+class Failure:
+    """An item that raised an exception on every attempt.
+
+    Attributes:
+        index (int): The position of the item in the input.
+        error (Exception): The exception raised by the last attempt.
+        attempts (int): The number of attempts made.
+    """
+    __slots__ = ('index', 'error', 'attempts')
+
+    def __init__(self, index: int, error: Exception, attempts: int):
+        self.index = index
+        self.error = error
+        self.attempts = attempts
+
+    def __repr__(self):
+        return f'<Failure of item {self.index} after {self.attempts} attempts: {self.error!r}>'
+
+class MapResult:
+    """The results of mapping a function over keyed items.
+
+    Attributes:
+        results (dict): Results of the items that succeeded, by key.
+        failures (dict): A `Failure` for each item that failed, by key.
+    """
+    def __init__(self):
+        self.results: Dict[Hashable, Any] = dict()
+        self.failures: Dict[Hashable, Failure] = dict()
+
+    def __repr__(self):
+        return f'<MapResult with {len(self.results)} results and {len(self.failures)} failures>'
+
+def iter_process_map(
+        fn: Callable[[Any], Any],
+        items: Sequence[Any],
+        *,
+        workers: Optional[int] = None,
+        weights: Optional[Sequence[float]] = None,
+        retries: int = 0,
+        progress: bool = False,
+        desc: Optional[str] = None
+    ) -> Iterator[Tuple[int, Any]]:
+    """
+    Apply `fn` to every item in a process pool, yielding results as they
+    complete.
+
+    Items with larger weights (e.g., larger files) are submitted first, so that
+    long-running items do not end up alone at the end of the run. An item that
+    raises is retried up to `retries` times; if it still fails, a `Failure` is
+    yielded in place of its result. If a worker process dies, the pool is
+    restarted for the items that were not running, and the items that were
+    running are rerun one at a time, after the others, without being charged
+    an attempt; an item that kills its worker while running alone counts as
+    failing and is retried like any other. At most `workers` items are in
+    flight at once, so a crash only isolates the items that were running.
+
+    Args:
+        fn (callable): A picklable function of one item.
+
+        items (sequence): The items to process. They must be picklable.
+
+        workers (int, optional): The number of worker processes. Use 1 to run in this process. Defaults to None, which uses every CPU.
+
+        weights (sequence of float, optional): The expected cost of each item. Defaults to None, in which case items are submitted in order.
+
+        retries (int, optional): How many times to retry a failed item. Defaults to 0.
+
+        progress (bool, optional): Whether to show a progress bar. Defaults to False.
+
+        desc (str, optional): A description for the progress bar. Defaults to None.
+
+    Yields:
+        Pairs of an item's index in `items` and its result or `Failure`.
+    """
+    items = list(items)
+    order = list(range(len(items))) if weights is None else list(np.argsort(-np.asarray(weights), kind='stable'))
+    if workers is None:
+        workers = os.cpu_count() or 1
+    attempts = [0] * len(items)
+
+    bar = None
+    if progress:
+        from tqdm import tqdm
+        bar = tqdm(total=len(items), desc=desc)
+
+    try:
+        if workers <= 1 or len(items) <= 1:
+            for index in order:
+                while True:
+                    try:
+                        result = fn(items[index])
+                    except Exception as error:
+                        attempts[index] += 1
+                        if attempts[index] <= retries:
+                            continue
+                        result = Failure(index, error, attempts[index])
+                    break
+                if bar is not None:
+                    bar.update()
+                yield index, result
+            return
+
+        queue = deque(order)
+        # Items that were running when a worker died, to be rerun one at a time
+        isolated = deque()
+        while queue or isolated:
+            alone = not queue
+            source = isolated if alone else queue
+            size = 1 if alone else workers
+            pool = ProcessPoolExecutor(size)
+            try:
+                # Only as many items as there are workers are submitted, so the
+                # items in flight when a worker dies are the ones running
+                running = dict()
+                broken = False
+                while running or (source and not broken):
+                    while source and not broken and len(running) < size:
+                        index = source.popleft()
+                        try:
+                            running[pool.submit(fn, items[index])] = index
+                        except BrokenProcessPool:
+                            source.appendleft(index)
+                            broken = True
+                    if not running:
+                        break
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        index = running.pop(future)
+                        try:
+                            result = future.result()
+                        except Exception as error:
+                            crashed = isinstance(error, BrokenProcessPool)
+                            broken = broken or crashed
+                            if crashed and not alone:
+                                # Any running item may have killed the worker; only
+                                # an item that kills one when running alone is charged
+                                isolated.append(index)
+                                continue
+                            attempts[index] += 1
+                            if attempts[index] <= retries:
+                                # Items that are not rerun now wait for the next pool
+                                source.append(index)
+                                continue
+                            result = Failure(index, error, attempts[index])
+                        if bar is not None:
+                            bar.update()
+                        yield index, result
+            finally:
+                pool.shutdown(wait=True, cancel_futures=True)
+    finally:
+        if bar is not None:
+            bar.close()
+
+def process_map(
+        fn: Callable[[Any], Any],
+        items: Sequence[Any],
+        *,
+        workers: Optional[int] = None,
+        weights: Optional[Sequence[float]] = None,
+        retries: int = 0,
+        progress: bool = False,
+        desc: Optional[str] = None
+    ) -> List[Any]:
+    """
+    Apply `fn` to every item in a process pool. See `iter_process_map`.
+
+    Returns:
+        The results, in the same order as `items`.
+
+    Raises:
+        Exception: The error of the first item that failed on every attempt.
+    """
+    results: List[Any] = [None] * len(items)
+    for index, result in iter_process_map(
+            fn, items, workers=workers, weights=weights, retries=retries, progress=progress, desc=desc
+        ):
+        if isinstance(result, Failure):
+            raise result.error
+        results[index] = result
+    return results
@@ -0,0 +1,129 @@
+"""
+This module picks points from prediction volumes, the reverse of reading
+annotation files: a model's per-voxel scores (e.g., a heatmap of motor
+locations) become an `Annotation` of scored points.
+
+Peaks are voxels that score at least a threshold and are the maximum of the
+cube around them; on a flat plateau, only the voxel with the smallest index
+is. The volume is scanned in blocks of sections, each read with
+enough neighboring sections (a halo) that the result does not depend on the
+block size, so memory-mapped volumes far larger than memory can be scanned.
+Blocks are processed concurrently by a thread pool. Finally, non-maximum
+suppression keeps only the highest peak within any `min_distance`.
+
+```python
+scores = TomogramFile("prediction.mrc", load=False).memmap()
+annotation = find_peaks(scores, threshold=0.5, min_distance=10, name="motor")
+annotation.points, annotation.scores
+```
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .annotation import Annotation
+from .points import non_maximum_suppression
+
+from typing import Optional, Tuple
+
+def _maximum_filter(block: np.ndarray, index: np.ndarray, radius: int) -> np.ndarray:
+    """
+    The index of the maximum of the cube of half-width `radius` around each
+    voxel, as a separable filter. Ties go to the smallest index, so each flat
+    plateau has a single maximum. Voxels outside the block are ignored.
+    """
+    value, best = block, index
+    for axis in range(block.ndim):
+        source_value, source_best = value, best
+        value, best = source_value.copy(), source_best.copy()
+        for shift in range(1, min(radius, block.shape[axis] - 1) + 1):
+            ahead = [slice(None)] * block.ndim
+            behind = [slice(None)] * block.ndim
+            ahead[axis] = slice(shift, None)
+            behind[axis] = slice(None, -shift)
+            ahead, behind = tuple(ahead), tuple(behind)
+            for target, origin in ((ahead, behind), (behind, ahead)):
+                candidate_value, candidate_best = source_value[origin], source_best[origin]
+                current_value, current_best = value[target], best[target]
+                better = (candidate_value > current_value) | (
+                    (candidate_value == current_value) & (candidate_best < current_best)
+                )
+                np.copyto(current_value, candidate_value, where=better)
+                np.copyto(current_best, candidate_best, where=better)
+    return best
+
+def _block_peaks(
+        source: np.ndarray,
+        z0: int,
+        z1: int,
+        radius: int,
+        threshold: float
+    ) -> Tuple[np.ndarray, np.ndarray]:
+    """ The local maxima in sections `z0` to `z1` of a volume, and their scores. """
+    low, high = max(0, z0 - radius), min(source.shape[0], z1 + radius)
+    block = np.asarray(source[low:high], dtype=np.float32)
+    interior = block[z0 - low : z1 - low]
+    if not interior.size or interior.max() < threshold:
+        return np.zeros((0, 3), dtype=np.int64), np.zeros(0, dtype=np.float32)
+    # Voxel indices in the whole volume, so ties break the same way in every block
+    _, ny, nx = block.shape
+    index = np.arange(low * ny * nx, high * ny * nx, dtype=np.int64).reshape(block.shape)
+    best = _maximum_filter(block, index, radius)[z0 - low : z1 - low]
+    mask = (interior >= threshold) & (best == index[z0 - low : z1 - low])
+    indices = np.argwhere(mask)
+    indices[:, 0] += z0
+    return indices, interior[mask]
+
+def find_peaks(
+        scores,
+        *,
+        threshold: float = 0.5,
+        min_distance: float = 4,
+        block_depth: int = 32,
+        workers: int = 8,
+        max_peaks: Optional[int] = None,
+        name: Optional[str] = None
+    ) -> Annotation:
+    """Find the peaks of a score volume.
+
+    Args:
+        scores (numpy.ndarray or Tomogram): The score volume, possibly memory-mapped. For a Tomogram, its loaded data, or else a memory map of its raw file, is scanned.
+
+        threshold (float, optional): The lowest score of a peak. Defaults to 0.5.
+
+        min_distance (float, optional): The smallest distance between peaks, in voxels. Each peak is also the maximum of the cube of this half-width around it. Defaults to 4.
+
+        block_depth (int, optional): The number of sections in each block. Defaults to 32.
+
+        workers (int, optional): The number of threads scanning blocks. Defaults to 8.
+
+        max_peaks (int, optional): The most peaks to return, keeping the highest. Defaults to None, for no limit.
+
+        name (str, optional): The name of the annotation. Defaults to None.
+
+    Returns:
+        An Annotation of the peaks in (z, y, x) voxel coordinates, from highest to lowest score, with their `scores`.
+    """
+    if hasattr(scores, '_tile_source'):
+        scores = scores._tile_source()
+    radius = int(min_distance)
+    nz = scores.shape[0]
+    blocks = [(z0, min(z0 + block_depth, nz)) for z0 in range(0, nz, block_depth)]
+
+    def scan(bounds: Tuple[int, int]) -> Tuple[np.ndarray, np.ndarray]:
+        return _block_peaks(scores, bounds[0], bounds[1], radius, threshold)
+
+    if workers <= 1:
+        found = [scan(bounds) for bounds in blocks]
+    else:
+        # numpy releases the GIL while filtering, so blocks run concurrently
+        with ThreadPoolExecutor(workers) as pool:
+            found = list(pool.map(scan, blocks))
+
+    points = np.concatenate([indices for indices, _ in found] + [np.zeros((0, 3), dtype=np.int64)])
+    values = np.concatenate([values for _, values in found] + [np.zeros(0, dtype=np.float32)])
+    kept = non_maximum_suppression(points, values, min_distance)
+    if max_peaks is not None:
+        kept = kept[:max_peaks]
+    return Annotation(list(points[kept].astype(np.float64)), name, scores=values[kept])
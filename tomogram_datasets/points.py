@@ -0,0 +1,247 @@
+"""
+This module provides vectorized operations on sets of annotation points.
+
+Points are (N, 3) arrays. Neighbors are found by grid hashing: each point is
+binned into a cubic cell as wide as the search radius, so a point's neighbors
+can only lie in its own cell or the 26 around it. Cells are matched by sorting
+their keys, so no Python loop runs over points.
+"""
+
+import numpy as np
+
+from typing import Iterable, List, Optional, Sequence, Tuple, Union
+
+# Half of the 26 neighboring cell offsets, plus the cell itself, so that each
+# pair of neighboring cells is visited once.
+_HALF_OFFSETS = np.array([
+    (dz, dy, dx)
+    for dz in (-1, 0, 1) for dy in (-1, 0, 1) for dx in (-1, 0, 1)
+    if (dz, dy, dx) >= (0, 0, 0)
+])
+
+def neighbor_pairs(points: np.ndarray, radius: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Find every pair of points no farther apart than `radius`.
+
+    Args:
+        points (numpy.ndarray): An (N, 3) array of points.
+        radius (float): The largest distance between neighbors. Must be positive.
+
+    Returns:
+        Two arrays `i` and `j` of point indices, with `i < j`, one entry per pair.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    n = len(points)
+    if n < 2:
+        empty = np.zeros(0, dtype=np.intp)
+        return empty, empty
+
+    cells = np.floor(points / radius).astype(np.int64)
+    # Leave a margin of one cell on each side for the neighbor offsets
+    cells -= cells.min(axis=0) - 1
+    dims = cells.max(axis=0) + 2
+    strides = np.array([dims[1] * dims[2], dims[2], 1], dtype=np.int64)
+    keys = cells @ strides
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+
+    all_i, all_j = [], []
+    for offset in _HALF_OFFSETS:
+        neighbor_keys = keys + offset @ strides
+        lo = np.searchsorted(sorted_keys, neighbor_keys, side='left')
+        hi = np.searchsorted(sorted_keys, neighbor_keys, side='right')
+        counts = hi - lo
+        total = int(counts.sum())
+        if total == 0:
+            continue
+        i = np.repeat(np.arange(n), counts)
+        # Positions lo[i], lo[i] + 1, ..., hi[i] - 1 for each point i
+        starts = np.repeat(np.cumsum(counts) - counts, counts)
+        j = order[np.repeat(lo, counts) + np.arange(total) - starts]
+        keep = i < j if not offset.any() else i != j
+        i, j = i[keep], j[keep]
+        close = np.sum(np.square(points[i] - points[j]), axis=1) <= radius ** 2
+        all_i.append(i[close])
+        all_j.append(j[close])
+
+    if not all_i:
+        empty = np.zeros(0, dtype=np.intp)
+        return empty, empty
+    i, j = np.concatenate(all_i), np.concatenate(all_j)
+    return np.minimum(i, j), np.maximum(i, j)
+
+def connected_components(n: int, i: np.ndarray, j: np.ndarray) -> np.ndarray:
+    """Label the connected components of a graph given by its edges.
+
+    Args:
+        n (int): The number of nodes.
+        i (numpy.ndarray): The first node of each edge.
+        j (numpy.ndarray): The second node of each edge.
+
+    Returns:
+        An array of n component labels from 0 to the number of components minus one, numbered in order of each component's first node.
+    """
+    labels = np.arange(n)
+    # Propagate the smallest index through each connected component
+    while len(i):
+        smallest = np.minimum(labels[i], labels[j])
+        updated = labels.copy()
+        np.minimum.at(updated, i, smallest)
+        np.minimum.at(updated, j, smallest)
+        # Pointer jumping
+        updated = updated[updated]
+        if np.array_equal(updated, labels):
+            break
+        labels = updated
+    _, first, inverse = np.unique(labels, return_index=True, return_inverse=True)
+    # Renumber components in order of appearance
+    rank = np.empty(len(first), dtype=np.intp)
+    rank[np.argsort(first, kind='stable')] = np.arange(len(first))
+    return rank[inverse]
+
+def cluster_points(points: np.ndarray, tolerance: float) -> np.ndarray:
+    """Group points that are linked by chains of neighbors within `tolerance`.
+
+    Args:
+        points (numpy.ndarray): An (N, 3) array of points.
+        tolerance (float): The largest distance between linked points.
+
+    Returns:
+        An array of N cluster labels from 0 to the number of clusters minus one, numbered in order of each cluster's first point.
+    """
+    n = len(np.asarray(points).reshape(-1, 3))
+    return connected_components(n, *neighbor_pairs(points, tolerance))
+
+def _merge_labels(points: np.ndarray, sources: List[frozenset], tolerance: float) -> np.ndarray:
+    """
+    Label groups of points to merge: pairs with no source in common are joined
+    closest first, as long as no group gets two points sharing a source or
+    two points farther apart than `tolerance`.
+    """
+    n = len(points)
+    i, j = neighbor_pairs(points, tolerance)
+    disjoint = np.array([sources[a].isdisjoint(sources[b]) for a, b in zip(i.tolist(), j.tolist())], dtype=bool)
+    i, j = i[disjoint], j[disjoint]
+    order = np.argsort(np.sum(np.square(points[i] - points[j]), axis=1), kind='stable')
+
+    parent = dict()
+    members = dict()
+    group_sources = dict()
+    def find(k: int) -> int:
+        root = k
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while k != root:
+            parent[k], k = root, parent[k]
+        return root
+
+    accepted_i, accepted_j = [], []
+    for a, b in zip(i[order].tolist(), j[order].tolist()):
+        root_a, root_b = find(a), find(b)
+        if root_a == root_b:
+            continue
+        sources_a, sources_b = group_sources.get(root_a, sources[root_a]), group_sources.get(root_b, sources[root_b])
+        if not sources_a.isdisjoint(sources_b):
+            continue
+        group_a, group_b = members.get(root_a, [root_a]), members.get(root_b, [root_b])
+        # Every pair in the merged group must be within tolerance, so groups don't chain
+        spread = points[group_a][:, None, :] - points[group_b][None, :, :]
+        if np.max(np.sum(np.square(spread), axis=2)) > tolerance ** 2:
+            continue
+        parent[root_b] = root_a
+        members[root_a] = group_a + group_b
+        members.pop(root_b, None)
+        group_sources[root_a] = sources_a | sources_b
+        group_sources.pop(root_b, None)
+        accepted_i.append(a)
+        accepted_j.append(b)
+    return connected_components(n, np.array(accepted_i, dtype=np.intp), np.array(accepted_j, dtype=np.intp))
+
+def merge_points(
+        points: np.ndarray,
+        tolerance: float,
+        sources: Optional[Sequence[Union[int, Iterable[int]]]] = None
+    ) -> Tuple[np.ndarray, List[np.ndarray]]:
+    """Merge points from different sources that mark the same particle into their centroids.
+
+    Points that share a source are never merged with each other, and merged
+    groups never span more than `tolerance`, so distinct particles that lie
+    close together are kept apart. Closest pairs are merged first.
+
+    Args:
+        points (numpy.ndarray): An (N, 3) array of points.
+        tolerance (float): The largest distance between any two points merged into one.
+        sources (sequence, optional): A non-negative integer identifying where each point came from, or a collection of them for a point that already merges several sources. Defaults to None, which treats every point as its own source.
+
+    Returns:
+        An (M, 3) array of merged points, in order of each group's first point,
+        and for each merged point a sorted array of the sources that
+        contributed to it.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    if sources is None:
+        sources = range(len(points))
+    sources = [
+        frozenset(int(s) for s in source) if np.iterable(source) else frozenset((int(source),))
+        for source in sources
+    ]
+    labels = _merge_labels(points, sources, tolerance)
+    n_clusters = int(labels.max()) + 1 if len(labels) else 0
+    counts = np.bincount(labels, minlength=n_clusters)
+    merged = np.stack([
+        np.bincount(labels, weights=points[:, axis], minlength=n_clusters)
+        for axis in range(3)
+    ], axis=1) / np.maximum(counts, 1)[:, None]
+
+    contributors = [set() for _ in range(n_clusters)]
+    for label, source in zip(labels.tolist(), sources):
+        contributors[label] |= source
+    return merged, [np.array(sorted(c), dtype=np.int64) for c in contributors]
+
+def non_maximum_suppression(points: np.ndarray, scores: np.ndarray, min_distance: float) -> np.ndarray:
+    """Keep the highest-scoring points, dropping any within `min_distance` of a point already kept.
+
+    Points are binned into grid cells as wide as `min_distance`, and each
+    point is compared only with the kept points in its own and neighboring
+    cells, so memory grows with the number of points rather than the number
+    of close pairs.
+
+    Args:
+        points (numpy.ndarray): An (N, 3) array of points.
+        scores (numpy.ndarray): The score of each point.
+        min_distance (float): The distance within which lower-scoring points are suppressed.
+
+    Returns:
+        The indices of the kept points, from highest to lowest score.
+    """
+    scores = np.asarray(scores)
+    order = np.argsort(-scores, kind='stable')
+    if min_distance <= 0 or len(order) < 2:
+        return order
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    cells = np.floor(points / min_distance).astype(np.int64)
+    cells -= cells.min(axis=0) - 1
+    dims = cells.max(axis=0) + 2
+    strides = np.array([dims[1] * dims[2], dims[2], 1], dtype=np.int64)
+    keys = (cells @ strides).tolist()
+    neighbor_offsets = [
+        int(np.dot((dz, dy, dx), strides))
+        for dz in (-1, 0, 1) for dy in (-1, 0, 1) for dx in (-1, 0, 1)
+    ]
+
+    # Kept points by cell
+    grid = dict()
+    kept = []
+    limit = min_distance ** 2
+    for index in order.tolist():
+        key = keys[index]
+        point = points[index]
+        suppressed = False
+        for offset in neighbor_offsets:
+            nearby = grid.get(key + offset)
+            if nearby and np.any(np.sum(np.square(points[nearby] - point), axis=1) <= limit):
+                suppressed = True
+                break
+        if not suppressed:
+            kept.append(index)
+            grid.setdefault(key, []).append(index)
+    return np.array(kept, dtype=np.intp)
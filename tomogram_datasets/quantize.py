@@ -0,0 +1,134 @@
+"""
+This module provides a compact, quantized representation of tomogram volumes.
+
+Contrast-stretched tomograms carry far less precision than the float64 arrays
+they are stored in. A `QuantizedVolume` keeps them as 8- or 16-bit integer codes
+with a scale and offset, using an eighth or a quarter of the memory, and turns
+only the slices or patches that are indexed back into floating point.
+"""
+
+import numpy as np
+
+from typing import Optional, Tuple, Union
+
+# Integer types that volumes can be quantized to.
+QUANTIZED_DTYPES = (np.dtype(np.uint8), np.dtype(np.uint16))
+
+class QuantizedVolume:
+    """A volume stored as integer codes, dequantized on access.
+
+    Voxel values are `codes * scale + offset`. Indexing works like indexing a
+    numpy array and returns float32 values for just the indexed region, so
+    subtomograms and tiles of a quantized tomogram are cheap. Converting the
+    whole volume with `numpy.asarray` dequantizes everything.
+
+    Attributes:
+        codes (numpy.ndarray): The integer codes.
+        scale (float): The value step between consecutive codes.
+        offset (float): The value of code 0.
+    """
+    __slots__ = ('codes', 'scale', 'offset')
+
+    def __init__(self, codes: np.ndarray, scale: float, offset: float):
+        """Initialize a QuantizedVolume instance from precomputed codes.
+
+        Use `QuantizedVolume.from_array` to quantize an array.
+
+        Args:
+            codes (numpy.ndarray): The integer codes.
+            scale (float): The value step between consecutive codes.
+            offset (float): The value of code 0.
+        """
+        self.codes = codes
+        self.scale = float(scale)
+        self.offset = float(offset)
+
+    def __repr__(self):
+        return f'<QuantizedVolume {self.shape} as {self.codes.dtype}>'
+
+    @classmethod
+    def from_array(
+            cls,
+            array: np.ndarray,
+            dtype: Union[str, np.dtype] = np.uint8,
+            *,
+            value_range: Optional[Tuple[float, float]] = None,
+            block_depth: int = 16
+        ) -> 'QuantizedVolume':
+        """Quantize an array, one slab of sections at a time.
+
+        Args:
+            array (numpy.ndarray): The array to quantize.
+
+            dtype (str or numpy.dtype, optional): The integer type of the codes, uint8 or uint16. Defaults to uint8.
+
+            value_range (tuple of float, optional): The (minimum, maximum) values to represent. Values outside are clipped. Defaults to the array's minimum and maximum.
+
+            block_depth (int, optional): The number of sections quantized at once. Defaults to 16.
+
+        Returns:
+            The quantized volume.
+
+        Raises:
+            ValueError: If `dtype` is not uint8 or uint16.
+        """
+        dtype = np.dtype(dtype)
+        if dtype not in QUANTIZED_DTYPES:
+            raise ValueError(f"Volumes can only be quantized to uint8 or uint16, not {dtype}.")
+        if value_range is None:
+            value_range = (float(np.min(array)), float(np.max(array)))
+        low, high = value_range
+        max_code = np.iinfo(dtype).max
+        scale = (high - low) / max_code if high > low else 1.0
+
+        codes = np.empty(array.shape, dtype=dtype)
+        for z0 in range(0, array.shape[0], block_depth):
+            slab = np.asarray(array[z0 : z0 + block_depth], dtype=np.float32)
+            slab = (slab - low) / scale
+            np.rint(slab, out=slab)
+            np.clip(slab, 0, max_code, out=slab)
+            codes[z0 : z0 + block_depth] = slab
+        return cls(codes, scale, low)
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return self.codes.shape
+
+    @property
+    def ndim(self) -> int:
+        return self.codes.ndim
+
+    @property
+    def dtype(self) -> np.dtype:
+        """ The data type of dequantized values. """
+        return np.dtype(np.float32)
+
+    @property
+    def nbytes(self) -> int:
+        """ The memory used by the codes. """
+        return self.codes.nbytes
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, key) -> np.ndarray:
+        """ Dequantize the indexed region only. """
+        return self._dequantize(self.codes[key])
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        data = self.dequantize()
+        return data if dtype is None else data.astype(dtype, copy=False)
+
+    def _dequantize(self, codes: np.ndarray) -> np.ndarray:
+        values = np.asarray(codes, dtype=np.float32)
+        values *= np.float32(self.scale)
+        values += np.float32(self.offset)
+        return values
+
+    def dequantize(self) -> np.ndarray:
+        """Dequantize the whole volume.
+
+        Returns:
+            A float32 array of the volume's values.
+        """
+        return self._dequantize(self.codes)
@@ -0,0 +1,165 @@
+"""
+This module provides blockwise resampling of tomograms to a new voxel spacing.
+
+Volumes are resampled with trilinear interpolation, one slab of output
+sections at a time, so sources may be memory-mapped arrays much larger than
+memory. Voxel centers are aligned: output voxel `i` along an axis samples the
+source at `(i + 0.5) / factor - 0.5`, and annotation points are mapped the same
+way (see `scale_points`).
+"""
+
+import hashlib
+import os
+
+import numpy as np
+
+from .writer import write_slabs
+
+from typing import Iterator, Sequence, Tuple
+
+def resampled_shape(shape: Sequence[int], factors: Sequence[float]) -> Tuple[int, ...]:
+    """Find the shape of an array of the given shape after scaling each axis.
+
+    Args:
+        shape (sequence of int): The shape of the source array.
+        factors (sequence of float): The scale factor along each axis. Factors less than 1 shrink the array.
+
+    Returns:
+        The resampled shape. Every axis keeps at least one voxel.
+    """
+    return tuple(max(1, int(round(s * f))) for (s, f) in zip(shape, factors))
+
+def _source_coords(in_size: int, out_size: int, start: int = 0, stop: int = None) -> np.ndarray:
+    """ Source coordinates sampled by output indices `start` to `stop`. """
+    stop = out_size if stop is None else stop
+    factor = out_size / in_size
+    coords = (np.arange(start, stop, dtype=np.float64) + 0.5) / factor - 0.5
+    return np.clip(coords, 0, in_size - 1)
+
+def _interpolate_axis(array: np.ndarray, coords: np.ndarray, axis: int) -> np.ndarray:
+    """ Linearly interpolate `array` at (clipped) `coords` along `axis`. """
+    n = array.shape[axis]
+    lower = np.minimum(np.floor(coords).astype(np.intp), max(n - 2, 0))
+    upper = np.minimum(lower + 1, n - 1)
+    weight_shape = [1] * array.ndim
+    weight_shape[axis] = len(coords)
+    weight = (coords - lower).astype(np.float32).reshape(weight_shape)
+    below = np.take(array, lower, axis=axis)
+    above = np.take(array, upper, axis=axis)
+    return below + (above - below) * weight
+
+def iter_resampled_slabs(
+        source: np.ndarray,
+        out_shape: Sequence[int],
+        *,
+        block_depth: int = 16
+    ) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    Resample a 3-dimensional array to `out_shape`, yielding the result one slab
+    of sections at a time. Only the source sections needed for each slab are
+    read.
+
+    Args:
+        source (numpy.ndarray): The array to resample, possibly memory-mapped.
+
+        out_shape (sequence of int): The shape of the resampled array.
+
+        block_depth (int, optional): The number of output sections per slab. Defaults to 16.
+
+    Yields:
+        Pairs of the index of the first section in the slab and the float32 slab itself.
+    """
+    in_z, in_y, in_x = source.shape
+    out_z, out_y, out_x = out_shape
+    y_coords = _source_coords(in_y, out_y)
+    x_coords = _source_coords(in_x, out_x)
+    for z0 in range(0, out_z, block_depth):
+        z1 = min(z0 + block_depth, out_z)
+        z_coords = _source_coords(in_z, out_z, z0, z1)
+        lo = int(np.floor(z_coords[0]))
+        hi = min(int(np.floor(z_coords[-1])) + 2, in_z)
+        slab = np.asarray(source[lo:hi], dtype=np.float32)
+        slab = _interpolate_axis(slab, z_coords - lo, axis=0)
+        slab = _interpolate_axis(slab, y_coords, axis=1)
+        slab = _interpolate_axis(slab, x_coords, axis=2)
+        yield z0, slab
+
+def resample_volume(source: np.ndarray, out_shape: Sequence[int], *, block_depth: int = 16) -> np.ndarray:
+    """Resample a 3-dimensional array to `out_shape` in memory.
+
+    Args:
+        source (numpy.ndarray): The array to resample, possibly memory-mapped.
+        out_shape (sequence of int): The shape of the resampled array.
+        block_depth (int, optional): The number of output sections computed at once. Defaults to 16.
+
+    Returns:
+        The resampled float32 array.
+    """
+    out = np.empty(tuple(out_shape), dtype=np.float32)
+    for z0, slab in iter_resampled_slabs(source, out_shape, block_depth=block_depth):
+        out[z0 : z0 + len(slab)] = slab
+    return out
+
+def scale_points(points: np.ndarray, in_shape: Sequence[int], out_shape: Sequence[int]) -> np.ndarray:
+    """Map (z, y, x) points from an array of shape `in_shape` to its resampled version.
+
+    Args:
+        points (numpy.ndarray): An (N, 3) array of points.
+        in_shape (sequence of int): The shape of the source array.
+        out_shape (sequence of int): The shape of the resampled array.
+
+    Returns:
+        The mapped (N, 3) points.
+    """
+    factors = np.array(out_shape, dtype=np.float64) / np.array(in_shape, dtype=np.float64)
+    return (np.asarray(points, dtype=np.float64) + 0.5) * factors - 0.5
+
+def write_resampled_mrc(
+        source: np.ndarray,
+        filepath: str,
+        out_shape: Sequence[int],
+        voxel_size: Sequence[float],
+        *,
+        block_depth: int = 16
+    ) -> str:
+    """
+    Resample a 3-dimensional array into a float32 `.mrc` file, one slab at a
+    time. The file is written under a temporary name and moved into place when
+    complete, so a partially written file is never mistaken for a finished one.
+
+    Args:
+        source (numpy.ndarray): The array to resample, possibly memory-mapped.
+
+        filepath (str): Where to write the `.mrc` file.
+
+        out_shape (sequence of int): The shape of the resampled array.
+
+        voxel_size (sequence of float): The voxel size of the output in Ångstroms, in (x, y, z) order.
+
+        block_depth (int, optional): The number of output sections computed at once. Defaults to 16.
+
+    Returns:
+        `filepath`.
+    """
+    slabs = iter_resampled_slabs(source, out_shape, block_depth=block_depth)
+    return write_slabs(slabs, filepath, out_shape, np.float32, voxel_size=voxel_size)
+
+def cache_path(filepath: str, cache_dir: str, target_spacing: float) -> str:
+    """
+    The path that a resampled copy of `filepath` is cached at. The name includes
+    a digest of the source's path, size and modification time, so editing or
+    replacing the source invalidates its cached copies.
+
+    Args:
+        filepath (str): The source tomogram file.
+        cache_dir (str): The cache directory.
+        target_spacing (float): The voxel spacing of the resampled copy in Ångstroms.
+
+    Returns:
+        The path of the cached copy.
+    """
+    stat = os.stat(filepath)
+    key = f"{os.path.abspath(filepath)}:{stat.st_size}:{stat.st_mtime_ns}:{target_spacing!r}"
+    digest = hashlib.sha1(key.encode()).hexdigest()[:12]
+    label = os.path.splitext(os.path.basename(filepath))[0]
+    return os.path.join(cache_dir, f"{label}_{target_spacing:g}A_{digest}.mrc")
@@ -0,0 +1,217 @@
+"""
+This module provides epoch sampling plans: all of an epoch's subtomograms are
+chosen up front, read in an order that groups them by tomogram and z-slab, and
+handed to the consumer in shuffled order.
+
+Reading a tomogram's subtomograms together, from the top of the volume to the
+bottom, turns the scattered reads of one-at-a-time random sampling into mostly
+sequential ones. A bounded reorder buffer then shuffles the samples again, so
+consecutive samples seen by the consumer rarely come from the same place.
+
+```python
+sampler = EpochSampler(tomograms, vol_shape=(64, 128, 128), seed=0)
+plan = sampler.plan(1000)
+for index, subtomogram in sampler.execute(plan):
+    label = plan['label'][index]
+```
+"""
+
+import numpy as np
+
+from .tomogram import Tomogram
+from .subtomogram import Subtomogram, _negative_lower_bounds, _positive_lower_bounds
+
+from typing import TYPE_CHECKING, Iterator, List, Optional, Sequence, Tuple
+
+if TYPE_CHECKING:
+    from .filtering import BandpassFilter
+
+# One row of a sampling plan. `tomogram` indexes `EpochSampler.tomograms`, and
+# `label` is 1 for positive (annotated) samples and 0 for negative ones.
+PLAN_DTYPE = np.dtype([
+    ('tomogram', np.int32),
+    ('lower_bounds', np.int64, (3,)),
+    ('label', np.int8),
+])
+
+class EpochSampler:
+    """Plans and executes epochs of positive and negative subtomogram samples.
+
+    Attributes:
+        tomograms (list of Tomogram): The tomograms to sample from.
+
+        vol_shape (tuple of int): The shape of the sampled subtomograms.
+
+        pads (tuple of int): The minimum distance of a positive sample's point from the subtomogram's borders.
+
+        slab_depth (int): The depth of the z-slabs that reads are grouped by.
+
+        bandpass (BandpassFilter): A filter applied to each sampled subtomogram's data, or None.
+
+        gen (np.random.Generator): Random number generator for sampling.
+    """
+    def __init__(
+            self,
+            tomograms: Sequence[Tomogram],
+            vol_shape: Tuple[int, int, int] = (64, 256, 256),
+            *,
+            pads: Tuple[int, int, int] = (8, 32, 32),
+            slab_depth: Optional[int] = None,
+            seed: Optional[int] = None,
+            bandpass: Optional['BandpassFilter'] = None
+        ):
+        """Initialize an EpochSampler instance.
+
+        Args:
+            tomograms (sequence of Tomogram): The tomograms to sample from. `TomogramFile`s need not be loaded.
+
+            vol_shape (tuple of int, optional): The shape of the sampled subtomograms. Defaults to (64, 256, 256).
+
+            pads (tuple of int, optional): The minimum distance of a positive sample's point from the subtomogram's borders. Defaults to (8, 32, 32).
+
+            slab_depth (int, optional): The depth of the z-slabs that reads are grouped by. Defaults to the depth of `vol_shape`.
+
+            seed (int, optional): Seed for the random number generator. Defaults to None.
+
+            bandpass (BandpassFilter, optional): A filter applied to each sampled subtomogram's data. Defaults to None.
+        """
+        self.tomograms = list(tomograms)
+        self.vol_shape = tuple(vol_shape)
+        self.pads = tuple(pads)
+        self.slab_depth = self.vol_shape[0] if slab_depth is None else slab_depth
+        self.gen = np.random.default_rng(seed)
+        self.bandpass = bandpass
+
+    def __repr__(self):
+        return f'<EpochSampler of {self.vol_shape} volumes from {len(self.tomograms)} tomograms>'
+
+    def plan(self, n_samples: int, *, positive_fraction: float = 0.5) -> np.ndarray:
+        """Choose the samples of one epoch.
+
+        Tomograms are chosen uniformly at random. Positive samples come from
+        annotated tomograms only and contain a random annotation point, as in
+        `SubtomogramGenerator.positive_sample`; negative samples contain no
+        annotation points, as in `SubtomogramGenerator.negative_sample`. Only
+        tomogram shapes and annotations are needed, so no data is read.
+
+        Args:
+            n_samples (int): The number of samples in the epoch.
+
+            positive_fraction (float, optional): The fraction of samples that are positive. Defaults to 0.5.
+
+        Returns:
+            A structured array of `PLAN_DTYPE` with one row per sample, in
+            random order.
+
+        Raises:
+            ValueError: If positive samples are requested but no tomogram is annotated.
+        """
+        n_positive = int(round(n_samples * positive_fraction))
+        annotated = [i for (i, tomo) in enumerate(self.tomograms) if tomo.is_annotated()]
+        if n_positive > 0 and not annotated:
+            raise ValueError("Cannot plan positive samples without annotated tomograms.")
+
+        plan = np.zeros(n_samples, dtype=PLAN_DTYPE)
+        plan['label'][:n_positive] = 1
+        if n_positive > 0:
+            plan['tomogram'][:n_positive] = self.gen.choice(annotated, size=n_positive)
+        plan['tomogram'][n_positive:] = self.gen.integers(len(self.tomograms), size=n_samples - n_positive)
+
+        for index in np.unique(plan['tomogram']):
+            tomo = self.tomograms[index]
+            rows = np.flatnonzero(plan['tomogram'] == index)
+            points = np.array(tomo.annotation_points()).reshape(-1, len(self.vol_shape))
+            for row in rows:
+                if plan['label'][row]:
+                    annotation = self.gen.choice([a for a in tomo.annotations if len(a.points) > 0])
+                    point = self.gen.choice(annotation.points)
+                    plan['lower_bounds'][row] = _positive_lower_bounds(
+                        tomo.shape, self.vol_shape, self.pads, point, self.gen
+                    )
+                else:
+                    plan['lower_bounds'][row] = _negative_lower_bounds(
+                        tomo.shape, self.vol_shape, points, self.gen
+                    )
+
+        self.gen.shuffle(plan)
+        return plan
+
+    def execution_order(self, plan: np.ndarray) -> np.ndarray:
+        """Find the order in which to read the samples of a plan.
+
+        Samples are grouped by tomogram, then by z-slab, and sorted by their
+        lower bounds within each slab.
+
+        Args:
+            plan (numpy.ndarray): A plan from `EpochSampler.plan`.
+
+        Returns:
+            The indices of the plan's rows in reading order.
+        """
+        bounds = plan['lower_bounds']
+        return np.lexsort((
+            bounds[:, 2], bounds[:, 1], bounds[:, 0],
+            bounds[:, 0] // self.slab_depth,
+            plan['tomogram'],
+        ))
+
+    def _read(self, plan: np.ndarray, order: np.ndarray) -> Iterator[Tuple[int, Subtomogram]]:
+        """ Read the subtomograms of `plan` in `order`. """
+        current, tomo, source = None, None, None
+        for index in order:
+            row = plan[index]
+            if row['tomogram'] != current:
+                current = row['tomogram']
+                tomo = self.tomograms[current]
+                # Unloaded TomogramFiles are read through a memory map
+                source = tomo._tile_source()
+            sub = Subtomogram(tomo, row['lower_bounds'], self.vol_shape, bandpass=self.bandpass)
+            if isinstance(source, np.memmap):
+                # Read (and stretch) now, so the read happens in execution order
+                sub.data = sub.data
+            yield int(index), sub
+
+    def execute(self, plan: np.ndarray, *, buffer_size: int = 64) -> Iterator[Tuple[int, Subtomogram]]:
+        """Read the subtomograms of a plan, yielding them in shuffled order.
+
+        Subtomograms are read in `execution_order` and pass through a reorder
+        buffer of `buffer_size` samples, from which a random one is yielded
+        each time the buffer is full. Larger buffers shuffle more thoroughly at
+        the cost of memory. Subtomograms of loaded tomograms are views of their
+        data; those of unloaded `TomogramFile`s hold copies of voxels read
+        through a memory map and contrast stretched like `get_slice()` does,
+        with `intensity_limits` if set, or else `contrast_limits` (estimated
+        if `process()` has not set them). An unloaded tomogram's own `bandpass`
+        is not applied.
+
+        Args:
+            plan (numpy.ndarray): A plan from `EpochSampler.plan`.
+
+            buffer_size (int, optional): The number of subtomograms held for reordering. Defaults to 64.
+
+        Yields:
+            Pairs of a sample's row index in `plan` and its subtomogram.
+        """
+        buffer: List[Tuple[int, Subtomogram]] = []
+        for item in self._read(plan, self.execution_order(plan)):
+            buffer.append(item)
+            if len(buffer) >= buffer_size:
+                yield self._pop_random(buffer)
+        while buffer:
+            yield self._pop_random(buffer)
+
+    def _pop_random(self, buffer: list):
+        """ Remove and return a random item of `buffer` in constant time. """
+        i = int(self.gen.integers(len(buffer)))
+        buffer[i], buffer[-1] = buffer[-1], buffer[i]
+        return buffer.pop()
+
+    def epoch(self, n_samples: int, *, positive_fraction: float = 0.5, buffer_size: int = 64) -> Iterator[Tuple[int, Subtomogram]]:
+        """Plan and execute one epoch. See `EpochSampler.plan` and `EpochSampler.execute`.
+
+        Yields:
+            Pairs of a sample's label (1 for positive, 0 for negative) and its subtomogram.
+        """
+        plan = self.plan(n_samples, positive_fraction=positive_fraction)
+        for index, sub in self.execute(plan, buffer_size=buffer_size):
+            yield int(plan['label'][index]), sub
@@ -0,0 +1,530 @@
+"""
+This module provides a local server that holds one resident copy of each
+tomogram and samples subtomograms from it for any number of training jobs on
+the same node.
+
+The server loads and preprocesses each requested tomogram once and publishes
+it as a `SharedVolume`. Clients attach to the shared volume, so subtomograms
+are views into the server's copy, and ask the server for sampled bounds or for
+batches of patches, which are returned through shared memory as well. Requests
+are sent over a Unix socket (or a localhost TCP port) with
+`multiprocessing.connection`. Messages are pickled, so a TCP server, which any
+local user can reach, requires an authentication key: pass it with
+`authkey=`, or set the `TOMOGRAM_PATCHES_AUTHKEY` environment variable for both
+the server and its clients.
+
+```python
+# Once per node
+python -m tomogram_datasets.server /tmp/patches.sock
+
+# In each training job
+with PatchClient("/tmp/patches.sock") as client:
+    generator = client.generator(tomogram)
+    positive = generator.positive_sample()
+    negative = generator.negative_sample()
+```
+"""
+
+import argparse
+import errno
+import os
+import secrets
+import socket
+import stat
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+from .shared import SharedTomogram, SharedVolume
+from .subtomogram import Subtomogram, SubtomogramGenerator, _negative_lower_bounds, _positive_lower_bounds
+from .tomogram import TomogramFile
+
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+Address = Union[str, Tuple[str, int]]
+
+# The environment variable servers and clients read a shared key from
+AUTHKEY_ENV = "TOMOGRAM_PATCHES_AUTHKEY"
+
+def default_address() -> str:
+    """ The Unix socket that servers and clients use unless told otherwise. """
+    return os.path.join(tempfile.gettempdir(), f"tomogram-patches-{os.getuid()}.sock")
+
+def _family(address: Address) -> str:
+    return 'AF_UNIX' if isinstance(address, str) else 'AF_INET'
+
+def _authkey(authkey: Optional[bytes]) -> Optional[bytes]:
+    """ `authkey`, or else the key in the `TOMOGRAM_PATCHES_AUTHKEY` environment variable, if set. """
+    if authkey is None and os.environ.get(AUTHKEY_ENV):
+        return os.environ[AUTHKEY_ENV].encode()
+    return authkey
+
+def _remove_stale_socket(path: str):
+    """
+    Remove a Unix socket left behind by a server that did not shut down
+    cleanly. Anything else at `path`, including the socket of a live server,
+    is left alone.
+
+    Raises:
+        FileExistsError: If `path` exists and is not a socket.
+        OSError: If a server is listening on `path`.
+    """
+    try:
+        mode = os.stat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(f"{path} exists and is not a socket.")
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except ConnectionRefusedError:
+        os.remove(path)
+        return
+    finally:
+        probe.close()
+    raise OSError(errno.EADDRINUSE, f"A server is already listening on {path}.")
+
+class _Entry:
+    """ 
+    A tomogram held by the server, the lock that guards loading it, and the
+    number of requests using it, which keep it from being evicted.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tomogram = None
+        self.volume = None
+        self.pending = 0
+
+def _entry_key(tomogram: TomogramFile) -> tuple:
+    """ 
+    A tomogram's file and the settings that change its preprocessed data, so
+    that requests preprocessing one file differently get different volumes.
+    """
+    limits = tomogram.intensity_limits
+    if limits is not None:
+        limits = tuple(float(limit) for limit in limits)
+    bandpass = tomogram.bandpass
+    if bandpass is not None:
+        spacing = bandpass.spacing
+        if spacing is not None and not np.isscalar(spacing):
+            spacing = tuple(float(s) for s in spacing)
+        bandpass = (bandpass.low_resolution, bandpass.high_resolution, spacing, bandpass.falloff)
+    return (os.path.abspath(tomogram.filepath), limits, bandpass)
+
+class PatchServer:
+    """Serves shared tomogram volumes and sampled subtomograms to local clients.
+
+    Each client connection is handled on its own thread with its own random
+    number generator. Tomograms are loaded the first time any client asks for
+    them and kept until more than `max_volumes` are held, after which the
+    least recently used are released. Tomograms still loading, or in use by a
+    request, are not released. Clients still attached to a released volume
+    keep it alive until they close it. A file is held once for each distinct
+    `intensity_limits` and `bandpass` that clients request it with.
+
+    Attributes:
+        address (str or tuple): The Unix socket path or (host, port) the server listens on.
+        max_volumes (int): The most tomograms held at once, or None for no limit.
+    """
+    def __init__(
+            self,
+            address: Optional[Address] = None,
+            *,
+            authkey: Optional[bytes] = None,
+            max_volumes: Optional[int] = None
+        ):
+        """Start listening for clients. Call `serve_forever` or `start` to serve them.
+
+        Args:
+            address (str or tuple, optional): A Unix socket path, or a (host, port) pair such as ("localhost", 0) for TCP. Defaults to `default_address()`.
+
+            authkey (bytes, optional): A key that clients must present. Defaults to the `TOMOGRAM_PATCHES_AUTHKEY` environment variable, if set; otherwise a Unix socket relies on its file permissions, which only allow its owner to connect.
+
+            max_volumes (int, optional): The most tomograms held at once. Defaults to None, for no limit.
+
+        Raises:
+            ValueError: If a TCP address is given without a key.
+            FileExistsError: If a file other than a socket is at the socket path.
+            OSError: If another server is listening on the socket path.
+        """
+        if address is None:
+            address = default_address()
+        authkey = _authkey(authkey)
+        family = _family(address)
+        if family == 'AF_INET' and authkey is None:
+            # Any local user can reach a TCP port, and messages are unpickled
+            raise ValueError(f"A TCP server requires an authkey. Pass one or set {AUTHKEY_ENV}.")
+        if family == 'AF_UNIX':
+            _remove_stale_socket(address)
+        self._listener = Listener(address, family=family, authkey=authkey)
+        if family == 'AF_UNIX':
+            os.chmod(address, 0o600)
+        self.address = self._listener.address
+        self.max_volumes = max_volumes
+        self._entries: 'OrderedDict[str, _Entry]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._serving = threading.Event()
+        self._thread = None
+
+    def __repr__(self):
+        return f'<PatchServer at {self.address} holding {len(self._entries)} tomograms>'
+
+    def __enter__(self) -> 'PatchServer':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def serve_forever(self):
+        """ Accept clients until the server is closed. """
+        self._serving.set()
+        while not self._closed.is_set():
+            try:
+                connection = self._listener.accept()
+            except (OSError, EOFError, AuthenticationError):
+                # A client that disconnected or presented the wrong key
+                if self._closed.is_set():
+                    break
+                continue
+            if self._closed.is_set():
+                connection.close()
+                break
+            threading.Thread(target=self._serve_client, args=(connection,), daemon=True).start()
+
+    def start(self) -> 'PatchServer':
+        """ Serve clients on a background thread of this process. """
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        """ Stop accepting clients and release every tomogram held. """
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        if self._serving.is_set():
+            # Closing the listener does not interrupt a blocked `accept`, but a
+            # connection does. A bare socket is used, since the server may
+            # already have stopped and would never answer a handshake.
+            family = socket.AF_UNIX if _family(self.address) == 'AF_UNIX' else socket.AF_INET
+            try:
+                with socket.socket(family, socket.SOCK_STREAM) as wake:
+                    wake.connect(self.address)
+            except OSError:
+                pass
+        if self._thread is not None:
+            self._thread.join()
+        self._listener.close()
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            if entry.volume is not None:
+                entry.volume.close()
+
+    @contextmanager
+    def _entry(self, tomogram: Union[str, TomogramFile]) -> Iterator[_Entry]:
+        """ 
+        The loaded entry of a tomogram, loading and publishing it if needed.
+        It is not evicted until the context exits.
+        """
+        if isinstance(tomogram, str):
+            tomogram = TomogramFile(tomogram, load=False)
+        key = _entry_key(tomogram)
+        evicted = []
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry()
+            entry.pending += 1
+            self._entries.move_to_end(key)
+            if self.max_volumes is not None:
+                # Evicting an entry that is loading would orphan its volume
+                for old_key in [k for (k, old) in self._entries.items() if old.pending == 0]:
+                    if len(self._entries) <= self.max_volumes:
+                        break
+                    evicted.append(self._entries.pop(old_key))
+        for old in evicted:
+            with old.lock:
+                if old.volume is not None:
+                    old.volume.close()
+                    old.volume = None
+        try:
+            # Only requests for the same tomogram wait while it loads
+            with entry.lock:
+                if entry.volume is None:
+                    entry.volume = tomogram.share()
+                    entry.tomogram = tomogram
+                    tomogram.data = None
+            yield entry
+        finally:
+            with self._lock:
+                entry.pending -= 1
+
+    def _open(self, tomogram) -> dict:
+        with self._entry(tomogram) as entry:
+            return {"handle": entry.volume.handle, "annotations": entry.tomogram.annotations}
+
+    def _sample(
+            self,
+            gen: np.random.Generator,
+            tomogram,
+            kind: str,
+            count: int,
+            vol_shape: Sequence[int],
+            pads: Sequence[int],
+            point: Optional[np.ndarray]
+        ) -> np.ndarray:
+        with self._entry(tomogram) as entry:
+            shape = entry.volume.handle.shape
+            annotations = entry.tomogram.annotations or []
+        if kind == "positive":
+            bounds = []
+            for _ in range(count):
+                sample_point = point
+                if sample_point is None:
+                    annotation = gen.choice(annotations)
+                    sample_point = gen.choice(annotation.points)
+                bounds.append(_positive_lower_bounds(shape, vol_shape, pads, sample_point, gen))
+        elif kind == "negative":
+            points = np.array([p for a in annotations for p in a.points]).reshape(-1, len(vol_shape))
+            bounds = [_negative_lower_bounds(shape, vol_shape, points, gen) for _ in range(count)]
+        else:
+            raise ValueError(f'Unknown sample kind "{kind}". Use "positive" or "negative".')
+        return np.array(bounds, dtype=int).reshape(-1, len(vol_shape))
+
+    def _batch(self, tomogram, lower_bounds: np.ndarray, vol_shape: Sequence[int]) -> SharedVolume:
+        lower_bounds = np.asarray(lower_bounds, dtype=int).reshape(-1, 3)
+        vol_shape = tuple(int(s) for s in vol_shape)
+        with self._entry(tomogram) as entry:
+            data = entry.volume.array
+            if np.any(lower_bounds < 0) or np.any(lower_bounds + vol_shape > data.shape):
+                raise ValueError(f"Every patch of shape {vol_shape} must lie inside the tomogram of shape {data.shape}.")
+            patches = np.empty((len(lower_bounds),) + vol_shape, dtype=data.dtype)
+            for patch, (z, y, x) in zip(patches, lower_bounds):
+                patch[...] = data[z : z + vol_shape[0], y : y + vol_shape[1], x : x + vol_shape[2]]
+        return SharedVolume.publish(patches)
+
+    def _serve_client(self, connection):
+        """ Answer one client's requests until it disconnects. """
+        gen = np.random.default_rng()
+        # Batches published for this client, until it has attached to them
+        batches: Dict[str, SharedVolume] = dict()
+        try:
+            while not self._closed.is_set():
+                try:
+                    command, args = connection.recv()
+                except (EOFError, OSError):
+                    break
+                try:
+                    if command == "seed":
+                        gen = np.random.default_rng(args["seed"])
+                        result = None
+                    elif command == "open":
+                        result = self._open(args["tomogram"])
+                    elif command == "sample":
+                        result = self._sample(gen, **args)
+                    elif command == "batch":
+                        batch = self._batch(**args)
+                        batches[batch.handle.name] = batch
+                        result = batch.handle
+                    elif command == "release":
+                        batches.pop(args["name"]).close()
+                        result = None
+                    else:
+                        raise ValueError(f'Unknown command "{command}".')
+                    connection.send((True, result))
+                except Exception as error:
+                    connection.send((False, error))
+        finally:
+            for batch in batches.values():
+                batch.close()
+            connection.close()
+
+class RemoteSubtomogramGenerator(SubtomogramGenerator):
+    """
+    A `SubtomogramGenerator` whose tomogram lives in a `PatchServer`. Sampled
+    bounds come from the server, and subtomograms are views into the server's
+    shared copy of the tomogram.
+
+    Attributes:
+        client (PatchClient): The client that talks to the server.
+        tomogram (SharedTomogram): The shared tomogram to sample from.
+    """
+    def __init__(self, client: 'PatchClient', tomogram: Union[str, TomogramFile]):
+        """Use `PatchClient.generator` instead."""
+        self.client = client
+        self._request_tomogram = tomogram
+        self.tomogram = client.tomogram(tomogram)
+        self.annotations = self.tomogram.annotations
+        self.vol_shape = (64, 256, 256)
+        self.pads = (8, 32, 32)
+        self.gen = None
+        self.bandpass = None
+
+    def _sample(self, kind: str, count: int, point: Optional[np.ndarray] = None) -> List[Subtomogram]:
+        bounds = self.client._request(
+            "sample", tomogram=self._request_tomogram, kind=kind, count=count,
+            vol_shape=tuple(self.vol_shape), pads=tuple(self.pads), point=point
+        )
+        return [Subtomogram(self.tomogram, lower_bounds, self.vol_shape, bandpass=self.bandpass) for lower_bounds in bounds]
+
+    def positive_sample(self, point: Optional[np.ndarray] = None) -> Subtomogram:
+        """ See `SubtomogramGenerator.positive_sample`. """
+        return self._sample("positive", 1, point)[0]
+
+    def negative_sample(self) -> Subtomogram:
+        """ See `SubtomogramGenerator.negative_sample`. """
+        return self._sample("negative", 1)[0]
+
+    def positive_samples(self, count: int) -> List[Subtomogram]:
+        """ Several positive samples, in one request to the server. """
+        return self._sample("positive", count)
+
+    def negative_samples(self, count: int) -> List[Subtomogram]:
+        """ Several negative samples, in one request to the server. """
+        return self._sample("negative", count)
+
+class PatchClient:
+    """A connection to a `PatchServer`.
+
+    A client is not safe to share between threads or processes; give each
+    data-loader worker its own.
+    """
+    def __init__(
+            self,
+            address: Optional[Address] = None,
+            *,
+            authkey: Optional[bytes] = None,
+            seed: Optional[int] = None
+        ):
+        """Connect to a server.
+
+        Args:
+            address (str or tuple, optional): The server's Unix socket path or (host, port). Defaults to `default_address()`.
+
+            authkey (bytes, optional): The server's key, if it has one. Defaults to the `TOMOGRAM_PATCHES_AUTHKEY` environment variable, if set.
+
+            seed (int, optional): A seed for the random number generator the server samples with for this client. Defaults to None.
+        """
+        if address is None:
+            address = default_address()
+        self._connection = Client(address, family=_family(address), authkey=_authkey(authkey))
+        self._tomograms: Dict[str, SharedTomogram] = dict()
+        if seed is not None:
+            self._request("seed", seed=seed)
+
+    def __enter__(self) -> 'PatchClient':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _request(self, command: str, **args):
+        self._connection.send((command, args))
+        ok, result = self._connection.recv()
+        if not ok:
+            raise result
+        return result
+
+    def tomogram(self, tomogram: Union[str, TomogramFile]) -> SharedTomogram:
+        """Attach to the server's copy of a tomogram, loading it on the server if needed.
+
+        Args:
+            tomogram (str or TomogramFile): The tomogram, or the path of its file. A TomogramFile is sent with its annotations and contrast settings, without its data.
+
+        Returns:
+            The shared, preprocessed tomogram, with the annotations the server holds for it.
+        """
+        key = os.path.abspath(tomogram if isinstance(tomogram, str) else tomogram.filepath)
+        if key not in self._tomograms:
+            reply = self._request("open", tomogram=tomogram)
+            self._tomograms[key] = SharedTomogram.attach(reply["handle"], reply["annotations"])
+        return self._tomograms[key]
+
+    def generator(self, tomogram: Union[str, TomogramFile]) -> RemoteSubtomogramGenerator:
+        """Sample subtomograms of a tomogram held by the server.
+
+        Args:
+            tomogram (str or TomogramFile): The tomogram, or the path of its file.
+
+        Returns:
+            A generator with the methods of `SubtomogramGenerator`.
+        """
+        return RemoteSubtomogramGenerator(self, tomogram)
+
+    def batch(
+            self,
+            tomogram: Union[str, TomogramFile],
+            lower_bounds: np.ndarray,
+            vol_shape: Sequence[int]
+        ) -> SharedVolume:
+        """Get a batch of patches, copied by the server into one shared block.
+
+        Args:
+            tomogram (str or TomogramFile): The tomogram, or the path of its file.
+            lower_bounds (numpy.ndarray): A (B, 3) array of the patches' lower bounds. Every patch must lie inside the tomogram.
+            vol_shape (sequence of int): The shape of each patch.
+
+        Returns:
+            A read-only SharedVolume whose array has shape (B, *vol_shape). Close it when done.
+        """
+        handle = self._request("batch", tomogram=tomogram, lower_bounds=np.asarray(lower_bounds), vol_shape=tuple(vol_shape))
+        try:
+            return SharedVolume.attach(handle)
+        finally:
+            self._request("release", name=handle.name)
+
+    def close(self):
+        """ Detach from every tomogram and disconnect. """
+        for tomogram in self._tomograms.values():
+            tomogram.close()
+        self._tomograms.clear()
+        self._connection.close()
+
+def _write_key_file(path: str, key: str):
+    """ Write a key to a file that only its owner can read. """
+    descriptor = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(descriptor, "w") as file:
+        file.write(key)
+    os.chmod(path, 0o600)
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description="Serve tomograms and subtomograms to local training jobs.")
+    parser.add_argument("address", nargs="?", default=None, help="Unix socket path (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=None, help="Listen on this localhost TCP port instead of a Unix socket")
+    parser.add_argument("--max-volumes", type=int, default=None, help="The most tomograms held at once")
+    parser.add_argument("--authkey", default=None, help=f"The key clients must present (default: ${AUTHKEY_ENV})")
+    parser.add_argument(
+        "--authkey-file", default=None,
+        help="Read the key from this file, or, for a TCP server without a key, write a random one to it readable only by you"
+    )
+    args = parser.parse_args(argv)
+    address = ("localhost", args.port) if args.port is not None else args.address
+
+    key = args.authkey
+    if key is None and args.authkey_file is not None and os.path.exists(args.authkey_file):
+        with open(args.authkey_file) as file:
+            key = file.read().strip()
+    if key is None and args.port is not None and not os.environ.get(AUTHKEY_ENV):
+        key = secrets.token_hex(32)
+        key_file = args.authkey_file or os.path.expanduser(f"~/.tomogram-patches-{args.port}.key")
+        _write_key_file(key_file, key)
+        print(f"Wrote a new key to {key_file}; give it to clients with {AUTHKEY_ENV}=$(cat {key_file})", flush=True)
+
+    with PatchServer(address, authkey=None if key is None else key.encode(), max_volumes=args.max_volumes) as server:
+        print(f"Serving on {server.address}", flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+"""
+This module provides tomogram volumes in POSIX shared memory, so that many
+worker processes can read one loaded, preprocessed copy of a tomogram instead
+of each loading their own.
+
+One process publishes a volume and sends its picklable handle to the others,
+which attach to it by handle. Every attachment holds a reference; the shared
+memory is freed when the last one is closed. Each process with an open
+attachment also holds a shared lock on a small file next to the block, which
+the operating system releases if the process dies, so a block whose other
+holders crashed is still freed by the last one to close it, and
+`sweep_shared_volumes` frees blocks left behind when every holder crashed.
+
+```python
+# Main process
+volume = tomogram.share()
+pool.map(work, [(volume.handle, tomogram.annotations)] * 16)
+volume.close()
+
+# Worker process
+def work(args):
+    handle, annotations = args
+    with SharedTomogram.attach(handle, annotations) as tomogram:
+        ...
+```
+"""
+
+import fcntl
+import glob
+import os
+import secrets
+import sys
+import tempfile
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .tomogram import Tomogram
+from .annotation import Annotation
+
+from typing import List, Optional, Tuple
+
+# Bytes reserved at the start of each block for the reference count, keeping
+# the volume itself aligned.
+_HEADER_SIZE = 64
+# Names of shared memory blocks created here start with this, so that
+# `sweep_shared_volumes` only considers its own.
+_NAME_PREFIX = "tds_"
+
+class SharedVolumeHandle:
+    """A picklable reference to a shared volume.
+
+    Attributes:
+        name (str): Name of the shared memory block.
+        shape (tuple of int): Shape of the volume.
+        dtype (str): Data type of the volume.
+    """
+    __slots__ = ('name', 'shape', 'dtype')
+
+    def __init__(self, name: str, shape: Tuple[int, ...], dtype: str):
+        self.name = name
+        self.shape = tuple(shape)
+        self.dtype = dtype
+
+    def __repr__(self):
+        return f'<SharedVolumeHandle {self.name} {self.shape} {self.dtype}>'
+
+    def __getstate__(self):
+        return (self.name, self.shape, self.dtype)
+
+    def __setstate__(self, state):
+        self.name, self.shape, self.dtype = state
+
+def _open_shared_memory(name: str, size: int = 0, *, create: bool = False) -> shared_memory.SharedMemory:
+    """
+    Create or open a shared memory block that is not unlinked when this
+    process exits; its holders decide that instead.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, create=create, size=size, track=False)
+    shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+    from multiprocessing import resource_tracker
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+def _unlink_shared_memory(shm: shared_memory.SharedMemory):
+    """ Unlink a block opened with `_open_shared_memory`. """
+    if sys.version_info < (3, 13):
+        # `unlink` unregisters the block from the resource tracker, so it must
+        # be registered again first.
+        from multiprocessing import resource_tracker
+        resource_tracker.register(shm._name, "shared_memory")
+    shm.unlink()
+
+def _lock_path(name: str) -> str:
+    """ The file locked while a block's reference count changes. """
+    return os.path.join(tempfile.gettempdir(), f"{name.lstrip('/')}.lock")
+
+def _holders_path(name: str) -> str:
+    """ The file that every process holding a block keeps a shared lock on. """
+    return os.path.join(tempfile.gettempdir(), f"{name.lstrip('/')}.holders")
+
+def _hold(name: str, *, create: bool = False):
+    """
+    Open a block's holders file with a shared lock, which lasts until the file
+    is closed or this process exits.
+    """
+    holder = open(_holders_path(name), 'a' if create else 'r')
+    fcntl.flock(holder, fcntl.LOCK_SH)
+    return holder
+
+def _free_if_unheld(name: str) -> bool:
+    """
+    Unlink a block, and remove its lock files, if no live process holds it.
+    Returns whether it was freed.
+    """
+    try:
+        holders = open(_holders_path(name), 'r')
+    except FileNotFoundError:
+        return False
+    with holders:
+        try:
+            fcntl.flock(holders, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        try:
+            shm = _open_shared_memory(name)
+        except FileNotFoundError:
+            pass
+        else:
+            _unlink_shared_memory(shm)
+            shm.close()
+        for path in (_lock_path(name), _holders_path(name)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    return True
+
+def sweep_shared_volumes() -> List[str]:
+    """Free shared volumes that no live process holds.
+
+    A volume is normally freed when its last holder closes it, even if other
+    holders crashed. If every process holding a volume exited without closing
+    it, its block stays in `/dev/shm` until this is called (or the machine
+    reboots). Volumes that any live process still holds are left alone, so
+    this is safe to call at any time, for example when a job starts.
+
+    Returns:
+        The names of the freed volumes.
+    """
+    freed = []
+    for path in glob.glob(os.path.join(tempfile.gettempdir(), f"{_NAME_PREFIX}*.holders")):
+        name = os.path.basename(path)[:-len(".holders")]
+        if _free_if_unheld(name):
+            freed.append(name)
+    return freed
+
+class SharedVolume:
+    """A reference-counted volume in shared memory.
+
+    Create one with `SharedVolume.publish` (or `Tomogram.share`) and open it in
+    other processes with `SharedVolume.attach`. Close every instance when done.
+    Arrays obtained from a closed instance must not be used.
+
+    Attributes:
+        handle (SharedVolumeHandle): A picklable handle to attach with.
+        array (numpy.ndarray): The volume.
+    """
+    def __init__(self, shm: shared_memory.SharedMemory, handle: SharedVolumeHandle, holder, *, writeable: bool):
+        """ Use `SharedVolume.publish` or `SharedVolume.attach` instead. """
+        self._shm = shm
+        self._holder = holder
+        self.handle = handle
+        self.array = np.ndarray(handle.shape, dtype=handle.dtype, buffer=shm.buf, offset=_HEADER_SIZE)
+        self.array.flags.writeable = writeable
+        self._closed = False
+
+    def __repr__(self):
+        state = "closed" if self._closed else f"{self.refcount} references"
+        return f'<SharedVolume {self.handle.name} ({state})>'
+
+    def __enter__(self) -> 'SharedVolume':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    def _add_reference(self, delta: int) -> int:
+        """ Atomically change the reference count, across processes. """
+        counter = np.ndarray((1,), dtype=np.int64, buffer=self._shm.buf)
+        with open(_lock_path(self.handle.name), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            counter[0] += delta
+            count = int(counter[0])
+        del counter
+        return count
+
+    @property
+    def refcount(self) -> int:
+        """ The number of open instances of this volume, across all processes, including any that crashed without closing. """
+        return int(np.ndarray((1,), dtype=np.int64, buffer=self._shm.buf)[0])
+
+    @classmethod
+    def publish(cls, array: np.ndarray) -> 'SharedVolume':
+        """Copy an array into a new shared memory block.
+
+        Args:
+            array (numpy.ndarray): The volume to share.
+
+        Returns:
+            The new SharedVolume, holding the first reference.
+        """
+        array = np.asarray(array)
+        name = f"{_NAME_PREFIX}{secrets.token_hex(8)}"
+        # Hold the block before it exists, so a sweep never frees it early
+        holder = _hold(name, create=True)
+        try:
+            shm = _open_shared_memory(name, _HEADER_SIZE + max(array.nbytes, 1), create=True)
+        except BaseException:
+            holder.close()
+            raise
+        handle = SharedVolumeHandle(shm.name, array.shape, array.dtype.str)
+        volume = cls(shm, handle, holder, writeable=True)
+        volume.array[...] = array
+        volume._add_reference(1)
+        return volume
+
+    @classmethod
+    def attach(cls, handle: SharedVolumeHandle) -> 'SharedVolume':
+        """Attach to a shared volume published by any process.
+
+        Args:
+            handle (SharedVolumeHandle): The handle of the volume.
+
+        Returns:
+            A new read-only SharedVolume, holding one more reference.
+
+        Raises:
+            FileNotFoundError: If the volume no longer exists.
+        """
+        holder = _hold(handle.name)
+        try:
+            shm = _open_shared_memory(handle.name)
+        except BaseException:
+            holder.close()
+            raise
+        volume = cls(shm, handle, holder, writeable=False)
+        volume._add_reference(1)
+        return volume
+
+    def close(self):
+        """
+        Release this instance's reference. The shared memory is freed once
+        every instance in every live process has been closed.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._add_reference(-1)
+        self.array = None
+        self._holder.close()
+        # Instances in processes that died no longer hold the block
+        _free_if_unheld(self.handle.name)
+        try:
+            self._shm.close()
+        except BufferError:
+            # Arrays derived from this volume are still alive; the mapping is
+            # released when they are garbage collected.
+            pass
+
+class SharedTomogram(Tomogram):
+    """A tomogram whose data lives in a `SharedVolume`.
+
+    Attributes:
+        volume (SharedVolume): The shared volume holding the data.
+    """
+    __slots__ = ('volume',)
+
+    def __init__(self, volume: SharedVolume, annotations: Optional[List[Annotation]] = None):
+        """Initialize a SharedTomogram instance.
+
+        Args:
+            volume (SharedVolume): The shared volume holding the data.
+            annotations (list of Annotation, optional): Annotations corresponding to the tomogram. Defaults to None.
+        """
+        self.volume = volume
+        super().__init__(volume.array, annotations)
+
+    def __enter__(self) -> 'SharedTomogram':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @classmethod
+    def attach(cls, handle: SharedVolumeHandle, annotations: Optional[List[Annotation]] = None) -> 'SharedTomogram':
+        """Attach to a tomogram volume shared by another process.
+
+        Args:
+            handle (SharedVolumeHandle): The handle of the shared volume.
+            annotations (list of Annotation, optional): Annotations corresponding to the tomogram. Defaults to None.
+
+        Returns:
+            The SharedTomogram.
+        """
+        return cls(SharedVolume.attach(handle), annotations)
+
+    def close(self):
+        """ Release this tomogram's reference to the shared volume. """
+        self.data = None
+        self.volume.close()
@@ -1,9 +1,14 @@
-from .tomogram import Tomogram
+from .tomogram import Tomogram, TomogramFile
 from .annotation import Annotation
+from .instrumentation import instrument
+from .writer import _voxel_size
 
 import numpy as np
 
-from typing import List, Optional
+from typing import TYPE_CHECKING, List, Optional, Sequence
+
+if TYPE_CHECKING:
+    from .filtering import BandpassFilter
 
 def _in_bounds(shape: np.ndarray, point: np.ndarray) -> bool:
     """ 
@@ -21,10 +26,70 @@ def _in_bounds(shape: np.ndarray, point: np.ndarray) -> bool:
             return False
     return True
 
+def _positive_lower_bounds(
+        shape: Sequence[int],
+        vol_shape: Sequence[int],
+        pads: Sequence[int],
+        point: np.ndarray,
+        gen: np.random.Generator
+    ) -> np.ndarray:
+    """ 
+    Random lower bounds of a volume of shape `vol_shape` that contains `point`
+    no closer than `pads` voxels to its borders.
+    """
+    possible_lower_bounds = [np.linspace(
+                                    max(0, pt - vs + pad),
+                                    min(ts - vs, pt - pad),
+                                    endpoint=False,
+                                    dtype=int
+                                )
+        for (ts, vs, pt, pad) in zip(shape, vol_shape, point, pads)]
+    return np.array([gen.choice(lb, shuffle=False) for lb in possible_lower_bounds])
+
+def _negative_lower_bounds(
+        shape: Sequence[int],
+        vol_shape: Sequence[int],
+        points: np.ndarray,
+        gen: np.random.Generator,
+        maxiter: int = 1000
+    ) -> np.ndarray:
+    """ 
+    Random lower bounds of a volume of shape `vol_shape` that contains none of
+    the (N, 3) `points`.
+
+    Raises:
+        Exception: If no such volume is found after `maxiter` attempts.
+    """
+    possible_lower_bounds = [np.linspace(
+                                    0,
+                                    ts - vs,
+                                    endpoint=False,
+                                    dtype=int
+                                )
+                    for (ts, vs) in zip(shape, vol_shape)]
+    # Generate completely random bounds until one has no annotations
+    for iter in range(maxiter):
+        lower_bounds = np.array([gen.choice(lb, shuffle=False)
+                            for lb in possible_lower_bounds])
+
+        # Check if this volume contains any annotation points
+        new_points = points - lower_bounds
+        contains_annotation = np.any(np.all((new_points >= 0) & (new_points < vol_shape), axis=1))
+
+        if not contains_annotation:
+            return lower_bounds
+
+    raise Exception("Failed to find a volume without an annotation")
+
 class Subtomogram(Tomogram):
     """ 
     A class representing a subtomogram extracted from a parent tomogram.
 
+    A subtomogram is a lightweight view: it stores only its bounds and a
+    reference to its parent. Its data and annotations are computed from the
+    parent on first access and cached. The data is a view into the parent's
+    data, not a copy.
+
     Attributes:
         parent_tomogram (Tomogram): The tomogram from which this subtomogram was created.
 
@@ -32,10 +97,22 @@ class Subtomogram(Tomogram):
 
         data (np.ndarray): The 3D data of the subtomogram.
 
-        shape (np.ndarray): The shape of the subtomogram.
-    """
+        annotations (list of Annotation): The parent's annotations, offset to this subtomogram and restricted to the points inside it.
+
+        shape (tuple of int): The shape of the subtomogram.
 
-    def __init__(self, parent_tomogram: 'Tomogram', lower_bounds: np.ndarray, shape: np.ndarray) -> None:
+        bandpass (BandpassFilter): A filter applied to the data when it is first accessed, or None.
+    """
+    __slots__ = ('parent_tomogram', 'lower_bounds', 'bandpass', '_data', '_annotations')
+
+    def __init__(
+            self,
+            parent_tomogram: 'Tomogram',
+            lower_bounds: np.ndarray,
+            shape: np.ndarray,
+            *,
+            bandpass: Optional['BandpassFilter'] = None
+        ) -> None:
         """ 
         Initializes a Subtomogram instance.
 
@@ -45,39 +122,107 @@ class Subtomogram(Tomogram):
             lower_bounds (np.ndarray): The lower bounds for the subtomogram.
 
             shape (np.ndarray): The shape of the subtomogram.
+
+            bandpass (BandpassFilter, optional): A filter to apply to the data. The filtered data is a float32 copy rather than a view. Defaults to None.
         """
         self.parent_tomogram = parent_tomogram
-        self.lower_bounds = lower_bounds
-
-        # Modify annotations from the parent tomogram to match this tomogram
-        new_annotations: List[Annotation] = []
-        for parent_annotation in self.parent_tomogram.annotations:
-            new_points: List[np.ndarray] = []
-            # Offset original points for this new subtomogram
-            for point in parent_annotation.points:
-                new_point = point - lower_bounds
-                # Check if new_point is even in the new tomogram
-                if _in_bounds(shape, new_point):
-                    new_points.append(new_point)
-                # Otherwise continue
-            # Add the annotation only if there are points in it
-            if len(new_points) > 0:
-                new_annotations.append(Annotation(
-                    new_points,
-                    parent_annotation.name
-                ))
-
+        self.lower_bounds = np.asarray(lower_bounds, dtype=int)
+        # Clip to the parent, just as slicing the parent's data would
+        self.shape = tuple(
+            int(min(s, ps - lb))
+            for (s, ps, lb) in zip(shape, parent_tomogram.shape, self.lower_bounds)
+        )
+        self.bandpass = bandpass
+        self._data = None
+        self._annotations = None
+
+    def _unfiltered_data(self) -> np.ndarray:
+        """ 
+        The subtomogram's region of the parent's data. If the parent's data
+        is not loaded, the region is read through a memory map of its file and
+        contrast stretched with the parent's limits, as loading would have.
+        """
         # Get subvolume data using lower bounds and shape
-        min_0, min_1, min_2 = lower_bounds
-        shape_0, shape_1, shape_2 = shape
-        new_data = parent_tomogram.data[
+        min_0, min_1, min_2 = self.lower_bounds
+        shape_0, shape_1, shape_2 = self.shape
+        source = self.parent_tomogram._tile_source()
+        region = source[
             min_0 : min_0 + shape_0,
             min_1 : min_1 + shape_1,
             min_2 : min_2 + shape_2
         ]
+        if isinstance(source, np.memmap):
+            region = TomogramFile.contrast_stretch(region, self.parent_tomogram._stretch_limits())
+        return region
+
+    @property
+    def data(self) -> np.ndarray:
+        """ 
+        The subtomogram's data, sliced from the parent (and filtered, if a
+        bandpass filter is set) on first access. 
+        """
+        if self._data is None:
+            if self.bandpass is None:
+                self._data = self._unfiltered_data()
+            else:
+                self._data = self.bandpass(self._unfiltered_data(), spacing=_voxel_size(self))
+        return self._data
+
+    @data.setter
+    def data(self, value: np.ndarray):
+        self._data = value
+
+    def _tile_source(self) -> np.ndarray:
+        """ 
+        Tiles are read from the subtomogram's data, which is sliced from a
+        memory map of the root file when no tomogram above it has data loaded.
+        """
+        return self.data
+
+    @property
+    def annotations(self) -> List[Annotation]:
+        """ 
+        The parent's annotations offset for this subtomogram, computed on first
+        access. Annotations without any points inside the subtomogram are left
+        out.
+        """
+        if self._annotations is None:
+            self._annotations = self._offset_annotations()
+        return self._annotations
 
-        # Initialize this new Tomogram
-        super().__init__(new_data, new_annotations)
+    @annotations.setter
+    def annotations(self, value: List[Annotation]):
+        self._annotations = value
+
+    def _offset_annotations(self) -> List[Annotation]:
+        """ Modify annotations from the parent tomogram to match this tomogram. """
+        new_annotations: List[Annotation] = []
+        parent_annotations = self.parent_tomogram.annotations
+        if parent_annotations is None:
+            return new_annotations
+        shape = np.array(self.shape)
+        for parent_annotation in parent_annotations:
+            if len(parent_annotation.points) == 0:
+                continue
+            # Offset original points for this new subtomogram
+            points = np.asarray(parent_annotation.points).reshape(-1, len(shape)) - self.lower_bounds
+            # Keep only the points inside this subtomogram
+            inside = np.all((points >= 0) & (points < shape), axis=1)
+            # Add the annotation only if there are points in it
+            if inside.any():
+                sources = parent_annotation.sources
+                if sources is not None:
+                    sources = [sources[i] for i in np.flatnonzero(inside)]
+                scores = parent_annotation.scores
+                if scores is not None:
+                    scores = np.asarray(scores)[inside]
+                new_annotations.append(Annotation(
+                    list(points[inside]),
+                    parent_annotation.name,
+                    sources,
+                    scores
+                ))
+        return new_annotations
 
 
 class SubtomogramGenerator:
@@ -94,6 +239,8 @@ class SubtomogramGenerator:
         pads (Tuple[int, int, int]): The padding to apply to the boundaries.
 
         gen (np.random.Generator): Random number generator for sampling.
+
+        bandpass (BandpassFilter): A filter applied to the data of each sampled subtomogram, or None.
     """
 
     def __init__(self, tomogram: 'Tomogram') -> None:
@@ -104,11 +251,13 @@ class SubtomogramGenerator:
             tomogram (Tomogram): The parent tomogram to sample from.
         """
         self.tomogram = tomogram
-        self.tomogram.load()
+        # Loads the data of a TomogramFile if it has not been loaded yet
+        self.tomogram.get_data()
         self.annotations = self.tomogram.annotations
         self.vol_shape = (64, 256, 256)
         self.pads = (8, 32, 32)
         self.gen = np.random.default_rng()
+        self.bandpass = None
 
     def set_vol_shape(self, new_vol_shape: tuple[int, int, int]):
         """ 
@@ -119,6 +268,7 @@ class SubtomogramGenerator:
         """
         self.vol_shape = new_vol_shape
 
+    @instrument()
     def positive_sample(self, point: Optional[np.ndarray] = None) -> Subtomogram:
         """ 
         Returns a random subtomogram containing the specified point.
@@ -138,19 +288,12 @@ class SubtomogramGenerator:
             annotation = self.gen.choice(self.annotations)
             point = self.gen.choice(annotation.points)
 
-        possible_lower_bounds = [np.linspace(
-                                        max(0, pt - vs + pad),
-                                        min(ts - vs, pt - pad),
-                                        endpoint=False,
-                                        dtype=int
-                                    )
-            for (ts, vs, pt, pad) in zip(self.tomogram.shape, self.vol_shape, point, self.pads)]
-        
-        lower_bounds = [self.gen.choice(lb, shuffle=False) for lb in possible_lower_bounds]
+        lower_bounds = _positive_lower_bounds(self.tomogram.shape, self.vol_shape, self.pads, point, self.gen)
 
         # Construct a new Tomogram with modified annotations
-        return Subtomogram(self.tomogram, lower_bounds, self.vol_shape)
+        return Subtomogram(self.tomogram, lower_bounds, self.vol_shape, bandpass=self.bandpass)
 
+    @instrument()
     def negative_sample(self) -> Subtomogram:
         """ 
         Returns a random subtomogram that does not contain any points from the
@@ -165,32 +308,10 @@ class SubtomogramGenerator:
         Raises:
             Exception: If unable to find a valid subtomogram without annotation points after 1000 attempts.
         """
-        # Generate completely random bounds until one has no annotations
-        maxiter = 1000
-        for iter in range(maxiter):
-            possible_lower_bounds = [np.linspace(
-                                            0,
-                                            ts - vs,
-                                            endpoint=False,
-                                            dtype=int
-                                        )
-                            for (ts, vs) in zip(self.tomogram.shape, self.vol_shape)]
-            
-            lower_bounds = [self.gen.choice(lb, shuffle=False)
-                                for lb in possible_lower_bounds]
-            
-            # Check if this volume contains any annotation points
-            contains_annotation = False
-            for point in self.tomogram.annotation_points():
-                new_point = point - lower_bounds
-                if _in_bounds(self.vol_shape, new_point):
-                    contains_annotation = True
-                    break
-            
-            if not contains_annotation:
-                return Subtomogram(self.tomogram, lower_bounds, self.vol_shape)
-        
-        raise Exception("Failed to find a volume without an annotation")
+        points = np.array(self.tomogram.annotation_points()).reshape(-1, len(self.vol_shape))
+
+        lower_bounds = _negative_lower_bounds(self.tomogram.shape, self.vol_shape, points, self.gen)
+        return Subtomogram(self.tomogram, lower_bounds, self.vol_shape, bandpass=self.bandpass)
     
     def find_annotation_points(self) -> List[np.ndarray]:
         """ 
@@ -201,7 +322,7 @@ class SubtomogramGenerator:
         """
         points: List[np.ndarray] = []
         for annotation in self.annotations:
-            points += annotation.points
+            points.extend(annotation.points)
         return points
 
 
@@ -3,22 +3,75 @@ A collection of utilities for use on BYU's supercomputer.
 """
 
 
+import copy
+import functools
+import json
 import re
 import os
-from .annotation import AnnotationFile
+import tempfile
+import zlib
+
+import numpy as np
+
+from .annotation import Annotation, AnnotationFile
+from .annotation_store import AnnotationStore
 from .tomogram import TomogramFile
+from .instrumentation import instrument
+from .metadata import TomogramMetadata
+from .parallel import Failure, MapResult, iter_process_map, process_map
+from .fingerprint import fingerprint_files
+from .points import merge_points
+from .evaluation import DetectionScore, evaluate_detections
+from .normalization import IntensityStats, header_value_range, volume_stats, volume_value_range
+from .thumbnails import Thumbnails, thumbnail_path, tomogram_thumbnails
 
-from typing import List, Union, Optional
-import pdb
-from tqdm import tqdm
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
 import warnings
 warnings.simplefilter("ignore") # Don't really need to deal with warnings right now.
 
-def _combine_tomos(tomo1: TomogramFile, tomo2: TomogramFile) -> TomogramFile:
+def _merge_annotations(annotations: List[Annotation], sources: List[str], tolerance: float) -> List[Annotation]:
+    """
+    Merge the points of annotations with the same name from different files
+    that lie within `tolerance` voxels of each other, so that a particle
+    annotated in several files is counted once. Points that share a file,
+    including points already merged from it, are never merged with each other
+    (see `merge_points`). `sources` names where each annotation came from;
+    every merged point records the sources that contributed to it.
+    """
+    groups = dict()
+    for annotation, source in zip(annotations, sources):
+        groups.setdefault(annotation.name, []).append((annotation, source))
+
+    merged_annotations = []
+    for group in groups.values():
+        if len(group) == 1:
+            merged_annotations.append(group[0][0])
+            continue
+        # Identify each file by an integer; a merged point has several
+        file_ids = dict()
+        points, ids = [], []
+        for annotation, source in group:
+            annotation_points = np.asarray(annotation.points, dtype=np.float64).reshape(-1, 3)
+            point_sources = annotation.sources or [(source,)] * len(annotation_points)
+            points.append(annotation_points)
+            ids.extend([file_ids.setdefault(f, len(file_ids)) for f in s] for s in point_sources)
+        files = list(file_ids)
+        merged, contributors = merge_points(np.concatenate(points), tolerance, ids)
+        # Keep the first annotation's type and file, with the merged points
+        annotation = copy.copy(group[0][0])
+        annotation.points = list(merged)
+        annotation.sources = [tuple(sorted(files[i] for i in point_ids)) for point_ids in contributors]
+        annotation.scores = None
+        merged_annotations.append(annotation)
+    return merged_annotations
+
+def _combine_tomos(tomo1: TomogramFile, tomo2: TomogramFile, tolerance: Optional[float] = 3.0) -> TomogramFile:
     """ 
     Combines two conceivably duplicate tomograms into one by merging their
     annotations. All other attributes are taken from `tomo1`, like filepath
-    and such.
+    and such. Points of same-named annotations within `tolerance` voxels of
+    each other are merged into one; if `tolerance` is None, annotations are
+    simply concatenated.
     """
     # Ensure that each tomogram has a list for its annotations, even if it is
     # empty
@@ -28,41 +81,168 @@ def _combine_tomos(tomo1: TomogramFile, tomo2: TomogramFile) -> TomogramFile:
         tomo2.annotations = []
     # Combine annotations
     combined_annotations = tomo1.annotations + tomo2.annotations
+    if tolerance is not None:
+        sources = [
+            getattr(annotation, "filepath", tomo.filepath)
+            for tomo in (tomo1, tomo2) for annotation in tomo.annotations
+        ]
+        combined_annotations = _merge_annotations(combined_annotations, sources, tolerance)
     new_tomo = tomo1
     new_tomo.annotations = combined_annotations
     # Choose shortest filepath
     new_tomo.filepath = min(tomo1.filepath, tomo2.filepath, key=len)
+    # Cached fingerprints describe the file that is kept
+    if new_tomo.filepath != tomo1.filepath:
+        new_tomo._fingerprints = dict(tomo2._fingerprints)
     return new_tomo
 
 def _get_label(tomo: TomogramFile) -> str:
     """ Tomogram "labels" are the filename without path nor extension. """
     return os.path.splitext(os.path.basename(tomo.filepath))[0]
 
+def _resample_tomogram(args: tuple) -> TomogramFile:
+    """ Process pool worker for `SCTomogramSet.resample`. """
+    tomo, target_spacing, cache_dir, block_depth = args
+    return tomo.resample(target_spacing, cache_dir, block_depth=block_depth)
+
+def _tomogram_value_range(args: tuple) -> Tuple[float, float]:
+    """ Process pool worker for `SCTomogramSet.compute_intensity_stats`. """
+    tomo, block_depth = args
+    return volume_value_range(tomo.memmap(), block_depth=block_depth)
+
+def _tomogram_intensity_stats(tomo: TomogramFile, bins: int, value_range: Tuple[float, float], block_depth: int) -> IntensityStats:
+    """ Process pool worker for `SCTomogramSet.compute_intensity_stats`. """
+    return volume_stats(tomo.memmap(), bins, value_range, block_depth=block_depth)
+
+def _tomogram_thumbnails(tomo: TomogramFile, cache_dir: str, size: int, slab_depth: int, block_depth: int) -> Thumbnails:
+    """ Process pool worker for `SCTomogramSet.thumbnails`. """
+    return tomogram_thumbnails(tomo, cache_dir, size=size, slab_depth=slab_depth, block_depth=block_depth)
+
+def _evaluate_tomogram(
+        item: Tuple[TomogramFile, Union[Annotation, np.ndarray]],
+        max_distance: float,
+        method: str,
+        name: Optional[str]
+    ) -> DetectionScore:
+    """ Process pool worker for `SCTomogramSet.evaluate`. """
+    tomo, predicted = item
+    truth = [
+        point
+        for annotation in tomo.annotations or []
+        if name is None or annotation.name == name
+        for point in annotation.points
+    ]
+    return evaluate_detections(predicted, truth, max_distance, method=method)
+
+def _get_drive(filepath: str) -> str:
+    """ 
+    The supercomputer group directory a file is stored in, like
+    `grp_tomo_db1_d1`, or an empty string if it is not under `/grphome`.
+    """
+    match = re.match(r"/grphome/([^/]+)/", filepath)
+    return match.group(1) if match else ""
+
 class SCTomogramSet():
-    """ A class to manage the tomograms we work with on the supercomputer. """
-    def __init__(self):
+    """ 
+    A class to manage the tomograms we work with on the supercomputer.
+
+    Tomograms are stored by label. By default, tomograms are deduplicated by
+    content fingerprint (see `TomogramFile.fingerprint`): identical copies
+    under different names are combined into one tomogram, and different
+    tomograms that share a filename are kept apart under distinct labels. Set
+    `dedupe="label"` to deduplicate by filename alone.
+
+    Attributes:
+        tomograms (dict): Tomograms by label.
+        private (dict): Whether each tomogram is private, by label.
+        aliases (dict): Every file path found for each tomogram, by label.
+        intensity_stats (IntensityStats): Raw intensity statistics of the whole set, once computed by `normalize`.
+        dedupe (str): Either "fingerprint" or "label".
+        full_hash (bool): Whether fingerprints hash whole files.
+        merge_tolerance (float): The distance in voxels within which annotation points of combined duplicates, from different files, are merged into one, or None to keep every point.
+    """
+    def __init__(self, *, dedupe: str = "fingerprint", full_hash: bool = False, merge_tolerance: Optional[float] = 3.0):
+        if dedupe not in ("fingerprint", "label"):
+            raise ValueError(f'Unknown dedupe mode "{dedupe}". Use "fingerprint" or "label".')
         self.tomograms = dict()
         self.private = dict()
+        self.aliases = dict()
+        self.dedupe = dedupe
+        self.full_hash = full_hash
+        self.merge_tolerance = merge_tolerance
+        self._labels_by_fingerprint = dict()
+        self._metadata = None
+        self.intensity_stats = None
     def __repr__(self):
         return f'<SCTomogramSet containing {len(self.tomograms)} tomograms>'
+    def __getstate__(self) -> dict:
+        """ 
+        Pickle the set without its cached metadata table, which `metadata()`
+        rebuilds on demand. Tomograms and annotations pickle compactly on their
+        own (see `TomogramFile.__getstate__`).
+        """
+        state = self.__dict__.copy()
+        state['_metadata'] = None
+        return state
+    def _fingerprint(self, tomo: TomogramFile) -> Optional[str]:
+        """ The fingerprint of a tomogram, or None if its file cannot be read. """
+        try:
+            return tomo.fingerprint(full=self.full_hash)
+        except OSError:
+            return None
+    def _unique_label(self, label: str) -> str:
+        """ A label based on `label` that is not yet in the set. """
+        n = 1
+        while f"{label}~{n}" in self.tomograms:
+            n += 1
+        return f"{label}~{n}"
     def append(self, new_tomogram: TomogramFile, private: bool = True):
         """ Add a tomogram to the set. Assume it is private if `private` is not set. """
+        self._metadata = None
         label = _get_label(new_tomogram)
+        key = self._fingerprint(new_tomogram) if self.dedupe == "fingerprint" else None
+        if key is not None:
+            if key in self._labels_by_fingerprint:
+                # Same content as a tomogram already present
+                label = self._labels_by_fingerprint[key]
+            elif label in self.tomograms:
+                # Same name as a different tomogram
+                label = self._unique_label(label)
+            self._labels_by_fingerprint[key] = label
         # If the tomogram isn't present, add it
         if label not in self.tomograms:
             self.tomograms[label] = new_tomogram
             self.private[label] = private
+            self.aliases[label] = [new_tomogram.filepath]
         # Otherwise, combine its annotations with the existing tomogram's
         # annotations. 
         else:
-            self.tomograms[label] = _combine_tomos(self.tomograms[label], new_tomogram)
+            self.tomograms[label] = _combine_tomos(self.tomograms[label], new_tomogram, self.merge_tolerance)
+            if new_tomogram.filepath not in self.aliases[label]:
+                self.aliases[label].append(new_tomogram.filepath)
             # If two matching tomograms have different privacy, make them both public
             if self.private[label] != private:
                 self.private[label] = False
+    def extend(self, new_tomograms: List[TomogramFile], private: bool = True, *, workers: int = 8):
+        """ 
+        Add several tomograms to the set, as with `append`. Fingerprints that
+        are not cached yet are computed concurrently with `workers` threads
+        first.
+        """
+        if self.dedupe == "fingerprint":
+            # Fingerprints that are already cached are not computed again
+            kind = "full" if self.full_hash else "fast"
+            missing = [tomo for tomo in new_tomograms if kind not in tomo._fingerprints]
+            keys = fingerprint_files([tomo.filepath for tomo in missing], full=self.full_hash, workers=workers)
+            for tomo, key in zip(missing, keys):
+                if key is not None:
+                    tomo._fingerprints[kind] = key
+        for tomo in new_tomograms:
+            self.append(tomo, private=private)
 
     def get_all_tomograms(self) -> List[TomogramFile]:
         """ Get all of the supercomputer tomograms. """
-        return self.tomogram.values()
+        return list(self.tomograms.values())
     def get_private_tomograms(self) -> List[TomogramFile]:
         """ Get all of the private (test) supercomputer tomograms. """
         requested_tomograms = []
@@ -98,313 +278,803 @@ class SCTomogramSet():
         requested_tomograms = self.get_private_tomograms()
         return [tomo for tomo in requested_tomograms if not tomo.is_annotated()]
 
-def get_fm_tomogram_set() -> SCTomogramSet:
+    def imap(
+            self,
+            fn: Callable[[TomogramFile], Any],
+            *,
+            labels: Optional[Sequence[str]] = None,
+            workers: Optional[int] = None,
+            retries: int = 0,
+            progress: bool = True
+        ) -> Iterator[Tuple[str, Any]]:
+        """
+        Apply `fn` to tomograms in the set across a process pool, yielding
+        results as they complete.
+
+        Tomograms are scheduled largest file first, so that the pool stays
+        busy until the end. A tomogram for which `fn` raises is retried up to
+        `retries` times, and a `Failure` is yielded in place of its result if
+        it never succeeds.
+
+        Args:
+            fn (callable): A picklable (i.e., module-level) function of one TomogramFile.
+
+            labels (sequence of str, optional): The labels of the tomograms to process. Defaults to None, which processes every tomogram.
+
+            workers (int, optional): The number of worker processes. Use 1 to run in this process. Defaults to None, which uses every CPU.
+
+            retries (int, optional): How many times to retry a failed tomogram. Defaults to 0.
+
+            progress (bool, optional): Whether to show a progress bar. Defaults to True.
+
+        Yields:
+            Pairs of a tomogram label and the result of `fn` (or a `Failure`).
+        """
+        labels = list(self.tomograms) if labels is None else list(labels)
+        tomos = [self.tomograms[label] for label in labels]
+        for index, result in iter_process_map(
+                fn,
+                tomos,
+                workers=workers,
+                weights=[os.path.getsize(tomo.filepath) for tomo in tomos],
+                retries=retries,
+                progress=progress
+            ):
+            yield labels[index], result
+
+    def map(
+            self,
+            fn: Callable[[TomogramFile], Any],
+            *,
+            labels: Optional[Sequence[str]] = None,
+            workers: Optional[int] = None,
+            retries: int = 0,
+            progress: bool = True
+        ) -> MapResult:
+        """
+        Apply `fn` to tomograms in the set across a process pool. See `imap`.
+
+        Returns:
+            A MapResult with the result of each tomogram that succeeded and a `Failure` for each one that did not, by label.
+        """
+        mapped = MapResult()
+        for label, result in self.imap(fn, labels=labels, workers=workers, retries=retries, progress=progress):
+            if isinstance(result, Failure):
+                mapped.failures[label] = result
+            else:
+                mapped.results[label] = result
+        return mapped
+
+    def reduce(
+            self,
+            fn: Callable[[TomogramFile], Any],
+            combine: Callable[[Any, Any], Any],
+            initial: Any = None,
+            *,
+            labels: Optional[Sequence[str]] = None,
+            workers: Optional[int] = None,
+            retries: int = 0,
+            skip_failures: bool = False,
+            progress: bool = True
+        ) -> Any:
+        """
+        Apply `fn` to tomograms in the set across a process pool and combine
+        the results as they arrive, e.g., to sum histograms. `combine` runs in
+        this process, so it may be a lambda. See `imap`.
+
+        Args:
+            fn (callable): A picklable (i.e., module-level) function of one TomogramFile.
+
+            combine (callable): Combines the running value with one result and returns the new running value.
+
+            initial (optional): The starting value. Defaults to None, in which case the first result is used.
+
+            labels (sequence of str, optional): The labels of the tomograms to process. Defaults to None, which processes every tomogram.
+
+            workers (int, optional): The number of worker processes. Defaults to None, which uses every CPU.
+
+            retries (int, optional): How many times to retry a failed tomogram. Defaults to 0.
+
+            skip_failures (bool, optional): Whether to leave out tomograms that fail rather than raising. Defaults to False.
+
+            progress (bool, optional): Whether to show a progress bar. Defaults to True.
+
+        Returns:
+            The combined value.
+
+        Raises:
+            RuntimeError: If a tomogram fails and `skip_failures` is False.
+        """
+        value = initial
+        first = initial is None
+        for label, result in self.imap(fn, labels=labels, workers=workers, retries=retries, progress=progress):
+            if isinstance(result, Failure):
+                if skip_failures:
+                    continue
+                raise RuntimeError(f"Failed to process tomogram {label}") from result.error
+            if first:
+                value, first = result, False
+            else:
+                value = combine(value, result)
+        return value
+
+    def resample(
+            self,
+            target_spacing: float,
+            cache_dir: str,
+            *,
+            workers: Optional[int] = None,
+            block_depth: int = 16,
+            progress: bool = True
+        ) -> 'SCTomogramSet':
+        """
+        Resample every tomogram in the set to a common voxel spacing, using a
+        process pool. Resampled tomograms are cached in `cache_dir`, so later
+        calls with the same spacing only check for the cached files.
+        Annotations are scaled in memory each time, not cached. See
+        `TomogramFile.resample`.
+
+        Args:
+            target_spacing (float): The new voxel spacing in Ångstroms.
+
+            cache_dir (str): The directory to cache resampled tomograms in.
+
+            workers (int, optional): The number of worker processes. Defaults to None, which uses every CPU.
+
+            block_depth (int, optional): The number of output sections computed at once. Defaults to 16.
+
+            progress (bool, optional): Whether to show a progress bar. Defaults to True.
+
+        Returns:
+            A new SCTomogramSet of the resampled tomograms, with the same labels, privacy, aliases and deduplication settings.
+        """
+        labels = list(self.tomograms)
+        tomos = [self.tomograms[label] for label in labels]
+        resampled = process_map(
+            _resample_tomogram,
+            [(tomo, target_spacing, cache_dir, block_depth) for tomo in tomos],
+            workers=workers,
+            weights=[os.path.getsize(tomo.filepath) for tomo in tomos],
+            progress=progress,
+            desc="Resampling"
+        )
+        new_set = SCTomogramSet(dedupe=self.dedupe, full_hash=self.full_hash, merge_tolerance=self.merge_tolerance)
+        for label, tomo in zip(labels, resampled):
+            new_set.tomograms[label] = tomo
+            new_set.private[label] = self.private[label]
+            new_set.aliases[label] = list(self.aliases[label])
+        return new_set
+
+    def thumbnails(
+            self,
+            cache_dir: str,
+            *,
+            size: int = 256,
+            slab_depth: int = 16,
+            workers: Optional[int] = None,
+            block_depth: int = 16,
+            progress: bool = True
+        ) -> Dict[str, Thumbnails]:
+        """
+        Get projection thumbnails of every tomogram in the set, for browsing
+        and quality control. See `tomogram_thumbnails`.
+
+        Thumbnails are cached in `cache_dir` by content fingerprint. Those
+        already cached are loaded directly; the rest are computed across a
+        process pool, reading each file once, one slab at a time.
+
+        Args:
+            cache_dir (str): The directory to cache thumbnails in.
+
+            size (int, optional): The largest image dimension. Defaults to 256.
+
+            slab_depth (int, optional): The number of central sections averaged in the "slab" image. Defaults to 16.
+
+            workers (int, optional): The number of worker processes. Defaults to None, which uses every CPU.
+
+            block_depth (int, optional): The number of sections read at once. Defaults to 16.
+
+            progress (bool, optional): Whether to show a progress bar. Defaults to True.
+
+        Returns:
+            Thumbnails by tomogram label, with each tomogram's annotation points.
+        """
+        thumbnails = dict()
+        missing = []
+        for label, tomo in self.tomograms.items():
+            if os.path.exists(thumbnail_path(cache_dir, tomo.fingerprint(), size, slab_depth)):
+                thumbnails[label] = tomogram_thumbnails(tomo, cache_dir, size=size, slab_depth=slab_depth)
+            else:
+                missing.append(label)
+        if missing:
+            fn = functools.partial(
+                _tomogram_thumbnails, cache_dir=cache_dir, size=size, slab_depth=slab_depth, block_depth=block_depth
+            )
+            tomos = [self.tomograms[label] for label in missing]
+            computed = process_map(
+                fn,
+                tomos,
+                workers=workers,
+                weights=[os.path.getsize(tomo.filepath) for tomo in tomos],
+                progress=progress,
+                desc="Rendering thumbnails"
+            )
+            thumbnails.update(zip(missing, computed))
+        # In the order of the set
+        return {label: thumbnails[label] for label in self.tomograms}
+
+    def evaluate(
+            self,
+            predictions: Dict[str, Union[Annotation, np.ndarray]],
+            max_distance: float,
+            *,
+            method: str = "greedy",
+            name: Optional[str] = None,
+            workers: Optional[int] = None,
+            progress: bool = True
+        ) -> Tuple[Dict[str, DetectionScore], DetectionScore]:
+        """
+        Score predicted points against the annotations of every tomogram in
+        the set, across a process pool. See `evaluate_detections`.
+
+        Tomograms without predictions are scored as if nothing was predicted,
+        so their annotations count as missed.
+
+        Args:
+            predictions (dict): Predicted points by tomogram label, as Annotations (e.g., from `find_peaks`) or (N, 3) arrays.
+
+            max_distance (float): The largest distance between matched points, in voxels.
+
+            method (str, optional): "greedy" or "optimal". Defaults to "greedy".
+
+            name (str, optional): Only compare against annotations with this name. Defaults to None, which uses every annotation.
+
+            workers (int, optional): The number of worker processes. Defaults to None, which uses every CPU.
+
+            progress (bool, optional): Whether to show a progress bar. Defaults to True.
+
+        Returns:
+            The score of each tomogram by label, and the total score over the set.
+
+        Raises:
+            KeyError: If a prediction's label is not in the set.
+        """
+        unknown = set(predictions) - set(self.tomograms)
+        if unknown:
+            raise KeyError(f"Predictions for tomograms not in the set: {sorted(unknown)}")
+        labels = list(self.tomograms)
+        items = [
+            (self.tomograms[label], predictions.get(label, np.zeros((0, 3))))
+            for label in labels
+        ]
+        fn = functools.partial(_evaluate_tomogram, max_distance=max_distance, method=method, name=name)
+        scores = process_map(fn, items, workers=workers, progress=progress, desc="Evaluating detections")
+        per_tomogram = dict(zip(labels, scores))
+        return per_tomogram, DetectionScore.total(scores)
+
+    def compute_intensity_stats(
+            self,
+            *,
+            bins: int = 4096,
+            value_range: Optional[Tuple[float, float]] = None,
+            workers: Optional[int] = None,
+            block_depth: int = 16,
+            progress: bool = True
+        ) -> IntensityStats:
+        """
+        Compute raw intensity statistics over every tomogram in the set. Each
+        file is streamed once through a memory map, one slab at a time, across
+        a process pool, and the per-tomogram statistics are merged as they
+        arrive.
+
+        The histogram range defaults to the union of the intensity ranges
+        recorded in the `.mrc` headers. Tomograms whose headers do not record
+        their range are scanned for it first, which costs one extra pass over
+        those files only.
+
+        Args:
+            bins (int, optional): The number of histogram bins. Defaults to 4096.
+
+            value_range (tuple of float, optional): The range covered by the histogram. Defaults to None, which finds it as described above.
+
+            workers (int, optional): The number of worker processes. Defaults to None, which uses every CPU.
+
+            block_depth (int, optional): The number of sections read at once. Defaults to 16.
+
+            progress (bool, optional): Whether to show a progress bar. Defaults to True.
+
+        Returns:
+            The merged statistics.
+
+        Raises:
+            ValueError: If the set has no tomograms.
+        """
+        tomos = self.get_all_tomograms()
+        if not tomos:
+            raise ValueError("Cannot compute intensity statistics of an empty tomogram set.")
+        if value_range is None:
+            ranges = [header_value_range(tomo) for tomo in tomos]
+            unknown = [tomo for (tomo, r) in zip(tomos, ranges) if r is None]
+            if unknown:
+                ranges += process_map(
+                    _tomogram_value_range,
+                    [(tomo, block_depth) for tomo in unknown],
+                    workers=workers,
+                    weights=[os.path.getsize(tomo.filepath) for tomo in unknown],
+                    progress=progress,
+                    desc="Finding intensity ranges"
+                )
+            ranges = np.array([r for r in ranges if r is not None])
+            value_range = (float(ranges[:, 0].min()), float(ranges[:, 1].max()))
+        fn = functools.partial(_tomogram_intensity_stats, bins=bins, value_range=value_range, block_depth=block_depth)
+        return self.reduce(
+            fn, lambda total, stats: total.merge(stats), IntensityStats(bins, value_range),
+            workers=workers, progress=progress
+        )
+
+    def normalize(
+            self,
+            percentiles: Tuple[float, float] = (2, 98),
+            *,
+            stats: Optional[IntensityStats] = None,
+            workers: Optional[int] = None,
+            progress: bool = True
+        ) -> Tuple[float, float]:
+        """
+        Normalize every tomogram in the set with the same contrast limits: the
+        given percentiles of the raw intensities of the whole set, rather than
+        of each tomogram alone. The limits are stored in each tomogram's
+        `intensity_limits`, which `TomogramFile.process` then applies one slab
+        at a time.
+
+        Tomograms whose data is already loaded keep it as it is, stretched with
+        their own limits; only later loads (or `get_slice` and sampling reads
+        of unloaded files) use the shared limits. Normalize before loading, or
+        call `reload()` and then `process()` on loaded tomograms.
+
+        Args:
+            percentiles (tuple of float, optional): The percentiles of the whole set's intensities used as contrast limits. Defaults to (2, 98), as in `TomogramFile.process`.
+
+            stats (IntensityStats, optional): Precomputed statistics, e.g., loaded with `IntensityStats.load`. Defaults to None, which computes them with `compute_intensity_stats`.
+
+            workers (int, optional): The number of worker processes. Defaults to None, which uses every CPU.
+
+            progress (bool, optional): Whether to show a progress bar. Defaults to True.
+
+        Returns:
+            The (low, high) contrast limits.
+
+        Raises:
+            ValueError: If `stats` is None and the set has no tomograms.
+        """
+        if stats is None:
+            stats = self.compute_intensity_stats(workers=workers, progress=progress)
+        self.intensity_stats = stats
+        low, high = (float(limit) for limit in stats.percentile(percentiles))
+        for tomo in self.tomograms.values():
+            tomo.intensity_limits = (low, high)
+        return (low, high)
+
+    def metadata(self, *, refresh: bool = False) -> TomogramMetadata:
+        """
+        Get a columnar table of the shape, voxel spacing, data type, file size,
+        annotation counts, drive and privacy of every tomogram in the set.
+
+        The table is built from the headers read when each tomogram was found
+        and is cached until the set changes, so repeated queries do not touch
+        the tomogram files. Select subsets with vectorized filters, e.g.,
+        `meta.select((meta.voxel_spacing.max(axis=1) < 15) & (meta.shape[:, 0] >= 300)).tomograms`.
+
+        Args:
+            refresh (bool, optional): Rebuild the table even if it is cached. Defaults to False.
+
+        Returns:
+            The metadata table, with one row per tomogram.
+        """
+        if self._metadata is None or refresh:
+            labels = list(self.tomograms)
+            self._metadata = TomogramMetadata.from_tomograms(
+                [self.tomograms[label] for label in labels],
+                labels=labels,
+                private=[self.private[label] for label in labels],
+                source=_get_drive
+            )
+        return self._metadata
+
+    def annotation_store(self, filepath: Optional[str] = None) -> AnnotationStore:
+        """
+        Collect every annotation in the set into one columnar store (see
+        `AnnotationStore`), and back each tomogram's annotations with views
+        into it.
+
+        If `filepath` is given, the store is saved there and memory-mapped, so
+        later sets can load every annotation at once with `load_annotations`
+        instead of parsing annotation files.
+
+        Args:
+            filepath (str, optional): Where to save the store. Defaults to None, which keeps it in memory.
+
+        Returns:
+            The store.
+        """
+        labels = list(self.tomograms)
+        store = AnnotationStore.from_tomograms([self.tomograms[label] for label in labels], labels=labels)
+        if filepath is not None:
+            store.save(filepath)
+            store = AnnotationStore.load(filepath)
+        store.attach(self.tomograms)
+        return store
+
+    def load_annotations(self, filepath: str) -> AnnotationStore:
+        """
+        Replace the annotations of the set's tomograms with those in a store
+        saved by `annotation_store`, matched by label. The store is
+        memory-mapped and no annotation files are read. Tomograms that are not
+        in the store keep their annotations. To skip reading annotation files
+        while the set is built as well, pass the store to
+        `get_fm_tomogram_set` or `merge_manifests`.
+
+        Args:
+            filepath (str): The saved store.
+
+        Returns:
+            The store.
+        """
+        self._metadata = None
+        store = AnnotationStore.load(filepath)
+        store.attach(self.tomograms)
+        return store
+
+class DiscoverySource:
+    """ 
+    A place on the supercomputer to look for tomograms, as used by
+    `discover_shard` and `get_fm_tomogram_set`.
+
+    Tomograms are found one per directory: every directory under `root` whose
+    name matches `dir_regex` is searched for a tomogram and its annotations
+    with `seek_annotated_tomos` (if `annotated`) or `seek_unannotated_tomos`
+    (if not). If `dir_regex` is None, every file directly in `root` whose name
+    matches `tomogram_regex` is taken as an unannotated tomogram instead.
+
+    Attributes:
+        root (str): The directory to search.
+        tomogram_regex (re.Pattern): The regex pattern to match tomogram filenames.
+        annotation_regexes (list of re.Pattern): Regex patterns to match annotation filenames.
+        annotation_names (list of str): A name for the annotations matched by each pattern.
+        dir_regex (re.Pattern): The regex pattern to match tomogram directory names, or None.
+        annotated (bool): Whether to collect the annotated or the unannotated tomograms.
+        private (bool): Whether the tomograms found are private.
     """
-    Collect all tomograms that have been reviewed for flagellar motors from
-    BYU's supercomputer into an SCTomogramSet. 
-    
-    From an SCTomogramSet `tomo_set`, get public tomograms with
-    `tomo_set.get_public_tomograms()`.
+    def __init__(
+            self,
+            root: str,
+            tomogram_regex: re.Pattern,
+            annotation_regexes: Sequence[re.Pattern] = (),
+            annotation_names: Sequence[str] = (),
+            *,
+            dir_regex: Optional[re.Pattern] = None,
+            annotated: bool = True,
+            private: bool = False
+        ):
+        self.root = root
+        self.tomogram_regex = tomogram_regex
+        self.annotation_regexes = list(annotation_regexes)
+        self.annotation_names = list(annotation_names)
+        self.dir_regex = dir_regex
+        self.annotated = annotated
+        self.private = private
 
-    Does not initially load the tomogram image data. Given a `Tomogram` called
-    `tomo`, one can load and access the image data in one step with
-    `tomo.get_data()`.
+    def __repr__(self):
+        kind = "annotated" if self.annotated else "unannotated"
+        privacy = "private" if self.private else "public"
+        return f'<DiscoverySource of {privacy} {kind} tomograms in {self.root}>'
 
-    Returns:
-        SCTomogramSet containing annotated tomograms
+    def units(self) -> List[str]:
+        """ 
+        Split the search into independent units of work: the entries directly
+        in `root`. Only `root` itself is listed.
+        """
+        try:
+            entries = sorted(os.scandir(self.root), key=lambda entry: entry.name)
+        except OSError:
+            return []
+        if self.dir_regex is None:
+            return [e.path for e in entries if e.is_file() and self.tomogram_regex.match(e.name)]
+        return [e.path for e in entries if e.is_dir()]
+
+    def search(self, unit: str, *, parse_annotations: bool = True) -> List[TomogramFile]:
+        """ 
+        Find the tomograms in one unit from `units()`. See
+        `seek_annotated_tomos` for `parse_annotations`.
+        """
+        if self.dir_regex is None:
+            return TomogramFile.from_files([unit])
+        directories = [unit] if self.dir_regex.match(os.path.basename(unit)) else []
+        directories += seek_dirs(unit, self.dir_regex)
+        if self.annotated:
+            return seek_annotated_tomos(
+                directories, self.tomogram_regex, self.annotation_regexes, self.annotation_names,
+                parse_annotations=parse_annotations
+            )
+        return seek_unannotated_tomos(directories, self.tomogram_regex, self.annotation_regexes)
+
+def fm_sources() -> List[DiscoverySource]:
+    """ 
+    The places on BYU's supercomputer that hold tomograms reviewed for
+    flagellar motors, in the order `get_fm_tomogram_set` adds them: public
+    positives, private positives, public negatives, then private negatives.
     """
-    # Collect all tomograms together into an SCTomogramSet.
-    tomogram_set = SCTomogramSet()
-
-    tomograms = [] # A temporary list to collect tomograms. To be placed into the tomogram_set later.
-
-    ### PUBLIC POSITIVES ###
-    print(f'\nLoading public positives.\n\tCurrent number of tomograms: {len(tomogram_set.tomograms)}\n')
-    # ~~~ DRIVE 1 ~~~ #
-    # Hylemonella
-    root = f"/grphome/grp_tomo_db1_d1/nobackup/archive/TomoDB1_d1/FlagellarMotor_P1/Hylemonella gracilis"
-    dir_regex = re.compile(r"yc\d{4}.*")
-    directories = seek_dirs(root, dir_regex)
-    
-    flagellum_regex = re.compile(r"^fm.mod$", re.IGNORECASE)
-    tomogram_regex = re.compile(r".*\.rec$")
-    
-    these_tomograms = seek_annotated_tomos(
-        directories, 
-        tomogram_regex, 
-        [flagellum_regex], 
-        ["Flagellar Motor"]
+    motor = ["Flagellar Motor"]
+    # (root, directory regex, tomogram regex, annotation regex, private)
+    drives = [
+        # ~~~ DRIVE 1 ~~~ #
+        # Hylemonella
+        ("/grphome/grp_tomo_db1_d1/nobackup/archive/TomoDB1_d1/FlagellarMotor_P1/Hylemonella gracilis",
+            r"yc\d{4}.*", r".*\.rec$", re.compile(r"^fm.mod$", re.IGNORECASE), False),
+        # ~~~ DRIVE 2 ~~~ #
+        # Legionella
+        ("/grphome/grp_tomo_db1_d2/nobackup/archive/TomoDB1_d2/FlagellarMotor_P2/legionella",
+            r"dg\d{4}.*", r".*SIRT_1k\.rec$", r"^FM\.mod$", False),
+        # Pseudomonas
+        ("/grphome/grp_tomo_db1_d2/nobackup/archive/TomoDB1_d2/FlagellarMotor_P2/Pseudomonasaeruginosa/done",
+            r"ab\d{4}.*", r".*SIRT_1k\.rec$", r"^FM\.mod$", False),
+        # Proteus_mirabilis
+        ("/grphome/grp_tomo_db1_d2/nobackup/archive/TomoDB1_d2/FlagellarMotor_P2/Proteus_mirabilis",
+            r"qya\d{4}.*", r".*\.rec$", r"^FM\.mod$", False),
+        # ~~~ DRIVE 3 ~~~ #
+        # Bdellovibrio
+        ("/grphome/grp_tomo_db1_d3/nobackup/archive/TomoDB1_d3/jhome_extra/Bdellovibrio_YW",
+            r"yc\d{4}.*", r".*SIRT_1k\.rec$", r"^flagellum_SIRT_1k\.mod$", False),
+        # Azospirillum
+        ("/grphome/grp_tomo_db1_d3/nobackup/archive/TomoDB1_d3/jhome_extra/AzospirillumBrasilense/done",
+            r"ab\d{4}.*", r".*SIRT_1k\.rec$", r"^FM3\.mod$", False),
+        # ~~~ ZHIPING ~~~ #
+        ("/grphome/fslg_imagseg/nobackup/archive/zhiping_data/caulo_WT/",
+            r"rrb\d{4}.*", r".*\.rec$", r"^flagellum\.mod$", True),
+        # ~~~ ANNOTATION PARTY ~~~ #
+        ("/grphome/grp_tomo_db1_d4/nobackup/archive/ExperimentRuns/",
+            r"(sma\d{4}.*)|(Vibrio.*)", r".*\.mrc$", r"flagellar_motor\.mod", True),
+    ]
+    # ~~~ NEGATIVES BRAXTON FOUND ON RANDY DATA ~~~ #
+    # Not all of these "negatives" are actually negatives yet.
+    braxton_negatives = DiscoverySource(
+        "/grphome/grp_tomo_db1_d3/nobackup/autodelete/negative_data",
+        re.compile(r".*\.(mrc|rec)$"),
+        annotated=False,
     )
-    tomograms += these_tomograms
 
-    # ~~~ DRIVE 2 ~~~ #
-    # Legionella
-    root = f"/grphome/grp_tomo_db1_d2/nobackup/archive/TomoDB1_d2/FlagellarMotor_P2/legionella"
-    dir_regex = re.compile(r"dg\d{4}.*")
-    directories = seek_dirs(root, dir_regex)
-    
-    flagellum_regex = re.compile(r"^FM\.mod$")
-    tomogram_regex = re.compile(r".*SIRT_1k\.rec$")
-    
-    these_tomograms = seek_annotated_tomos(
-        directories, 
-        tomogram_regex, 
-        [flagellum_regex], 
-        ["Flagellar Motor"]
-    )
-    tomograms += these_tomograms
+    sources = []
+    for annotated in (True, False):
+        for private in (False, True):
+            if not annotated and not private:
+                sources.append(braxton_negatives)
+            for (root, dir_regex, tomogram_regex, annotation_regex, is_private) in drives:
+                if is_private == private:
+                    sources.append(DiscoverySource(
+                        root,
+                        re.compile(tomogram_regex),
+                        [re.compile(annotation_regex)],
+                        motor,
+                        dir_regex=re.compile(dir_regex),
+                        annotated=annotated,
+                        private=private,
+                    ))
+    return sources
 
-    # Pseudomonas
-    root = f"/grphome/grp_tomo_db1_d2/nobackup/archive/TomoDB1_d2/FlagellarMotor_P2/Pseudomonasaeruginosa/done"
-    dir_regex = re.compile(r"ab\d{4}.*")
-    directories = seek_dirs(root, dir_regex)
-    
-    flagellum_regex = re.compile(r"^FM\.mod$")
-    tomogram_regex = re.compile(r".*SIRT_1k\.rec$")
-    
-    these_tomograms = seek_annotated_tomos(
-        directories, 
-        tomogram_regex, 
-        [flagellum_regex], 
-        ["Flagellar Motor"]
-    )
-    tomograms += these_tomograms
+def _shard(key: str, count: int) -> int:
+    """ The shard a unit of work belongs to, the same in every process. """
+    return zlib.crc32(key.encode()) % count
 
-    # Proteus_mirabilis
-    root = f"/grphome/grp_tomo_db1_d2/nobackup/archive/TomoDB1_d2/FlagellarMotor_P2/Proteus_mirabilis"
-    dir_regex = re.compile(r"qya\d{4}.*")
-    directories = seek_dirs(root, dir_regex)
-    
-    flagellum_regex = re.compile(r"^FM\.mod$")
-    tomogram_regex = re.compile(r".*\.rec$")
-    
-    these_tomograms = seek_annotated_tomos(
-        directories, 
-        tomogram_regex, 
-        [flagellum_regex], 
-        ["Flagellar Motor"]
-    )
-    tomograms += these_tomograms
+def _slurm_array_task() -> Tuple[int, int]:
+    """ This SLURM array task's zero-based index and the number of tasks. """
+    task_id = int(os.environ["SLURM_ARRAY_TASK_ID"]) - int(os.environ.get("SLURM_ARRAY_TASK_MIN", 0))
+    return task_id, int(os.environ["SLURM_ARRAY_TASK_COUNT"])
 
-    # ~~~ DRIVE 3 ~~~ #
-    # Bdellovibrio
-    root = f"/grphome/grp_tomo_db1_d3/nobackup/archive/TomoDB1_d3/jhome_extra/Bdellovibrio_YW"
-    dir_regex = re.compile(r"yc\d{4}.*")
-    directories = seek_dirs(root, dir_regex)
-    
-    flagellum_regex = re.compile(r"^flagellum_SIRT_1k\.mod$")
-    tomogram_regex = re.compile(r".*SIRT_1k\.rec$")
-    
-    these_tomograms = seek_annotated_tomos(
-        directories, 
-        tomogram_regex, 
-        [flagellum_regex], 
-        ["Flagellar Motor"]
-    )
-    tomograms += these_tomograms
+def _tomogram_record(tomo: TomogramFile, source: int, private: bool) -> dict:
+    """ A JSON-serializable description of a discovered tomogram. """
+    annotations = []
+    for annotation in tomo.annotations or []:
+        annotations.append({
+            "filepath": getattr(annotation, "filepath", None),
+            "name": annotation.name,
+            "points": np.asarray(annotation.points, dtype=np.float64).reshape(-1, 3).tolist(),
+        })
+    return {
+        "source": source,
+        "filepath": tomo.filepath,
+        "private": private,
+        "fingerprints": dict(tomo._fingerprints),
+        "annotations": annotations,
+    }
 
-    # Azospirillum
-    root = f"/grphome/grp_tomo_db1_d3/nobackup/archive/TomoDB1_d3/jhome_extra/AzospirillumBrasilense/done"
-    dir_regex = re.compile(r"ab\d{4}.*")
-    directories = seek_dirs(root, dir_regex)
-    
-    flagellum_regex = re.compile(r"^FM3\.mod$")
-    tomogram_regex = re.compile(r".*SIRT_1k\.rec$")
-    
-    these_tomograms = seek_annotated_tomos(
-        directories, 
-        tomogram_regex, 
-        [flagellum_regex], 
-        ["Flagellar Motor"]
-    )
-    tomograms += these_tomograms
+def _annotation_from_record(record: dict) -> Annotation:
+    """ Rebuild an annotation from its record without reading its file again. """
+    points = [np.array(point) for point in record["points"]]
+    if record["filepath"] is None:
+        return Annotation(points, record["name"])
+    return AnnotationFile.from_points(record["filepath"], points, record["name"])
 
-    # Add tomograms to `tomogram_set` and reset the temporary collection list `tomograms`
-    for tomo in tomograms:
-        tomogram_set.append(tomo, private=False)
-    tomograms = []
-    
-    print(f'Loading private positives.\n\tCurrent number of tomograms: {len(tomogram_set.tomograms)}\n')
-    ### PRIVATE POSITIVES ###
-    # ~~~ ZHIPING ~~~ #
-    root = f"/grphome/fslg_imagseg/nobackup/archive/zhiping_data/caulo_WT/"
-    dir_regex = re.compile(r"rrb\d{4}.*")
-    directories = seek_dirs(root, dir_regex)
-    
-    flagellum_regex = re.compile(r"^flagellum\.mod$")
-    tomogram_regex = re.compile(r".*\.rec$")
-    
-    these_tomograms = seek_annotated_tomos(
-        directories, 
-        tomogram_regex, 
-        [flagellum_regex], 
-        ["Flagellar Motor"]
-    )
-    tomograms += these_tomograms
-    
-    # ~~~ ANNOTATION PARTY ~~~ #
-    root = f"/grphome/grp_tomo_db1_d4/nobackup/archive/ExperimentRuns/"
-    dir_regex = re.compile(r"(sma\d{4}.*)|(Vibrio.*)")
-    directories = seek_dirs(root, dir_regex)
-
-    flagellum_regex = re.compile(r"flagellar_motor\.mod")
-    tomogram_regex = re.compile(r".*\.mrc$")
-
-    these_tomograms = seek_annotated_tomos(
-        directories, 
-        tomogram_regex, 
-        [flagellum_regex], 
-        ["Flagellar Motor"]
-    )
-    tomograms += these_tomograms
+@instrument()
+def discover_shard(
+        manifest_dir: str,
+        sources: Optional[Sequence[DiscoverySource]] = None,
+        *,
+        task_id: Optional[int] = None,
+        count: Optional[int] = None,
+        workers: int = 8,
+        parse_annotations: bool = True
+    ) -> str:
+    """
+    Search one shard of the discovery sources and write what it finds to a
+    partial manifest, to be combined with `merge_manifests`.
 
-    # Add tomograms to `tomogram_set` and reset the temporary collection list `tomograms`
-    for tomo in tomograms:
-        tomogram_set.append(tomo, private=True)
-    tomograms = []
+    Every process lists the entries directly in each source's root and takes
+    those whose path hashes to its shard, so `count` processes split the work
+    without communicating and without overlap. Each process also computes the
+    fast fingerprints of the tomograms it finds, so the merge need not.
 
-    print(f'Loading public negatives.\n\tCurrent number of tomograms: {len(tomogram_set.tomograms)}\n')
-    ### PUBLIC NEGATIVES ###
-    # ~~~ NEGATIVES BRAXTON FOUND ON RANDY DATA ~~~ #
-    root = f"/grphome/grp_tomo_db1_d3/nobackup/autodelete/negative_data"
-    print('Warning - not all of the "negatives" in /grphome/grp_tomo_db1_d3/nobackup/autodelete/negative_data are actually negatives. We need to remove those that aren\'t still.')
-    these_tomograms = [TomogramFile(os.path.join(root, path), load=False) for path in os.listdir(root) if os.path.splitext(path)[1] in ['.mrc', '.rec']]
-    tomograms += these_tomograms
-    
-    # ~~~ DRIVE 1 ~~~ #
-    # Hylemonella
-    root = f"/grphome/grp_tomo_db1_d1/nobackup/archive/TomoDB1_d1/FlagellarMotor_P1/Hylemonella gracilis"
-    dir_regex = re.compile(r"yc\d{4}.*")
-    directories = seek_dirs(root, dir_regex)
-    
-    flagellum_regex = re.compile(r"^fm.mod$", re.IGNORECASE)
-    tomogram_regex = re.compile(r".*\.rec$")
-    
-    these_tomograms = seek_unannotated_tomos(
-        directories, 
-        tomogram_regex, 
-        [flagellum_regex]
-    )
-    tomograms += these_tomograms
+    Run it from a SLURM array job with one task per shard, e.g.,
 
-    # ~~~ DRIVE 2 ~~~ #
-    # Legionella
-    root = f"/grphome/grp_tomo_db1_d2/nobackup/archive/TomoDB1_d2/FlagellarMotor_P2/legionella"
-    dir_regex = re.compile(r"dg\d{4}.*")
-    directories = seek_dirs(root, dir_regex)
-    
-    flagellum_regex = re.compile(r"^FM\.mod$")
-    tomogram_regex = re.compile(r".*SIRT_1k\.rec$")
-    
-    these_tomograms = seek_unannotated_tomos(
-        directories, 
-        tomogram_regex, 
-        [flagellum_regex]
-    )
-    tomograms += these_tomograms
+    ```python
+    # sbatch --array=0-31 discover.sh
+    discover_shard("/path/to/manifests")
+    ```
 
-    # Pseudomonas
-    root = f"/grphome/grp_tomo_db1_d2/nobackup/archive/TomoDB1_d2/FlagellarMotor_P2/Pseudomonasaeruginosa/done"
-    dir_regex = re.compile(r"ab\d{4}.*")
-    directories = seek_dirs(root, dir_regex)
-    
-    flagellum_regex = re.compile(r"^FM\.mod$")
-    tomogram_regex = re.compile(r".*SIRT_1k\.rec$")
-    
-    these_tomograms = seek_unannotated_tomos(
-        directories, 
-        tomogram_regex, 
-        [flagellum_regex]
-    )
-    tomograms += these_tomograms
+    then merge the manifests once every task has finished.
 
-    # Proteus_mirabilis
-    root = f"/grphome/grp_tomo_db1_d2/nobackup/archive/TomoDB1_d2/FlagellarMotor_P2/Proteus_mirabilis"
-    dir_regex = re.compile(r"qya\d{4}.*")
-    directories = seek_dirs(root, dir_regex)
-    
-    flagellum_regex = re.compile(r"^FM\.mod$")
-    tomogram_regex = re.compile(r".*\.rec$")
-    
-    these_tomograms = seek_unannotated_tomos(
-        directories, 
-        tomogram_regex, 
-        [flagellum_regex]
-    )
-    tomograms += these_tomograms
+    Args:
+        manifest_dir (str): The directory to write the manifest in.
 
-    # ~~~ DRIVE 3 ~~~ #
-    # Bdellovibrio
-    root = f"/grphome/grp_tomo_db1_d3/nobackup/archive/TomoDB1_d3/jhome_extra/Bdellovibrio_YW"
-    dir_regex = re.compile(r"yc\d{4}.*")
-    directories = seek_dirs(root, dir_regex)
-    
-    flagellum_regex = re.compile(r"^flagellum_SIRT_1k\.mod$")
-    tomogram_regex = re.compile(r".*SIRT_1k\.rec$")
-    
-    these_tomograms = seek_unannotated_tomos(
-        directories, 
-        tomogram_regex, 
-        [flagellum_regex]
-    )
-    tomograms += these_tomograms
+        sources (sequence of DiscoverySource, optional): Where to search. Defaults to `fm_sources()`.
 
-    # Azospirillum
-    root = f"/grphome/grp_tomo_db1_d3/nobackup/archive/TomoDB1_d3/jhome_extra/AzospirillumBrasilense/done"
-    dir_regex = re.compile(r"ab\d{4}.*")
-    directories = seek_dirs(root, dir_regex)
-    
-    flagellum_regex = re.compile(r"^FM3\.mod$")
-    tomogram_regex = re.compile(r".*SIRT_1k\.rec$")
-    
-    these_tomograms = seek_unannotated_tomos(
-        directories, 
-        tomogram_regex, 
-        [flagellum_regex]
+        task_id (int, optional): This process's shard, from 0 to `count - 1`. Defaults to the SLURM array task, counted from the array's first task.
+
+        count (int, optional): The number of shards. Defaults to the number of SLURM array tasks.
+
+        workers (int, optional): The number of threads computing fingerprints. Defaults to 8.
+
+        parse_annotations (bool, optional): Whether to read annotation files. If False, only their paths are recorded, for `merge_manifests` to fill in from an annotation store. Defaults to True.
+
+    Returns:
+        The path of the manifest written.
+    """
+    if task_id is None or count is None:
+        task_id, count = _slurm_array_task()
+    if not 0 <= task_id < count:
+        raise ValueError(f"Task {task_id} is not one of {count} shards.")
+    if sources is None:
+        sources = fm_sources()
+
+    found = []
+    for index, source in enumerate(sources):
+        for unit in source.units():
+            if _shard(unit, count) == task_id:
+                found += [
+                    (index, source.private, tomo)
+                    for tomo in source.search(unit, parse_annotations=parse_annotations)
+                ]
+
+    keys = fingerprint_files([tomo.filepath for (_, _, tomo) in found], workers=workers)
+    for (_, _, tomo), key in zip(found, keys):
+        if key is not None:
+            tomo._fingerprints["fast"] = key
+
+    os.makedirs(manifest_dir, exist_ok=True)
+    path = os.path.join(manifest_dir, f"manifest-{task_id:05d}-of-{count:05d}.json")
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as file:
+        json.dump({
+            "task_id": task_id,
+            "count": count,
+            "tomograms": [_tomogram_record(tomo, index, private) for (index, private, tomo) in found],
+        }, file)
+    os.replace(temp_path, path)
+    return path
+
+@instrument()
+def merge_manifests(
+        manifest_paths: Sequence[str],
+        *,
+        dedupe: str = "fingerprint",
+        full_hash: bool = False,
+        merge_tolerance: Optional[float] = 3.0,
+        workers: int = 8,
+        annotation_store: Optional[str] = None
+    ) -> SCTomogramSet:
+    """
+    Combine the partial manifests of every shard into one SCTomogramSet.
+
+    Tomograms are added source by source, in the order of the sources, and
+    by file path within each source, so the result does not depend on how the
+    work was sharded. Duplicates are combined as `SCTomogramSet.append` does.
+    Annotations and fingerprints come from the manifests; only tomogram
+    headers are read again. With `annotation_store`, annotations come from a
+    store saved by `SCTomogramSet.annotation_store` instead, so manifests
+    written without parsing annotations suffice; only the annotation files
+    of tomograms missing from the store are read.
+
+    Args:
+        manifest_paths (sequence of str): The manifests written by `discover_shard`.
+
+        dedupe (str, optional): How the set deduplicates tomograms. See `SCTomogramSet`. Defaults to "fingerprint".
+
+        full_hash (bool, optional): Whether the set fingerprints whole files. Defaults to False.
+
+        merge_tolerance (float, optional): The distance in voxels within which annotation points of duplicates are merged. See `SCTomogramSet`. Defaults to 3.
+
+        workers (int, optional): The number of threads reading headers and fingerprints. Defaults to 8.
+
+        annotation_store (str, optional): A saved annotation store to take annotations from. See `SCTomogramSet.load_annotations`. Defaults to None.
+
+    Returns:
+        The combined SCTomogramSet.
+
+    Raises:
+        ValueError: If the manifests are not exactly one of each shard of a single run.
+    """
+    records = []
+    shards = set()
+    counts = set()
+    for path in manifest_paths:
+        with open(path) as file:
+            manifest = json.load(file)
+        shards.add(manifest["task_id"])
+        counts.add(manifest["count"])
+        records += manifest["tomograms"]
+    if len(counts) > 1 or (counts and shards != set(range(counts.pop()))):
+        raise ValueError("Manifests must include every shard of one discovery run exactly once.")
+    records.sort(key=lambda record: (record["source"], record["filepath"]))
+
+    tomogram_set = SCTomogramSet(dedupe=dedupe, full_hash=full_hash, merge_tolerance=merge_tolerance)
+    tomograms = TomogramFile.from_files(
+        [record["filepath"] for record in records],
+        [[_annotation_from_record(a) for a in record["annotations"]] for record in records],
+        workers=workers
     )
-    tomograms += these_tomograms
-
-    # Add tomograms to `tomogram_set` and reset the temporary collection list `tomograms`
-    for tomo in tomograms:
-        tomogram_set.append(tomo, private=False)
-    tomograms = []
-
-    print(f'Loading private negatives.\n\tCurrent number of tomograms: {len(tomogram_set.tomograms)}\n')
-    ### PRIVATE NEGATIVES ###
-    # ~~~ ZHIPING ~~~ #
-    root = f"/grphome/fslg_imagseg/nobackup/archive/zhiping_data/caulo_WT/"
-    dir_regex = re.compile(r"rrb\d{4}.*")
-    directories = seek_dirs(root, dir_regex)
-    
-    flagellum_regex = re.compile(r"^flagellum\.mod$")
-    tomogram_regex = re.compile(r".*\.rec$")
+    start = 0
+    # Add each run of tomograms with the same privacy at once
+    for end in range(1, len(records) + 1):
+        if end == len(records) or records[end]["private"] != records[start]["private"]:
+            for tomo, record in zip(tomograms[start:end], records[start:end]):
+                tomo._fingerprints.update(record["fingerprints"])
+            tomogram_set.extend(tomograms[start:end], private=records[start]["private"], workers=workers)
+            start = end
+    if annotation_store is not None:
+        store = tomogram_set.load_annotations(annotation_store)
+        for label, tomo in tomogram_set.tomograms.items():
+            if label not in store.labels:
+                tomo.annotations = _parse_deferred(tomo.annotations)
+    return tomogram_set
+
+def get_fm_tomogram_set(annotation_store: Optional[str] = None) -> SCTomogramSet:
+    """
+    Collect all tomograms that have been reviewed for flagellar motors from
+    BYU's supercomputer into an SCTomogramSet. 
     
-    these_tomograms = seek_unannotated_tomos(
-        directories, 
-        tomogram_regex, 
-        [flagellum_regex]
-    )
-    tomograms += these_tomograms
+    From an SCTomogramSet `tomo_set`, get public tomograms with
+    `tomo_set.get_public_tomograms()`.
 
-    # ~~~ ANNOTATION PARTY ~~~ #
-    root = f"/grphome/grp_tomo_db1_d4/nobackup/archive/ExperimentRuns/"
-    dir_regex = re.compile(r"(sma\d{4}.*)|(Vibrio.*)")
-    directories = seek_dirs(root, dir_regex)
+    Does not initially load the tomogram image data. Given a `Tomogram` called
+    `tomo`, one can load and access the image data in one step with
+    `tomo.get_data()`.
 
-    flagellum_regex = re.compile(r"flagellar_motor\.mod")
-    tomogram_regex = re.compile(r".*\.mrc$")
+    This searches every source from one process. To spread the search across
+    many nodes, run `discover_shard` in each task of a SLURM array job and
+    combine the results with `merge_manifests`.
 
-    these_tomograms = seek_unannotated_tomos(
-        directories, 
-        tomogram_regex, 
-        [flagellum_regex]
-    )
-    tomograms += these_tomograms 
+    Args:
+        annotation_store (str, optional): A store saved by `SCTomogramSet.annotation_store`. If given, annotations are taken from it, and only the annotation files of tomograms missing from it are read. Defaults to None, which reads every annotation file.
 
-    # Add tomograms to `tomogram_set` and reset the temporary collection list `tomograms`
-    for tomo in tomograms:
-        tomogram_set.append(tomo, private=True)
-    tomograms = []   
+    Returns:
+        SCTomogramSet containing annotated tomograms
+    """
+    print('Warning - not all of the "negatives" in /grphome/grp_tomo_db1_d3/nobackup/autodelete/negative_data are actually negatives. We need to remove those that aren\'t still.')
+    with tempfile.TemporaryDirectory() as manifest_dir:
+        path = discover_shard(
+            manifest_dir, fm_sources(), task_id=0, count=1,
+            parse_annotations=annotation_store is None
+        )
+        tomogram_set = merge_manifests([path], annotation_store=annotation_store)
 
     print(f'Loading complete.\n\tCurrent number of tomograms: {len(tomogram_set.tomograms)}\n')
 
@@ -412,6 +1082,7 @@ def get_fm_tomogram_set() -> SCTomogramSet:
     return tomogram_set
 
 
+@instrument()
 def seek_file(directory: str, regex: re.Pattern) -> Union[str, None]:
     """Search for a file matching the given regex recursively in the specified
     directory.
@@ -433,6 +1104,7 @@ def seek_file(directory: str, regex: re.Pattern) -> Union[str, None]:
                 return target
     return None
 
+@instrument()
 def seek_files(
         directory: str, 
         regex: re.Pattern, 
@@ -461,6 +1133,7 @@ def seek_files(
             files = seek_files(os.path.join(root, dir), regex, files)
     return files
 
+@instrument()
 def seek_dirs(
             root: str, 
             regex: re.Pattern, 
@@ -489,6 +1162,7 @@ def seek_dirs(
                 directories = seek_dirs(dir, regex, directories)
     return directories
 
+@instrument()
 def seek_set(
             directory: str, 
             regexes: List[re.Pattern], 
@@ -519,11 +1193,32 @@ def seek_set(
                         return None  # Extra match found
     return matches
 
+def _parse_deferred(annotations: Optional[List[Annotation]]) -> Optional[List[Annotation]]:
+    """ 
+    Read the files of AnnotationFiles that have no points, skipping (and
+    reporting) files that cannot be read.
+    """
+    if annotations is None:
+        return None
+    parsed = []
+    for annotation in annotations:
+        if isinstance(annotation, AnnotationFile) and len(annotation.points) == 0:
+            try:
+                annotation = AnnotationFile(annotation.filepath, annotation.name)
+            except Exception as e:
+                print(f"An exception occured while loading `{annotation.filepath}`:\n{e}\n")
+                continue
+        parsed.append(annotation)
+    return parsed
+
+@instrument()
 def seek_annotated_tomos(
             directories: List[str], 
             tomo_regex: re.Pattern, 
             annotation_regexes: List[re.Pattern], 
-            annotation_names: List[str]
+            annotation_names: List[str],
+            *,
+            parse_annotations: bool = True
         ) -> List[TomogramFile]:
     """
     Collect pairs of tomogram files and their corresponding annotation files,
@@ -538,25 +1233,29 @@ def seek_annotated_tomos(
         
         annotation_names (list of str): A list of names for the annotations.
 
+        parse_annotations (bool, optional): Whether to read the annotation files. If False, each annotation is an AnnotationFile with no points, whose file is read later only if needed (e.g., when the tomogram is missing from an annotation store). Defaults to True.
+
     Returns:
         TomogramFile objects with their corresponding annotations.
     """
-    tomos = []
+    tomogram_files = []
+    tomogram_annotations = []
     for dir in directories:
         matches = seek_set(dir, [tomo_regex] + annotation_regexes)
         if matches is not None and None not in matches:
             tomogram_file = matches[0]
             annotation_files = matches[1:]
-            annotations = []
-            for (file, name) in zip(annotation_files, annotation_names):
-                try:
-                    annotations.append(AnnotationFile(file, name))
-                except Exception as e:
-                    print(f"An exception occured while loading `{file}`:\n{e}\n")
-            tomo = TomogramFile(tomogram_file, annotations, load=False)
-            tomos.append(tomo)
-    return tomos
+            annotations = [
+                AnnotationFile.from_points(file, [], name)
+                for (file, name) in zip(annotation_files, annotation_names)
+            ]
+            if parse_annotations:
+                annotations = _parse_deferred(annotations)
+            tomogram_files.append(tomogram_file)
+            tomogram_annotations.append(annotations)
+    return TomogramFile.from_files(tomogram_files, tomogram_annotations)
 
+@instrument()
 def seek_unannotated_tomos(
             directories: List[str], 
             tomo_regex: re.Pattern, 
@@ -576,7 +1275,7 @@ def seek_unannotated_tomos(
     Returns:
         TomogramFile objects.
     """
-    tomos = []
+    tomogram_files = []
     for dir in directories:
         matches = seek_set(dir, [tomo_regex] + annotation_regexes)
 
@@ -598,7 +1297,5 @@ def seek_unannotated_tomos(
             # If there is one candidate, it isn't annotated.
             else:
                 # Append what must be the only unannotated tomogram candidate
-                tomogram_file = tomo_candidates[0]
-                tomo = TomogramFile(tomogram_file, load=False)
-                tomos.append(tomo) 
-    return tomos
\ No newline at end of file
+                tomogram_files.append(tomo_candidates[0])
+    return TomogramFile.from_files(tomogram_files)
\ No newline at end of file
@@ -0,0 +1,252 @@
+"""
+This module renders small projections of tomograms for quality control, and
+caches them so browsing a whole collection does not mean loading it.
+
+Each tomogram is read once, one slab at a time, through a memory map of its
+raw data. That single pass accumulates the mean and maximum projections along
+each axis and the average of the central slab of sections. The images are then
+binned down to a thumbnail size and stored as 8-bit images, a few hundred
+kilobytes per tomogram, in a cache keyed by the file's content fingerprint.
+
+```python
+thumbnails = tomogram_set.thumbnails("/path/to/cache", workers=16)
+thumb = thumbnails["tomo"]
+plt.imshow(thumb.images["slab"], cmap="gray")
+plt.scatter(*thumb.overlay("slab")[:, ::-1].T)  # Annotation points as (x, y)
+```
+"""
+
+import os
+
+import numpy as np
+
+from typing import Dict, Optional, Tuple
+
+# Names of the images in a `Thumbnails`, with the axis each is projected along.
+# The "slab" image is the mean of the central sections, viewed along z.
+IMAGE_AXES = {
+    'mean_z': 0, 'max_z': 0,
+    'mean_y': 1, 'max_y': 1,
+    'mean_x': 2, 'max_x': 2,
+    'slab': 0,
+}
+
+class Thumbnails:
+    """Downsampled projections of one tomogram.
+
+    Attributes:
+        shape (tuple of int): The shape of the tomogram.
+        binning (int): The factor by which each image axis is reduced.
+        slab_bounds (tuple of int): The first and last-plus-one sections averaged in the "slab" image.
+        images (dict of numpy.ndarray): 8-bit images by name. See `IMAGE_AXES`.
+        limits (dict of tuple of float): The (low, high) raw intensities mapped to 0 and 255 in each image.
+        points (numpy.ndarray): The tomogram's annotation points, an (N, 3) array in voxel coordinates.
+    """
+    def __init__(
+            self,
+            shape: Tuple[int, int, int],
+            binning: int,
+            slab_bounds: Tuple[int, int],
+            images: Dict[str, np.ndarray],
+            limits: Dict[str, Tuple[float, float]],
+            points: Optional[np.ndarray] = None
+        ):
+        self.shape = tuple(int(s) for s in shape)
+        self.binning = int(binning)
+        self.slab_bounds = tuple(int(b) for b in slab_bounds)
+        self.images = images
+        self.limits = limits
+        self.points = np.zeros((0, 3)) if points is None else np.asarray(points, dtype=np.float64).reshape(-1, 3)
+
+    def __repr__(self):
+        return f'<Thumbnails of a {self.shape} tomogram, binned {self.binning}x>'
+
+    def overlay(self, name: str) -> np.ndarray:
+        """Annotation points in the pixel coordinates of an image.
+
+        Args:
+            name (str): The name of the image. Only points within the central slab are returned for "slab".
+
+        Returns:
+            An (N, 2) array of (row, column) coordinates, ready to plot over the image.
+        """
+        axis = IMAGE_AXES[name]
+        points = self.points
+        if name == 'slab':
+            low, high = self.slab_bounds
+            points = points[(points[:, 0] >= low - 0.5) & (points[:, 0] < high - 0.5)]
+        kept = [a for a in range(3) if a != axis]
+        # Pixel k covers voxels k * binning to (k + 1) * binning - 1
+        return (points[:, kept] + 0.5) / self.binning - 0.5
+
+    def save(self, filepath: str):
+        """Save the thumbnails, without annotation points, to a `.npz` file.
+
+        The file is written under a temporary name and moved into place, so
+        concurrent readers never see a partial file.
+
+        Args:
+            filepath (str): Where to save the thumbnails.
+        """
+        arrays = {f'image_{name}': image for name, image in self.images.items()}
+        arrays.update({f'limits_{name}': np.array(limits) for name, limits in self.limits.items()})
+        temp_path = f"{filepath}.{os.getpid()}.tmp.npz"
+        np.savez_compressed(
+            temp_path, shape=np.array(self.shape), binning=self.binning,
+            slab_bounds=np.array(self.slab_bounds), **arrays
+        )
+        os.replace(temp_path, filepath)
+
+    @classmethod
+    def load(cls, filepath: str, points: Optional[np.ndarray] = None) -> 'Thumbnails':
+        """Load thumbnails saved with `Thumbnails.save`.
+
+        Args:
+            filepath (str): The `.npz` file.
+            points (numpy.ndarray, optional): Annotation points to attach. Defaults to None.
+
+        Returns:
+            The thumbnails.
+        """
+        with np.load(filepath) as saved:
+            images = {key[6:]: saved[key] for key in saved.files if key.startswith('image_')}
+            limits = {key[7:]: tuple(saved[key].tolist()) for key in saved.files if key.startswith('limits_')}
+            return cls(
+                tuple(saved['shape']), int(saved['binning']), tuple(saved['slab_bounds']),
+                images, limits, points
+            )
+
+def _bin(image: np.ndarray, binning: int, reduce: np.ufunc) -> np.ndarray:
+    """ Reduce each `binning` x `binning` block of an image, including partial blocks at the edges. """
+    if binning == 1:
+        return image
+    for axis in (0, 1):
+        image = reduce.reduceat(image, np.arange(0, image.shape[axis], binning), axis=axis)
+    return image
+
+def _block_mean(image: np.ndarray, binning: int) -> np.ndarray:
+    """ The mean of each `binning` x `binning` block of an image, including partial blocks at the edges. """
+    sums = _bin(image, binning, np.add)
+    counts = [
+        np.diff(np.append(np.arange(0, n, binning), n))
+        for n in image.shape
+    ]
+    return sums / np.multiply.outer(*counts)
+
+def _to_uint8(image: np.ndarray, percentiles: Tuple[float, float]) -> Tuple[np.ndarray, Tuple[float, float]]:
+    """ Contrast stretch an image between two of its percentiles into 8 bits. """
+    low, high = (float(v) for v in np.percentile(image, percentiles))
+    scale = 255 / (high - low) if high > low else 0.0
+    codes = np.clip(np.rint((image - low) * scale), 0, 255).astype(np.uint8)
+    return codes, (low, high)
+
+def compute_thumbnails(
+        source: np.ndarray,
+        *,
+        size: int = 256,
+        slab_depth: int = 16,
+        block_depth: int = 16,
+        percentiles: Tuple[float, float] = (2, 98)
+    ) -> Thumbnails:
+    """Compute the thumbnails of a volume in one pass, one slab at a time.
+
+    Args:
+        source (numpy.ndarray): The volume, possibly memory-mapped.
+
+        size (int, optional): The largest image dimension. Images are binned by the smallest integer factor that fits every axis of the volume within it. Defaults to 256.
+
+        slab_depth (int, optional): The number of central sections averaged in the "slab" image. Defaults to 16.
+
+        block_depth (int, optional): The number of sections read at once. Defaults to 16.
+
+        percentiles (tuple of float, optional): The percentiles of each image mapped to 0 and 255. Defaults to (2, 98).
+
+    Returns:
+        The thumbnails, without annotation points.
+    """
+    nz, ny, nx = source.shape
+    binning = max(1, -(-max(nz, ny, nx) // size))
+    slab_start = max(0, nz // 2 - slab_depth // 2)
+    slab_stop = min(nz, slab_start + slab_depth)
+
+    sum_z = np.zeros((ny, nx), dtype=np.float64)
+    max_z = np.full((ny, nx), -np.inf, dtype=np.float32)
+    slab_sum = np.zeros((ny, nx), dtype=np.float64)
+    mean_y = np.empty((nz, nx), dtype=np.float32)
+    max_y = np.empty((nz, nx), dtype=np.float32)
+    mean_x = np.empty((nz, ny), dtype=np.float32)
+    max_x = np.empty((nz, ny), dtype=np.float32)
+    for z0 in range(0, nz, block_depth):
+        block = np.asarray(source[z0 : z0 + block_depth], dtype=np.float32)
+        z1 = z0 + len(block)
+        sum_z += block.sum(axis=0, dtype=np.float64)
+        np.maximum(max_z, block.max(axis=0), out=max_z)
+        mean_y[z0:z1] = block.mean(axis=1)
+        max_y[z0:z1] = block.max(axis=1)
+        mean_x[z0:z1] = block.mean(axis=2)
+        max_x[z0:z1] = block.max(axis=2)
+        low, high = max(z0, slab_start), min(z1, slab_stop)
+        if low < high:
+            slab_sum += block[low - z0 : high - z0].sum(axis=0, dtype=np.float64)
+
+    projections = {
+        'mean_z': _block_mean(sum_z / nz, binning),
+        'max_z': _bin(max_z, binning, np.maximum),
+        'mean_y': _block_mean(mean_y, binning),
+        'max_y': _bin(max_y, binning, np.maximum),
+        'mean_x': _block_mean(mean_x, binning),
+        'max_x': _bin(max_x, binning, np.maximum),
+        'slab': _block_mean(slab_sum / max(slab_stop - slab_start, 1), binning),
+    }
+    images, limits = dict(), dict()
+    for name, projection in projections.items():
+        images[name], limits[name] = _to_uint8(projection, percentiles)
+    return Thumbnails((nz, ny, nx), binning, (slab_start, slab_stop), images, limits)
+
+def thumbnail_path(cache_dir: str, fingerprint: str, size: int, slab_depth: int) -> str:
+    """ The path that thumbnails of a file with a given fingerprint are cached at. """
+    return os.path.join(cache_dir, f"{fingerprint}_{size}px_{slab_depth}z.npz")
+
+def tomogram_thumbnails(
+        tomogram,
+        cache_dir: Optional[str] = None,
+        *,
+        size: int = 256,
+        slab_depth: int = 16,
+        block_depth: int = 16
+    ) -> Thumbnails:
+    """Get the thumbnails of a tomogram, from the cache if possible.
+
+    A TomogramFile is read from the raw data in its file, whatever has been
+    loaded, and its thumbnails are cached under its content fingerprint, so
+    identical copies share them. Other tomograms are not cached.
+
+    Args:
+        tomogram (Tomogram): The tomogram.
+
+        cache_dir (str, optional): The cache directory. Defaults to None, which computes the thumbnails without caching them.
+
+        size (int, optional): The largest image dimension. See `compute_thumbnails`. Defaults to 256.
+
+        slab_depth (int, optional): The number of central sections averaged in the "slab" image. Defaults to 16.
+
+        block_depth (int, optional): The number of sections read at once. Defaults to 16.
+
+    Returns:
+        The thumbnails, with the tomogram's current annotation points.
+    """
+    points = np.asarray(tomogram.annotation_points() if tomogram.annotations else [], dtype=np.float64).reshape(-1, 3)
+    is_file = hasattr(tomogram, 'memmap')
+    path = None
+    if cache_dir is not None and is_file:
+        path = thumbnail_path(cache_dir, tomogram.fingerprint(), size, slab_depth)
+        if os.path.exists(path):
+            return Thumbnails.load(path, points)
+
+    source = tomogram.memmap() if is_file else tomogram.get_data()
+    thumbnails = compute_thumbnails(source, size=size, slab_depth=slab_depth, block_depth=block_depth)
+    thumbnails.points = points
+    if path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        thumbnails.save(path)
+    return thumbnails
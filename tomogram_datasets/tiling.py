@@ -0,0 +1,211 @@
+"""
+This module provides tools to cover a whole tomogram with overlapping tiles and
+to blend per-tile outputs (e.g., model predictions) back into a full-size
+volume.
+"""
+
+import numpy as np
+
+from typing import Iterator, Optional, Tuple
+
+def _axis_starts(size: int, tile_size: int, overlap: int) -> np.ndarray:
+    """
+    Finds the starting indices of tiles of length `tile_size` that cover an
+    axis of length `size`, where neighboring tiles share at least `overlap`
+    voxels. The last tile is placed flush against the end of the axis.
+
+    Raises:
+        ValueError: If the tile does not fit in the axis, or if the overlap is
+        not smaller than the tile.
+    """
+    if tile_size > size:
+        raise ValueError(f"Tile size {tile_size} is larger than the tomogram dimension {size}.")
+    if overlap < 0 or overlap >= tile_size:
+        raise ValueError(f"Overlap {overlap} must be nonnegative and smaller than the tile size {tile_size}.")
+    step = tile_size - overlap
+    starts = np.arange(0, size - tile_size + 1, step)
+    if starts[-1] != size - tile_size:
+        starts = np.append(starts, size - tile_size)
+    return starts
+
+def tile_lower_bounds(
+        shape: Tuple[int, int, int],
+        vol_shape: Tuple[int, int, int],
+        overlap: Tuple[int, int, int] = (0, 0, 0)
+    ) -> np.ndarray:
+    """
+    Finds the lower bounds of a grid of tiles that covers an array of the given
+    shape.
+
+    Tiles are ordered with the first axis varying slowest, so that consecutive
+    tiles read neighboring regions of a C-ordered (or memory-mapped) array.
+
+    Args:
+        shape (tuple of int): The shape of the array to cover.
+
+        vol_shape (tuple of int): The shape of each tile.
+
+        overlap (tuple of int, optional): The minimum number of voxels that
+        neighboring tiles share along each axis. Defaults to (0, 0, 0).
+
+    Returns:
+        An (N, 3) integer array of tile lower bounds.
+    """
+    starts = [_axis_starts(s, vs, ov) for (s, vs, ov) in zip(shape, vol_shape, overlap)]
+    grid = np.meshgrid(*starts, indexing='ij')
+    return np.stack([g.ravel() for g in grid], axis=1)
+
+def iter_tile_batches(
+        source: np.ndarray,
+        vol_shape: Tuple[int, int, int],
+        overlap: Tuple[int, int, int] = (0, 0, 0),
+        batch_size: int = 1
+    ) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Yields batches of tiles covering `source`.
+
+    Only one batch is held in memory at a time, so `source` may be a
+    memory-mapped array much larger than memory.
+
+    Args:
+        source (numpy.ndarray): A 3-dimensional array, possibly memory-mapped.
+
+        vol_shape (tuple of int): The shape of each tile.
+
+        overlap (tuple of int, optional): The minimum number of voxels that
+        neighboring tiles share along each axis. Defaults to (0, 0, 0).
+
+        batch_size (int, optional): The maximum number of tiles in each batch.
+        Defaults to 1.
+
+    Yields:
+        Pairs of a (B, 3) array of tile lower bounds and a (B, *vol_shape)
+        array of tile data.
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1.")
+    bounds = tile_lower_bounds(source.shape, vol_shape, overlap)
+    vz, vy, vx = vol_shape
+    for start in range(0, len(bounds), batch_size):
+        batch_bounds = bounds[start : start + batch_size]
+        tiles = np.empty((len(batch_bounds), vz, vy, vx), dtype=source.dtype)
+        for i, (z, y, x) in enumerate(batch_bounds):
+            tiles[i] = source[z : z + vz, y : y + vy, x : x + vx]
+        yield batch_bounds, tiles
+
+def _blend_window(tile_size: int, overlap: int, blend: str) -> np.ndarray:
+    """
+    A 1-dimensional blending window for one axis of a tile. With `"linear"`
+    blending, weights ramp up across the overlapping region at each end of the
+    tile so that neighboring tiles fade into each other.
+    """
+    window = np.ones(tile_size, dtype=np.float32)
+    if blend == "linear" and overlap > 0:
+        ramp = np.arange(1, overlap + 1, dtype=np.float32) / (overlap + 1)
+        window[:overlap] = ramp
+        window[tile_size - overlap:] = np.minimum(window[tile_size - overlap:], ramp[::-1])
+    elif blend != "constant" and blend != "linear":
+        raise ValueError(f'Unknown blend mode "{blend}". Use "linear" or "constant".')
+    return window
+
+class TileAccumulator:
+    """
+    Blends per-tile outputs into a full-size output volume.
+
+    Tiles are expected to come from the same grid as `tile_lower_bounds` (or
+    `Tomogram.tiles`) with the same `vol_shape` and `overlap`. Each tile is
+    weighted by a separable blending window and added into `output` as soon as
+    it arrives, so no tiles are kept around. Because both the grid and the
+    window are separable, the normalizing weights are computed from three
+    1-dimensional arrays rather than a second full-size volume.
+
+    Attributes:
+        output (numpy.ndarray): The weighted sum of the tiles added so far. Call
+        `result()` to normalize it.
+
+        shape (tuple of int): The shape of the output volume.
+
+        vol_shape (tuple of int): The shape of each tile.
+
+        overlap (tuple of int): The minimum overlap between neighboring tiles.
+    """
+    def __init__(
+            self,
+            shape: Tuple[int, int, int],
+            vol_shape: Tuple[int, int, int],
+            overlap: Tuple[int, int, int] = (0, 0, 0),
+            *,
+            blend: str = "linear",
+            dtype: np.dtype = np.float32,
+            out: Optional[np.ndarray] = None
+        ):
+        """Initialize a TileAccumulator instance.
+
+        Args:
+            shape (tuple of int): The shape of the full output volume.
+
+            vol_shape (tuple of int): The shape of each tile.
+
+            overlap (tuple of int, optional): The minimum overlap between neighboring tiles. Defaults to (0, 0, 0).
+
+            blend (str, optional): Either "linear" to fade tiles into each other across overlaps, or "constant" to average them uniformly. Defaults to "linear".
+
+            dtype (numpy.dtype, optional): The dtype of the output volume. Defaults to numpy.float32.
+
+            out (numpy.ndarray, optional): A zero-filled array to accumulate into, such as a `numpy.memmap` for outputs larger than memory. Defaults to None, in which case a new array is allocated.
+        """
+        self.shape = tuple(int(s) for s in shape)
+        self.vol_shape = tuple(int(v) for v in vol_shape)
+        self.overlap = tuple(int(o) for o in overlap)
+        if out is not None and tuple(out.shape) != self.shape:
+            raise ValueError(f"Output array has shape {out.shape}, expected {self.shape}.")
+        self.output = np.zeros(self.shape, dtype=dtype) if out is None else out
+
+        self._windows = [_blend_window(v, o, blend) for (v, o) in zip(self.vol_shape, self.overlap)]
+        self._tile_weights = np.einsum('i,j,k->ijk', *self._windows)
+
+        # Sum of windows covering each index along each axis.
+        self._axis_weights = []
+        for (s, v, o, w) in zip(self.shape, self.vol_shape, self.overlap, self._windows):
+            weights = np.zeros(s, dtype=np.float32)
+            for start in _axis_starts(s, v, o):
+                weights[start : start + v] += w
+            self._axis_weights.append(weights)
+
+    def add(self, lower_bounds: np.ndarray, tile: np.ndarray):
+        """Add one tile to the output volume.
+
+        Args:
+            lower_bounds (numpy.ndarray): The lower bounds of the tile in the output volume.
+
+            tile (numpy.ndarray): The tile, with shape `vol_shape`.
+        """
+        z, y, x = (int(b) for b in lower_bounds)
+        vz, vy, vx = self.vol_shape
+        self.output[z : z + vz, y : y + vy, x : x + vx] += tile * self._tile_weights
+
+    def add_batch(self, lower_bounds: np.ndarray, tiles: np.ndarray):
+        """Add a batch of tiles to the output volume.
+
+        Args:
+            lower_bounds (numpy.ndarray): A (B, 3) array of tile lower bounds.
+
+            tiles (numpy.ndarray): A (B, *vol_shape) array of tiles.
+        """
+        for bounds, tile in zip(lower_bounds, tiles):
+            self.add(bounds, tile)
+
+    def result(self) -> np.ndarray:
+        """Normalize the accumulated tiles by their blending weights.
+
+        Normalization happens in place, one section at a time. Call this once,
+        after every tile in the grid has been added.
+
+        Returns:
+            The blended output volume.
+        """
+        wz, wy, wx = self._axis_weights
+        plane_weights = np.outer(wy, wx)
+        for z in range(self.shape[0]):
+            self.output[z] /= wz[z] * plane_weights
+        return self.output
@@ -1,5 +1,4 @@
 import numpy as np
-from skimage import exposure
 
 import mrcfile
 
@@ -7,8 +6,18 @@ import os
 
 from .annotation import Annotation
 from .annotation import AnnotationFile
+from .fingerprint import fingerprint as content_fingerprint
+from .header import parse_header, read_header, read_headers
+from .instrumentation import file_size, instrument, span
+from .quantize import QuantizedVolume
+from .resample import cache_path, resampled_shape, scale_points, write_resampled_mrc
+from .tiling import iter_tile_batches, tile_lower_bounds
+from .writer import write_tomogram
 
-from typing import List, Optional, Union
+from typing import TYPE_CHECKING, Iterator, List, Optional, Tuple, Union
+
+if TYPE_CHECKING:
+    from .filtering import BandpassFilter
 
 class Tomogram:
     """Represents a tomogram.
@@ -23,6 +32,9 @@ class Tomogram:
         shape (numpy.ndarray): A 3-element array representing the shape of the tomogram data.
    
     """
+    # `__dict__` keeps arbitrary attributes working, as before the slots
+    __slots__ = ('annotations', 'data', 'shape', '__dict__')
+
     def __init__(self, data: np.ndarray, annotations: Optional[List[Annotation]] = None):
         """Initialize a Tomogram instance.
 
@@ -65,7 +77,7 @@ class Tomogram:
             indices = range(len(self.annotations))
             points = []
             for index in indices:
-                points += self.annotation_points(index)
+                points.extend(self.annotation_points(index))
             return points
     
     def get_data(self) -> np.ndarray:
@@ -76,6 +88,86 @@ class Tomogram:
         """
         return self.data
 
+    def share(self) -> 'SharedVolume':
+        """Publish the tomogram's data to shared memory.
+
+        Other processes can attach to the data without copying it with
+        `SharedTomogram.attach(volume.handle)`. For a TomogramFile, the data is
+        loaded and preprocessed first if needed. Close the returned volume when
+        it is no longer needed in this process.
+
+        Returns:
+            The SharedVolume holding a copy of the data.
+        """
+        from .shared import SharedVolume
+        return SharedVolume.publish(self.get_data())
+
+    def write_mrc(
+            self,
+            filepath: str,
+            dtype: Union[str, np.dtype] = np.float32,
+            *,
+            voxel_size: Optional[Union[float, Tuple[float, float, float]]] = None,
+            block_depth: int = 16
+        ) -> str:
+        """Write the tomogram to an `.mrc` file, one slab at a time.
+
+        See `write_tomogram` for how the data, voxel size and origin are
+        chosen.
+
+        Args:
+            filepath (str): Where to write the `.mrc` file.
+            dtype (str or numpy.dtype, optional): The data type to store. Defaults to float32.
+            voxel_size (float or tuple of float, optional): The voxel size in Ångstroms, in (x, y, z) order. Defaults to the voxel size of the tomogram's file, if known.
+            block_depth (int, optional): The number of sections written at once. Defaults to 16.
+
+        Returns:
+            `filepath`.
+        """
+        return write_tomogram(self, filepath, dtype, voxel_size=voxel_size, block_depth=block_depth)
+
+    def tile_bounds(
+            self,
+            vol_shape: Tuple[int, int, int],
+            overlap: Tuple[int, int, int] = (0, 0, 0)
+        ) -> np.ndarray:
+        """Get the lower bounds of overlapping tiles that cover the tomogram.
+
+        Args:
+            vol_shape (tuple of int): The shape of each tile.
+            overlap (tuple of int, optional): The minimum number of voxels that neighboring tiles share along each axis. Defaults to (0, 0, 0).
+
+        Returns:
+            An (N, 3) integer array of tile lower bounds.
+        """
+        return tile_lower_bounds(self.shape, vol_shape, overlap)
+
+    def tiles(
+            self,
+            vol_shape: Tuple[int, int, int],
+            overlap: Tuple[int, int, int] = (0, 0, 0),
+            *,
+            batch_size: int = 1
+        ) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """Iterate over batches of overlapping tiles that cover the tomogram.
+
+        Blend per-tile outputs back into a full-size volume with a
+        `TileAccumulator` created with the same `vol_shape` and `overlap`.
+
+        Args:
+            vol_shape (tuple of int): The shape of each tile.
+            overlap (tuple of int, optional): The minimum number of voxels that neighboring tiles share along each axis. Defaults to (0, 0, 0).
+            batch_size (int, optional): The maximum number of tiles in each batch. Defaults to 1.
+
+        Yields:
+            Pairs of a (B, 3) array of tile lower bounds and a (B, *vol_shape) array of tile data.
+        """
+        return iter_tile_batches(self._tile_source(), vol_shape, overlap, batch_size)
+
+    def _tile_source(self) -> np.ndarray:
+        """ The array that `tiles()` reads from. """
+        return self.data
+
 
 class TomogramFile(Tomogram):
     """Represents a tomogram file.
@@ -90,6 +182,9 @@ class TomogramFile(Tomogram):
         annotations (list of Annotation): Annotations corresponding to the tomogram.
         data (numpy.ndarray): A 3-dimensional array containing the tomogram image.
         header (dict or numpy.recarray) Other data related to the tomogram file.
+        contrast_limits (tuple of float): The (low, high) intensities that contrast stretching maps to the ends of the output range. Set by `process()` or `estimate_contrast_limits()`; None until then.
+        intensity_limits (tuple of float): Fixed contrast limits shared across a dataset (see `SCTomogramSet.normalize`). When set, `process()` and `get_slice()` use them instead of the tomogram's own percentiles. Defaults to None.
+        bandpass (BandpassFilter): A filter that `process()` applies before contrast stretching. Defaults to None.
     """
 
     def __init__(
@@ -98,7 +193,10 @@ class TomogramFile(Tomogram):
             annotations: 
             Optional[List[Annotation]] = None, 
             *, 
-            load: bool = True
+            load: bool = True,
+            quantize: Optional[Union[str, np.dtype]] = None,
+            header: Optional[np.recarray] = None,
+            bandpass: Optional['BandpassFilter'] = None
         ):
         """Initialize a TomogramFile instance.
 
@@ -106,17 +204,89 @@ class TomogramFile(Tomogram):
             filepath (str): The file path to the tomogram file.
             annotations (list of Annotation, optional): Annotations corresponding to the tomogram. Defaults to None.
             load (bool, optional): Whether to load tomogram array data immediately. Defaults to True. If False, use self.load() when ready to load data.
+            quantize (str or numpy.dtype, optional): If given, keep the preprocessed data as a compact `QuantizedVolume` of this integer type (uint8 or uint16) when loading it. Defaults to None.
+            header (numpy.recarray, optional): The file's `.mrc` header, if it has already been read (e.g., by `read_headers`). Defaults to None, in which case the header is read from the file.
+            bandpass (BandpassFilter, optional): A filter to apply to the data when it is processed, before contrast stretching. Defaults to None.
         """
         self.data = None
         self.annotations = annotations
         self.filepath = filepath
-
-        self.load_header()
+        self._fingerprints = dict()
+        self.contrast_limits = None
+        self.intensity_limits = None
+        self.bandpass = bandpass
+
+        if header is not None:
+            self.header = header
+            self.shape = tuple(header[dim].item() for dim in ['nz', 'ny', 'nx'])
+        else:
+            self.load_header()
         
         if load:
-            self.load()
+            self.load(quantize=quantize)
+
+    def __getstate__(self) -> dict:
+        """
+        Pickle only what is needed to reopen the file: its path, the cached
+        header, fingerprints and contrast limits, and the annotations. Loaded
+        data is dropped and read again on first access, so sending a
+        TomogramFile to a worker process costs kilobytes however large the
+        tomogram is.
+        """
+        state = self.__dict__.copy()
+        # `annotations` and `shape` are slots of Tomogram, not in `__dict__`
+        for name in ('annotations', 'shape'):
+            if hasattr(self, name):
+                state[name] = getattr(self, name)
+        state['data'] = None
+        header = state.get('header')
+        if isinstance(header, np.ndarray) and 'machst' in (header.dtype.names or ()):
+            # The raw 1024 bytes are much smaller than a pickled record array
+            state['header'] = header.tobytes()
+        return state
+
+    def __setstate__(self, state: dict):
+        if isinstance(state.get('header'), bytes):
+            state['header'] = parse_header(state['header'], state['filepath'])
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    @classmethod
+    @instrument()
+    def from_files(
+            cls,
+            filepaths: List[str],
+            annotations: Optional[List[Optional[List[Annotation]]]] = None,
+            *,
+            workers: int = 8
+        ) -> List['TomogramFile']:
+        """Create unloaded TomogramFiles for many files, reading their headers concurrently.
+
+        `.mrc` headers are read with one small read per file across a thread
+        pool (see `read_headers`), and each TomogramFile reuses its header
+        instead of opening the file again.
+
+        Args:
+            filepaths (list of str): The tomogram files.
+            annotations (list of list of Annotation, optional): The annotations of each tomogram. Defaults to None.
+            workers (int, optional): The number of threads reading headers. Defaults to 8.
 
-    def load(self, *, preprocess: bool = True):
+        Returns:
+            A TomogramFile for each file, in order. Their data is not loaded.
+        """
+        if annotations is None:
+            annotations = [None] * len(filepaths)
+        mrc_paths = [f for f in filepaths if os.path.splitext(f)[1] in [".mrc", ".rec"]]
+        headers = dict(zip(mrc_paths, read_headers(mrc_paths, workers=workers)))
+        # Files whose header could not be read fall back to `load_header`,
+        # which raises the appropriate error.
+        return [
+            cls(filepath, annots, load=False, header=headers.get(filepath))
+            for (filepath, annots) in zip(filepaths, annotations)
+        ]
+
+    @instrument()
+    def load(self, *, preprocess: bool = True, quantize: Optional[Union[str, np.dtype]] = None):
         """Load the tomogram data from the specified file.
     
         This method determines the file type based on its extension and loads
@@ -124,6 +294,7 @@ class TomogramFile(Tomogram):
     
         Args:
             preprocess (bool, optional): Whether to preprocess the data after loading. Defaults to True.
+            quantize (str or numpy.dtype, optional): If given, keep the preprocessed data as a `QuantizedVolume` of this integer type. See `process()`. Defaults to None.
     
         Returns:
             The loaded tomogram data.
@@ -147,10 +318,11 @@ class TomogramFile(Tomogram):
         super().__init__(data, self.annotations)
         
         if preprocess:
-            self.process()
+            self.process(quantize=quantize)
         
         return self.data
     
+    @instrument(bytes_read=lambda self: getattr(self.header, 'itemsize', 0))
     def load_header(self) -> Union[dict, np.recarray]:
         """Loads only tomogram header data from the specified file.
     
@@ -166,20 +338,143 @@ class TomogramFile(Tomogram):
         # Determine how to load based on file extension.
         root, extension = os.path.splitext(self.filepath)
         if extension in [".mrc", ".rec"]:
-            mrc = mrcfile.open(self.filepath, header_only=True)
-            self.header = mrc.header
+            self.header = read_header(self.filepath)
             # Shape seems backward because python convention is reverse of
             # FORTRAN convention. This is deliberate.
             self.shape = tuple(self.header[dim].item() for dim in ['nz', 'ny', 'nx'])
-            mrc.close()
         elif extension == ".npy":
             self.header = dict()
+            # Memory-mapping reads only the .npy header
+            self.shape = np.load(self.filepath, mmap_mode='r').shape
         else:
             raise IOError("Tomogram file must be of type .mrc, .rec, or .npy.")
 
         return self.header
+
+    def memmap(self) -> np.ndarray:
+        """Memory-map the raw tomogram data without reading it into memory.
+
+        The returned array is read-only and unprocessed. Slicing it reads only
+        the requested region from disk.
+
+        Returns:
+            A read-only memory-mapped array of the raw tomogram data.
+
+        Raises:
+            IOError: If the file type is not supported.
+        """
+        root, extension = os.path.splitext(self.filepath)
+        if extension in [".mrc", ".rec"]:
+            offset = self.header.itemsize + int(self.header['nsymbt'])
+            dtype = mrcfile.utils.data_dtype_from_header(self.header)
+            return np.memmap(self.filepath, dtype=dtype, mode='r', offset=offset, shape=self.shape)
+        elif extension == ".npy":
+            return np.load(self.filepath, mmap_mode='r')
+        else:
+            raise IOError("Tomogram file must be of type .mrc, .rec, or .npy.")
+
+    def _tile_source(self) -> np.ndarray:
+        """ 
+        Tiles are read from the loaded data if there is any. Otherwise, they
+        are read from a memory map of the raw (unprocessed) file, so that
+        covering the tomogram never requires loading it whole.
+        """
+        if self.data is not None:
+            return self.data
+        return self.memmap()
+
+    def tiles(
+            self,
+            vol_shape: Tuple[int, int, int],
+            overlap: Tuple[int, int, int] = (0, 0, 0),
+            *,
+            batch_size: int = 1
+        ) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """Iterate over batches of overlapping tiles that cover the tomogram.
+
+        If the data is not loaded, tiles are read through a memory map of the
+        file and contrast stretched like `get_slice()` does, so they match the
+        tiles of the loaded tomogram. See `Tomogram.tiles`.
+        """
+        batches = super().tiles(vol_shape, overlap, batch_size=batch_size)
+        if self.data is not None:
+            return batches
+        limits = self._stretch_limits()
+        return (
+            (bounds, TomogramFile.contrast_stretch(tiles, limits))
+            for bounds, tiles in batches
+        )
        
     
+    def get_slice(self, axis: int, index: int, *, preprocess: bool = True) -> np.ndarray:
+        """
+        Get one plane of the tomogram without loading the whole volume.
+
+        If the data is loaded, the plane is taken from it. Otherwise only the
+        plane is read from the file through a memory map; z-sections are
+        contiguous in `.mrc` files and are fastest to read. With `preprocess`,
+        the plane is contrast stretched with `intensity_limits`, if set, or
+        else with `contrast_limits`, which are estimated with
+        `estimate_contrast_limits()` if `process()` has not set them.
+
+        Args:
+            axis (int): The axis the plane is perpendicular to: 0 for a z-section, 1 for an xz-plane, 2 for a yz-plane.
+            index (int): The index of the plane along `axis`.
+            preprocess (bool, optional): Whether to contrast stretch a plane read from the file. Defaults to True.
+
+        Returns:
+            The 2-dimensional plane.
+
+        Raises:
+            IndexError: If `axis` or `index` is out of range.
+        """
+        if axis not in (0, 1, 2):
+            raise IndexError(f"Axis {axis} is out of range for a 3-dimensional tomogram.")
+        if not -self.shape[axis] <= index < self.shape[axis]:
+            raise IndexError(f"Index {index} is out of range for axis {axis} with size {self.shape[axis]}.")
+        key = tuple(index if a == axis else slice(None) for a in range(3))
+        if self.data is not None:
+            return np.asarray(self.data[key])
+
+        plane = np.array(self.memmap()[key], dtype=np.float64)
+        if preprocess:
+            plane = TomogramFile.contrast_stretch(plane, self._stretch_limits())
+        return plane
+
+    def _stretch_limits(self) -> Tuple[float, float]:
+        """ The limits to stretch data read from the file with, estimating them if needed. """
+        if self.intensity_limits is not None:
+            return tuple(self.intensity_limits)
+        if self.contrast_limits is None:
+            self.estimate_contrast_limits()
+        return self.contrast_limits
+
+    def estimate_contrast_limits(self, *, n_sections: int = 8, max_samples: int = 256) -> Tuple[float, float]:
+        """
+        Estimate the contrast stretching limits from a sparse sample of the
+        file, without loading it, and cache them in `contrast_limits`.
+
+        The 2nd and 98th percentiles are taken over `n_sections` evenly spaced
+        z-sections, each subsampled to at most `max_samples` rows and columns.
+        They approximate the limits `process()` computes from the whole volume.
+
+        Args:
+            n_sections (int, optional): The number of z-sections to sample. Defaults to 8.
+            max_samples (int, optional): The maximum number of rows and of columns sampled per section. Defaults to 256.
+
+        Returns:
+            The estimated (low, high) limits.
+        """
+        data = self.memmap()
+        nz, ny, nx = self.shape
+        y_step = max(1, ny // max_samples)
+        x_step = max(1, nx // max_samples)
+        sections = np.unique(np.linspace(0, nz - 1, min(n_sections, nz)).astype(int))
+        sample = np.stack([np.asarray(data[z, ::y_step, ::x_step], dtype=np.float64) for z in sections])
+        p2, p98 = np.percentile(sample, (2, 98))
+        self.contrast_limits = (float(p2), float(p98))
+        return self.contrast_limits
+
     def get_data(self, *, preprocess:bool = True) -> np.ndarray:
         """
         Access the data array in the tomogram. If the data has not been loaded,
@@ -191,7 +486,7 @@ class TomogramFile(Tomogram):
         Returns:
             The array data of the tomogram. In other words, returns the image.
         """
-        return self.load()
+        return self.load(preprocess=preprocess)
     
     def get_shape(self, *, preprocess:bool = True) -> np.ndarray:
         """
@@ -209,7 +504,8 @@ class TomogramFile(Tomogram):
     def get_voxel_spacing(self):
         """
         Uses `.mrc` file header information to find the voxel spacing of this
-        tomogram in Ångstroms.
+        tomogram in Ångstroms. The header read when this TomogramFile was
+        created is reused, so the file is not opened again.
 
         Returns:
             Either an integer (if the voxel spacing is isotropic, i.e., the same
@@ -219,29 +515,118 @@ class TomogramFile(Tomogram):
         Raises:
             IOError: If the file type is not `.mrc`.
         """
-        # Determine file extension.
-        root, extension = os.path.splitext(self.filepath)
-        if extension not in [".mrc", ".rec"]:
-            raise IOError("Tomogram file must be .mrc to load the voxel spacing.")
-        
-        mrc = mrcfile.open(self.filepath, mode='r', header_only=True)
-        spacing = mrc.voxel_size
+        spacing = self.voxel_spacing_array()
 
-        # Convert pesky np.recarray to a normal ndarray
-        if isinstance(spacing, np.recarray):
-            spacing = np.array([spacing.x.item(), spacing.y.item(), spacing.z.item()])
-        
-        # If the spacing is already a scalar, return it.
-        if isinstance(spacing, (int, float)):
-            return spacing
-        
-        # If it isn't, check if all the tuple values are the same.
+        # Check if all the tuple values are the same.
         # If so, just return one. If not, return the whole tuple
         if spacing[0] == spacing[1] and spacing[0] == spacing[2]:
             return spacing[0]
         else:
             return spacing
 
+    def voxel_spacing_array(self) -> np.ndarray:
+        """
+        Finds the voxel spacing of this tomogram in Ångstroms from its cached
+        `.mrc` header, always as a 3-element array.
+
+        Returns:
+            The voxel spacing in the x, y, and z directions.
+
+        Raises:
+            IOError: If the file type is not `.mrc`.
+        """
+        # Determine file extension.
+        root, extension = os.path.splitext(self.filepath)
+        if extension not in [".mrc", ".rec"]:
+            raise IOError("Tomogram file must be .mrc to load the voxel spacing.")
+
+        # Same computation as `mrcfile`'s voxel_size: cell size over sampling,
+        # stored with single precision.
+        cella = self.header['cella']
+        spacing = []
+        for dim in ['x', 'y', 'z']:
+            samples = self.header['m' + dim].item()
+            size = cella[dim].item() / samples if samples != 0 else 0
+            spacing.append(float(np.float32(size)))
+        return np.array(spacing)
+
+    def _known_voxel_spacing(self) -> Optional[np.ndarray]:
+        """ The voxel spacing from the header, or None if the file does not record one. """
+        try:
+            return self.voxel_spacing_array()
+        except IOError:
+            return None
+
+    def fingerprint(self, *, full: bool = False) -> str:
+        """
+        Get a content fingerprint of the tomogram file, to recognize identical
+        tomograms stored under different names. Fingerprints are cached.
+
+        Args:
+            full (bool, optional): Whether to hash the whole file rather than its header and sampled blocks. Defaults to False.
+
+        Returns:
+            The fingerprint as a hexadecimal string.
+        """
+        key = "full" if full else "fast"
+        if key not in self._fingerprints:
+            self._fingerprints[key] = content_fingerprint(self.filepath, full=full)
+        return self._fingerprints[key]
+
+    def get_dtype(self) -> np.dtype:
+        """
+        Finds the data type stored in the tomogram file without loading the
+        data. Note that loaded data is converted to floating point.
+
+        Returns:
+            The data type stored in the file.
+        """
+        if isinstance(self.header, np.ndarray):
+            return mrcfile.utils.data_dtype_from_header(self.header)
+        return self.memmap().dtype
+
+    def resample(self, target_spacing: float, cache_dir: str, *, block_depth: int = 16) -> 'TomogramFile':
+        """Resample the tomogram to a new voxel spacing, caching the result on disk.
+
+        The raw (unprocessed) data is read through a memory map and resampled
+        one slab at a time into a float32 `.mrc` file in `cache_dir`. If a
+        cached copy for this file and spacing already exists, it is reused.
+        Annotation points are scaled to match.
+
+        Args:
+            target_spacing (float): The new voxel spacing in Ångstroms.
+            cache_dir (str): The directory to cache resampled tomograms in.
+            block_depth (int, optional): The number of output sections computed at once. Defaults to 16.
+
+        Returns:
+            A TomogramFile for the resampled copy, with scaled annotations. Its data is not loaded.
+
+        Raises:
+            IOError: If the file type is not `.mrc`.
+            ValueError: If the file's voxel spacing is unknown (not positive), or `target_spacing` is not positive.
+        """
+        spacing = self.voxel_spacing_array()
+        if np.any(spacing <= 0):
+            raise ValueError(f"Cannot resample {self.filepath}: its voxel spacing {tuple(spacing.tolist())} is unknown.")
+        if target_spacing <= 0:
+            raise ValueError(f"The target spacing must be positive, not {target_spacing}.")
+        # Spacing is in (x, y, z) order; shapes are in (z, y, x) order.
+        out_shape = resampled_shape(self.shape, spacing[::-1] / target_spacing)
+        output = cache_path(self.filepath, cache_dir, target_spacing)
+        if not os.path.exists(output):
+            os.makedirs(cache_dir, exist_ok=True)
+            voxel_size = spacing * np.array(self.shape[::-1]) / np.array(out_shape[::-1])
+            write_resampled_mrc(self.memmap(), output, out_shape, voxel_size, block_depth=block_depth)
+
+        annotations = None
+        if self.annotations is not None:
+            annotations = []
+            for annotation in self.annotations:
+                points = np.asarray(annotation.points, dtype=np.float64).reshape(-1, 3)
+                scaled = scale_points(points, self.shape, out_shape)
+                annotations.append(Annotation(list(scaled), annotation.name, annotation.sources, annotation.scores))
+        return TomogramFile(output, annotations, load=False)
+
     @staticmethod
     def rescale(array: np.ndarray) -> np.ndarray:
         """Rescale array values to the range [0, 1].
@@ -258,6 +643,29 @@ class TomogramFile(Tomogram):
         return (array - minimum) / range_
 
     @staticmethod
+    def contrast_stretch(array: np.ndarray, contrast_limits: Tuple[float, float]) -> np.ndarray:
+        """Contrast stretch an array the way `process()` does.
+
+        Values are clipped to `contrast_limits` and mapped linearly to [0, 1],
+        or to [-1, 1] if the lower limit is negative, as
+        `skimage.exposure.rescale_intensity` does for floating point data.
+
+        Args:
+            array (numpy.ndarray): The array to stretch.
+            contrast_limits (tuple of float): The (low, high) limits.
+
+        Returns:
+            The stretched float64 array.
+        """
+        low, high = (float(limit) for limit in contrast_limits)
+        out_low = 0.0 if low >= 0 else -1.0
+        array = np.clip(np.asarray(array, dtype=np.float64), low, high)
+        if low == high:
+            return np.clip(array, out_low, 1.0)
+        return (array - low) / (high - low) * (1.0 - out_low) + out_low
+
+    @staticmethod
+    @instrument(bytes_read=file_size)
     def mrc_to_np(filepath: str) -> np.ndarray:
         """Convert a .mrc or .rec file to a numpy array.
 
@@ -271,20 +679,65 @@ class TomogramFile(Tomogram):
             data = mrc.data.astype(np.float64)
             return data
 
-    def process(self) -> np.ndarray:
+    @instrument()
+    def process(
+            self,
+            *,
+            quantize: Optional[Union[str, np.dtype]] = None,
+            block_depth: int = 16
+        ) -> Union[np.ndarray, QuantizedVolume]:
         """Process the tomogram to improve contrast using contrast stretching.
 
         This method applies contrast stretching to enhance the visibility
-        of features in the tomogram.
+        of features in the tomogram. The stretching limits are cached in
+        `contrast_limits`, so `get_slice()` can stretch planes the same way.
+        If `intensity_limits` are set, they are used instead, and the data is
+        stretched in place one slab at a time without computing percentiles.
+
+        Stretched data has far less precision than its float64 type. With
+        `quantize`, it is kept as a `QuantizedVolume` of 8- or 16-bit codes
+        instead, using an eighth or a quarter of the memory. Indexing a
+        quantized volume returns float32 values for just the indexed region.
+
+        If `bandpass` is set, the data is filtered first, block by block (see
+        `BandpassFilter.apply_blockwise`), with the file's voxel spacing unless
+        the filter has its own. Note that `intensity_limits` computed by
+        `SCTomogramSet.normalize` describe unfiltered intensities.
+
+        Args:
+            quantize (str or numpy.dtype, optional): The integer type to quantize the processed data to, uint8 or uint16. Defaults to None, which keeps float64 data.
+            block_depth (int, optional): The number of sections stretched at once with `intensity_limits`. Defaults to 16.
         
         Returns:
             The processed tomogram data.
         """
-        # Contrast stretching
-        p2, p98 = np.percentile(self.get_data(), (2, 98))
-        data_rescale = exposure.rescale_intensity(self.get_data(), in_range=(p2, p98))
+        data = self.get_data()
+        if self.bandpass is not None:
+            with span("BandpassFilter.apply_blockwise"):
+                data = self.bandpass.apply_blockwise(data, spacing=self._known_voxel_spacing())
+        if self.intensity_limits is not None:
+            # Dataset-wide limits: stretch in place, slab by slab
+            self.contrast_limits = tuple(self.intensity_limits)
+            data_rescale = np.asarray(data, dtype=np.float64)
+            with span("TomogramFile.contrast_stretch"):
+                for z0 in range(0, data_rescale.shape[0], block_depth):
+                    slab = data_rescale[z0 : z0 + block_depth]
+                    slab[...] = TomogramFile.contrast_stretch(slab, self.contrast_limits)
+        else:
+            # Contrast stretching
+            # scikit-image is slow to import, so wait until it is needed
+            from skimage import exposure
+
+            with span("np.percentile"):
+                p2, p98 = np.percentile(data, (2, 98))
+            self.contrast_limits = (float(p2), float(p98))
+            with span("exposure.rescale_intensity"):
+                data_rescale = exposure.rescale_intensity(data, in_range=(p2, p98))
+        if quantize is not None:
+            with span("QuantizedVolume.from_array"):
+                data_rescale = QuantizedVolume.from_array(data_rescale, quantize)
         self.data = data_rescale
-        return self.get_data()
+        return self.data
 
     def reload(self) -> np.ndarray:
         """Reload the tomogram data from the file.
@@ -315,7 +768,7 @@ class TomogramFile(Tomogram):
             Exception: If there are multiple AnnotationFile objects in self.annotations and they imply inconsistent shapes.
         """
         shapes = []
-        for annotation in self.annotations:
+        for annotation in self.annotations or []:
             if isinstance(annotation, AnnotationFile) and annotation.extension == ".mod":
                 shape = annotation.tomogram_shape_from_mod()
                 shapes.append(shape)
@@ -327,7 +780,7 @@ class TomogramFile(Tomogram):
         else: # Confirm that all the shapes agree
             shape = shapes[0]
             for s in shapes[1:]:
-                if s != shape:
+                if not np.array_equal(s, shape):
                     raise Exception(f"Inconsistent tomogram shapes of {shape} and {s} implied by .mod annotations.")
             return shape
 
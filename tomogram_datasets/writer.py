@@ -0,0 +1,273 @@
+"""
+This module writes volumes to `.mrc` files one slab or block at a time, so
+outputs far larger than memory can be exported.
+
+The file is memory-mapped and written under a temporary name, then moved into
+place when it is closed, so a partially written file is never mistaken for a
+finished one. Header statistics (minimum, maximum, mean and RMS deviation) are
+accumulated from the written blocks, so every voxel should be written exactly
+once.
+
+```python
+# Export a tomogram, slab by slab
+write_tomogram(tomogram, "tomogram.mrc")
+
+# Export the output of a blockwise pipeline
+with MrcWriter("prediction.mrc", shape, voxel_size=spacing) as writer:
+    for z0, slab in pipeline:
+        writer.write(slab, z0)
+```
+"""
+
+import os
+
+import mrcfile
+import numpy as np
+
+from typing import Iterable, List, Optional, Sequence, Tuple, Union
+
+class MrcWriter:
+    """Writes a 3-dimensional volume to an `.mrc` file in pieces.
+
+    Attributes:
+        filepath (str): Where the finished file is written.
+        shape (tuple of int): The shape of the volume.
+        dtype (numpy.dtype): The data type stored in the file.
+    """
+    def __init__(
+            self,
+            filepath: str,
+            shape: Sequence[int],
+            dtype: Union[str, np.dtype] = np.float32,
+            *,
+            voxel_size: Optional[Union[float, Sequence[float]]] = None,
+            lower_bounds: Sequence[int] = (0, 0, 0)
+        ):
+        """Create the file, under a temporary name, and prepare to write it.
+
+        Args:
+            filepath (str): Where to write the `.mrc` file. An existing file is replaced when the writer is closed.
+
+            shape (sequence of int): The shape of the volume.
+
+            dtype (str or numpy.dtype, optional): The data type to store, which must have an MRC mode. Defaults to float32.
+
+            voxel_size (float or sequence of float, optional): The voxel size in Ångstroms, in (x, y, z) order. Defaults to None, which leaves it unset.
+
+            lower_bounds (sequence of int, optional): The position of this volume's first voxel in a larger volume, in (z, y, x) order, e.g., a subtomogram's position in its parent. It is stored as the start indices and, scaled by the voxel size, as the origin. Defaults to (0, 0, 0).
+        """
+        self.filepath = filepath
+        self.shape = tuple(int(s) for s in shape)
+        self._temp_path = f"{filepath}.{os.getpid()}.tmp"
+        mode = mrcfile.utils.mode_from_dtype(np.dtype(dtype))
+        self._mrc = mrcfile.new_mmap(self._temp_path, self.shape, mrc_mode=mode, overwrite=True)
+        self.dtype = self._mrc.data.dtype
+
+        header = self._mrc.header
+        nz, ny, nx = (int(b) for b in lower_bounds)
+        header.nzstart, header.nystart, header.nxstart = nz, ny, nx
+        if voxel_size is not None:
+            if np.ndim(voxel_size) == 0:
+                self._mrc.voxel_size = float(voxel_size)
+            else:
+                self._mrc.voxel_size = tuple(float(v) for v in voxel_size)
+            size = self._mrc.voxel_size
+            header.origin = (nx * size.x, ny * size.y, nz * size.z)
+
+        self._count = 0
+        self._total = 0.0
+        self._total_sq = 0.0
+        self._minimum = np.inf
+        self._maximum = -np.inf
+        self._closed = False
+
+    def __repr__(self):
+        return f'<MrcWriter {self.filepath} {self.shape} {self.dtype}>'
+
+    def __enter__(self) -> 'MrcWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write_block(self, lower_bounds: Sequence[int], block: np.ndarray):
+        """Write a block of the volume.
+
+        Args:
+            lower_bounds (sequence of int): The position of the block's first voxel, in (z, y, x) order.
+            block (numpy.ndarray): The block's data, converted to the file's data type.
+        """
+        z, y, x = (int(b) for b in lower_bounds)
+        depth, height, width = block.shape
+        block = np.asarray(block).astype(self.dtype, copy=False)
+        self._mrc.data[z : z + depth, y : y + height, x : x + width] = block
+        if block.size:
+            self._count += block.size
+            self._total += float(block.sum(dtype=np.float64))
+            self._total_sq += float(np.square(block, dtype=np.float64).sum())
+            self._minimum = min(self._minimum, float(block.min()))
+            self._maximum = max(self._maximum, float(block.max()))
+
+    def write(self, slab: np.ndarray, z: int):
+        """Write a slab of whole sections.
+
+        Args:
+            slab (numpy.ndarray): The sections, converted to the file's data type.
+            z (int): The index of the slab's first section.
+        """
+        self.write_block((z, 0, 0), slab)
+
+    def close(self) -> str:
+        """Write the header statistics and move the file into place.
+
+        Returns:
+            The path of the finished file.
+        """
+        if self._closed:
+            return self.filepath
+        header = self._mrc.header
+        if self._count:
+            mean = self._total / self._count
+            header.dmin = self._minimum
+            header.dmax = self._maximum
+            header.dmean = mean
+            header.rms = np.sqrt(max(self._total_sq / self._count - mean ** 2, 0))
+        self._mrc.close()
+        self._closed = True
+        os.replace(self._temp_path, self.filepath)
+        return self.filepath
+
+    def abort(self):
+        """ Stop writing and remove the temporary file. """
+        if self._closed:
+            return
+        self._mrc.close()
+        self._closed = True
+        try:
+            os.remove(self._temp_path)
+        except OSError:
+            pass
+
+def write_slabs(
+        slabs: Iterable[Tuple[int, np.ndarray]],
+        filepath: str,
+        shape: Sequence[int],
+        dtype: Union[str, np.dtype] = np.float32,
+        *,
+        voxel_size: Optional[Union[float, Sequence[float]]] = None,
+        lower_bounds: Sequence[int] = (0, 0, 0)
+    ) -> str:
+    """Write the slabs of a blockwise pipeline to an `.mrc` file as they are produced.
+
+    Args:
+        slabs (iterable): Pairs of the index of a slab's first section and the slab itself, e.g., from `iter_resampled_slabs`.
+
+        filepath (str): Where to write the `.mrc` file.
+
+        shape (sequence of int): The shape of the whole volume.
+
+        dtype (str or numpy.dtype, optional): The data type to store. Defaults to float32.
+
+        voxel_size (float or sequence of float, optional): The voxel size in Ångstroms, in (x, y, z) order. Defaults to None.
+
+        lower_bounds (sequence of int, optional): The position of the volume in a larger one. See `MrcWriter`. Defaults to (0, 0, 0).
+
+    Returns:
+        `filepath`.
+    """
+    with MrcWriter(filepath, shape, dtype, voxel_size=voxel_size, lower_bounds=lower_bounds) as writer:
+        for z, slab in slabs:
+            writer.write(slab, z)
+    return filepath
+
+def _position(tomogram) -> Tuple[object, np.ndarray]:
+    """
+    Follow a (sub)tomogram up to its root tomogram, returning the root and the
+    position of the (sub)tomogram's first voxel in it.
+    """
+    lower_bounds = np.zeros(3, dtype=int)
+    while hasattr(tomogram, 'parent_tomogram'):
+        lower_bounds += tomogram.lower_bounds
+        tomogram = tomogram.parent_tomogram
+    return tomogram, lower_bounds
+
+def _voxel_size(tomogram) -> Optional[np.ndarray]:
+    """ The voxel size of a (sub)tomogram's root file, if it is known. """
+    root, _ = _position(tomogram)
+    try:
+        return root.voxel_spacing_array()
+    except (AttributeError, IOError):
+        return None
+
+def write_tomogram(
+        tomogram,
+        filepath: str,
+        dtype: Union[str, np.dtype] = np.float32,
+        *,
+        voxel_size: Optional[Union[float, Sequence[float]]] = None,
+        block_depth: int = 16
+    ) -> str:
+    """Write a tomogram or subtomogram to an `.mrc` file, one slab at a time.
+
+    The data is read from the tomogram's loaded data, or from a memory map of
+    an unloaded `TomogramFile`'s raw data. A subtomogram's data is contrast
+    stretched even if its file is not loaded (see `Subtomogram.data`), just as
+    loading the file would have. The voxel size defaults to that of
+    the file the tomogram comes from. A subtomogram's position in its parent
+    is stored as the file's origin.
+
+    Args:
+        tomogram (Tomogram): The tomogram to write.
+
+        filepath (str): Where to write the `.mrc` file.
+
+        dtype (str or numpy.dtype, optional): The data type to store. Defaults to float32.
+
+        voxel_size (float or sequence of float, optional): The voxel size in Ångstroms, in (x, y, z) order. Defaults to the voxel size of the tomogram's file, if known.
+
+        block_depth (int, optional): The number of sections written at once. Defaults to 16.
+
+    Returns:
+        `filepath`.
+    """
+    if voxel_size is None:
+        voxel_size = _voxel_size(tomogram)
+    _, lower_bounds = _position(tomogram)
+    source = tomogram._tile_source()
+    slabs = ((z, source[z : z + block_depth]) for z in range(0, tomogram.shape[0], block_depth))
+    return write_slabs(
+        slabs, filepath, tomogram.shape, dtype,
+        voxel_size=voxel_size, lower_bounds=lower_bounds
+    )
+
+def write_subtomograms(
+        subtomograms: Iterable,
+        filepaths: Iterable[str],
+        dtype: Union[str, np.dtype] = np.float32,
+        *,
+        voxel_size: Optional[Union[float, Sequence[float]]] = None
+    ) -> List[str]:
+    """Write a batch of subtomograms to one `.mrc` file each.
+
+    Subtomograms are written one after another, so the batch may be a
+    generator that is never held in memory at once.
+
+    Args:
+        subtomograms (iterable of Subtomogram): The subtomograms to write.
+
+        filepaths (iterable of str): Where to write each subtomogram.
+
+        dtype (str or numpy.dtype, optional): The data type to store. Defaults to float32.
+
+        voxel_size (float or sequence of float, optional): The voxel size in Ångstroms, in (x, y, z) order. Defaults to the voxel size of each subtomogram's parent file, if known.
+
+    Returns:
+        The paths of the written files.
+    """
+    written = []
+    for subtomogram, filepath in zip(subtomograms, filepaths):
+        written.append(write_tomogram(subtomogram, filepath, dtype, voxel_size=voxel_size))
+    return written